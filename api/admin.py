@@ -13,14 +13,88 @@ GNU Affero General Public License for more details.
 You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
 """
+import datetime
+import string
+import uuid
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.db.models import Q
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 
-from api.models import ClockedInShift, Contract, Report, Shift, User
+from api.admin_jobs import create_admin_job, fail_stale_admin_jobs
+from api.models import (
+    AdminJob,
+    ClockedInShift,
+    Contract,
+    LockRequest,
+    Report,
+    Shift,
+    User,
+)
+from api.utilities import suspend_report_signals
+from project_celery.tasks import run_admin_job
+
+
+def get_estimated_count(model):
+    """
+    Provide the number of rows of the models table as estimated by Postgres (updated by
+    VACUUM and ANALYZE).
+    :param model:
+    :return: int
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+            [model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    # Tables which were never analyzed report -1.
+    return max(row[0], 0) if row else 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator which uses the estimated row count for unfiltered changelists of big
+    tables, where a COUNT(*) takes longer than fetching the page itself. Filtered
+    changelists are counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, "query", None)
+        if query is not None and not query.where:
+            estimate = get_estimated_count(self.object_list.model)
+            if estimate >= settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+def filter_by_started(queryset, year=None, month=None):
+    """
+    Filter Shifts by the month and/or year they started in. Ranges on started are used
+    where possible, so the index on started applies (started__year etc. are computed
+    per row).
+    :param queryset:
+    :param year:
+    :param month:
+    :return: filtered queryset
+    """
+    if year is None:
+        return queryset.filter(started__month=month)
+    start = datetime.datetime(int(year), int(month or 1), 1)
+    end = start + (relativedelta(years=1) if month is None else relativedelta(months=1))
+    return queryset.filter(
+        started__gte=timezone.make_aware(start), started__lt=timezone.make_aware(end)
+    )
 
 
 class ShiftMonthYearFilter(admin.SimpleListFilter):
@@ -57,12 +131,9 @@ class ShiftMonthYearFilter(admin.SimpleListFilter):
         Returns the filtered queryset based on the value provided in the query string.
         """
         if self.value():
-            month = self.value()
-            year = request.GET.get("year", None)
-
-            if year:
-                return queryset.filter(started__month=month, started__year=year)
-            return queryset.filter(started__month=month)
+            return filter_by_started(
+                queryset, year=request.GET.get("year") or None, month=self.value()
+            )
         return queryset
 
 
@@ -87,16 +158,88 @@ class YearFilter(admin.SimpleListFilter):
         Returns the filtered queryset based on the value provided in the query string.
         """
         if self.value():
-            year = self.value()
-            month = request.GET.get("month", None)
-
-            if month:
-                return queryset.filter(started__month=month, started__year=year)
-            return queryset.filter(started__year=year)
+            return filter_by_started(
+                queryset, year=self.value(), month=request.GET.get("month") or None
+            )
         return queryset
 
 
-class UserAdmin(BaseUserAdmin):
+def get_uuid_range(search_term):
+    """
+    Interpret a search term as UUID or as prefix of a UUID. A prefix needs at least 8
+    hex digits and a dash, or at least 12 hex digits, so names consisting only of hex
+    letters are still looked up as names.
+    :param search_term:
+    :return: Tuple of the lowest and highest UUID starting with the term or None
+    """
+    term = search_term.strip()
+    digits = term.replace("-", "").lower()
+    if not 8 <= len(digits) <= 32 or digits.strip(string.hexdigits):
+        return None
+    if "-" not in term and len(digits) < 12:
+        return None
+    return uuid.UUID(digits.ljust(32, "0")), uuid.UUID(digits.ljust(32, "f"))
+
+
+class UUIDSearchMixin:
+    """
+    Search terms which are (the prefix of) a UUID are looked up as range on the indexed
+    uuid_search_fields, without matching the search_fields. Other terms are matched
+    against the search_fields, the text columns of User are backed by trigram indexes.
+    """
+
+    uuid_search_fields = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        uuid_range = get_uuid_range(search_term)
+        if uuid_range is None or not self.uuid_search_fields:
+            return super().get_search_results(request, queryset, search_term)
+        condition = Q()
+        for field in self.uuid_search_fields:
+            condition |= Q(**{f"{field}__range": uuid_range})
+        return queryset.filter(condition), False
+
+
+def start_admin_job(modeladmin, request, action, queryset):
+    """
+    Create an AdminJob for the selected objects and run it in a Celery task once the
+    request's transaction is committed.
+    :param modeladmin:
+    :param request:
+    :param action: one of AdminJob.ACTION_CHOICES
+    :param queryset: selected objects
+    :return: AdminJob
+    """
+    job = create_admin_job(action, queryset, user=request.user)
+    transaction.on_commit(lambda: run_admin_job.delay(str(job.pk)))
+    url = reverse("admin:api_adminjob_change", args=[job.pk])
+    modeladmin.message_user(
+        request,
+        format_html(
+            'Started <a href="{}">{}</a> for {} objects in the background.',
+            url,
+            job.get_action_display(),
+            job.total,
+        ),
+    )
+    return job
+
+
+class SuspendReportSignalsMixin:
+    """
+    Delete objects without updating the Reports once per deleted Shift.
+    """
+
+    def delete_model(self, request, obj):
+        with suspend_report_signals():
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with suspend_report_signals():
+            super().delete_queryset(request, queryset)
+
+
+class UserAdmin(UUIDSearchMixin, SuspendReportSignalsMixin, BaseUserAdmin):
     list_display = (
         "id",
         "email",
@@ -116,12 +259,18 @@ class UserAdmin(BaseUserAdmin):
     )
     ordering = ("-date_joined",)
     readonly_fields = ("date_joined",)
+    uuid_search_fields = ("id",)
 
 
 admin.site.register(User, UserAdmin)
 
 
-class ContractAdmin(admin.ModelAdmin):
+@admin.action(description="Recompute reports of selected contracts")
+def recompute_reports_action(modeladmin, request, queryset):
+    start_admin_job(modeladmin, request, AdminJob.RECOMPUTE_REPORTS, queryset)
+
+
+class ContractAdmin(UUIDSearchMixin, SuspendReportSignalsMixin, admin.ModelAdmin):
     list_display = (
         "id",
         "link_user",
@@ -132,39 +281,28 @@ class ContractAdmin(admin.ModelAdmin):
         "modified_at",
     )
     list_per_page = 100
+    list_select_related = ("user",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     ordering = ("-modified_at",)
-    search_fields = ("user__first_name", "user__last_name", "user__id", "user__email")
+    search_fields = ("user__first_name", "user__last_name", "user__email")
+    uuid_search_fields = ("id", "reference", "user__id")
     list_filter = (
         "start_date",
         "end_date",
     )
+    actions = [recompute_reports_action]
 
     def link_user(self, obj):
         """
-        Display linked user's full name (or username) for Contract.
-        Contract.user may be a UUID (not a FK), so resolve to User if needed.
+        Creates a link to the corresponding User object to display in the columns.
+        :param obj:
+        :return: string
         """
-        try:
-            user_ref = obj.user
-            # If this is a raw UUID/string/UUIDField, look up the User record
-            if not hasattr(user_ref, "get_full_name"):
-                user_obj = User.objects.filter(pk=user_ref).first()
-            else:
-                user_obj = user_ref
-
-            if user_obj:
-                label = (
-                    user_obj.get_full_name()
-                    or getattr(user_obj, "username", None)
-                    or str(user_obj.pk)
-                )
-                url = reverse("admin:api_user_change", args=[user_obj.pk])
-                return format_html('<a href="{}">{}</a>', url, label)
-
-            # fallback: show the raw value
-            return str(user_ref)
-        except Exception:
-            return str(getattr(obj, "user", ""))
+        user = obj.user
+        label = user.get_full_name() or getattr(user, "username", None) or str(user.pk)
+        url = reverse("admin:api_user_change", args=[user.pk])
+        return format_html('<a href="{}">{}</a>', url, label)
 
     link_user.short_description = "user"
 
@@ -174,20 +312,18 @@ admin.site.register(Contract, ContractAdmin)
 
 @admin.action(description="Unlock selected shifts")
 def unlock_shifts_action(modeladmin, request, queryset):
-    queryset.update(locked=False)
+    start_admin_job(modeladmin, request, AdminJob.UNLOCK_SHIFTS, queryset)
 
 
-class ShiftAdmin(admin.ModelAdmin):
+class ShiftAdmin(UUIDSearchMixin, SuspendReportSignalsMixin, admin.ModelAdmin):
     list_display = ("id", "link_user", "started", "stopped", "locked", "modified_at")
     list_per_page = 200
+    list_select_related = ("user",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     ordering = ("-modified_at",)
-    search_fields = (
-        "user__id",
-        "contract__id",
-        "contract__reference",
-        "user__first_name",
-        "user__last_name",
-    )
+    search_fields = ("user__first_name", "user__last_name")
+    uuid_search_fields = ("id", "user__id", "contract__id", "contract__reference")
     list_filter = (
         ShiftMonthYearFilter,
         YearFilter,
@@ -214,6 +350,7 @@ admin.site.register(Shift, ShiftAdmin)
 
 class ClockedInShiftAdmin(ShiftAdmin):
     list_display = ("id", "link_user", "link_contract", "created_at", "duration")
+    list_select_related = ("user", "contract")
 
     def link_contract(self, obj):
         """
@@ -242,7 +379,12 @@ class ClockedInShiftAdmin(ShiftAdmin):
 admin.site.register(ClockedInShift, ClockedInShiftAdmin)
 
 
-class ReportAdmin(admin.ModelAdmin):
+@admin.action(description="Invalidate export snapshots of selected reports")
+def invalidate_snapshots_action(modeladmin, request, queryset):
+    start_admin_job(modeladmin, request, AdminJob.INVALIDATE_SNAPSHOTS, queryset)
+
+
+class ReportAdmin(UUIDSearchMixin, admin.ModelAdmin):
     list_display = (
         "id",
         "link_user",
@@ -251,8 +393,13 @@ class ReportAdmin(admin.ModelAdmin):
         "created_at",
         "modified_at",
     )
-    search_fields = ("user", "contract")
+    search_fields = ("user__first_name", "user__last_name", "user__email")
+    uuid_search_fields = ("id", "user__id", "contract__id")
     list_filter = ("month_year",)
+    list_select_related = ("user", "contract")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = [invalidate_snapshots_action]
 
     def format_date(self, obj):
         date = obj.month_year
@@ -286,3 +433,93 @@ class ReportAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Report, ReportAdmin)
+
+
+@admin.action(description="Retry delivery of selected lock requests")
+def retry_lock_requests_action(modeladmin, request, queryset):
+    queryset.exclude(status=LockRequest.DELIVERED).update(
+        status=LockRequest.PENDING, attempts=0, next_attempt_at=timezone.now()
+    )
+
+
+class LockRequestAdmin(ReportAdmin):
+    list_display = (
+        "id",
+        "link_user",
+        "format_date",
+        "link_contract",
+        "status",
+        "attempts",
+        "created_at",
+        "delivered_at",
+    )
+    search_fields = ()
+    list_filter = ("status", "month_year")
+    readonly_fields = ("payload",)
+    actions = [retry_lock_requests_action]
+
+
+admin.site.register(LockRequest, LockRequestAdmin)
+
+
+@admin.action(description="Retry selected failed jobs")
+def retry_admin_jobs_action(modeladmin, request, queryset):
+    """
+    Run the failed jobs of the selection again, including running jobs whose worker
+    stopped reporting progress. They continue after their last finished chunk.
+    """
+    fail_stale_admin_jobs(queryset)
+    job_ids = [
+        str(pk)
+        for pk in queryset.filter(status=AdminJob.FAILED).values_list("pk", flat=True)
+    ]
+    for job_id in job_ids:
+        transaction.on_commit(lambda job_id=job_id: run_admin_job.delay(job_id))
+    modeladmin.message_user(request, f"Retrying {len(job_ids)} jobs in the background.")
+
+
+class AdminJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "action",
+        "status",
+        "progress",
+        "created_by",
+        "created_at",
+        "finished_at",
+    )
+    list_filter = ("action", "status")
+    list_select_related = ("created_by",)
+    actions = [retry_admin_jobs_action]
+    fields = (
+        "action",
+        "status",
+        "progress",
+        "error",
+        "created_by",
+        "created_at",
+        "heartbeat_at",
+        "finished_at",
+    )
+    readonly_fields = fields
+
+    def progress(self, obj):
+        """
+        Processed and total number of objects of the job.
+        :param obj:
+        :return: string
+        """
+        if not obj.total:
+            return "0/0"
+        return f"{obj.processed}/{obj.total} ({obj.processed * 100 // obj.total}%)"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    progress.short_description = "progress"
+
+
+admin.site.register(AdminJob, AdminJobAdmin)
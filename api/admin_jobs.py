@@ -0,0 +1,136 @@
+"""
+Clock - Master your timesheets
+Copyright (C) 2023  Johann Wolfgang Goethe-Universität Frankfurt am Main
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU Affero General Public License as published by the Free Software Foundation, either version 3 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
+"""
+import datetime
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import AdminJob, Contract, ExportSnapshot, Shift
+from api.utilities import recompute_reports, unlock_shifts
+
+LOGGER = logging.getLogger("admin_jobs")
+
+
+def unlock_shifts_chunk(object_ids):
+    unlock_shifts(Shift.objects.filter(pk__in=object_ids))
+
+
+def recompute_reports_chunk(object_ids):
+    recompute_reports(Contract.objects.filter(pk__in=object_ids))
+
+
+def invalidate_snapshots_chunk(object_ids):
+    ExportSnapshot.objects.filter(report_id__in=object_ids).delete()
+
+
+CHUNK_HANDLERS = {
+    AdminJob.UNLOCK_SHIFTS: unlock_shifts_chunk,
+    AdminJob.RECOMPUTE_REPORTS: recompute_reports_chunk,
+    AdminJob.INVALIDATE_SNAPSHOTS: invalidate_snapshots_chunk,
+}
+
+
+def create_admin_job(action, queryset, user=None):
+    """
+    Store the primary keys of the selected objects, so the job operates on the
+    selection even if the rows change until it runs.
+    :param action: one of AdminJob.ACTION_CHOICES
+    :param queryset: selected objects
+    :param user: User who started the action
+    :return: AdminJob
+    """
+    object_ids = [
+        str(pk) for pk in queryset.order_by("pk").values_list("pk", flat=True)
+    ]
+    return AdminJob.objects.create(
+        action=action, object_ids=object_ids, total=len(object_ids), created_by=user
+    )
+
+
+def claim_admin_job(job_id):
+    """
+    Mark a pending or failed AdminJob as running. The conditional update makes sure only
+    one worker runs the job at a time.
+    :param job_id:
+    :return: True if the job was claimed
+    """
+    return bool(
+        AdminJob.objects.filter(
+            pk=job_id, status__in=[AdminJob.PENDING, AdminJob.FAILED]
+        ).update(status=AdminJob.RUNNING, error="", heartbeat_at=timezone.now())
+    )
+
+
+def fail_stale_admin_jobs(queryset):
+    """
+    Mark the running jobs of the queryset as failed, whose worker did not report
+    progress for ADMIN_JOB_STALE_MINUTES, so they can be claimed again.
+    :param queryset: AdminJob queryset
+    :return: number of failed jobs
+    """
+    stale = timezone.now() - datetime.timedelta(
+        minutes=settings.ADMIN_JOB_STALE_MINUTES
+    )
+    return queryset.filter(status=AdminJob.RUNNING, heartbeat_at__lt=stale).update(
+        status=AdminJob.FAILED, error="The worker stopped responding."
+    )
+
+
+def run_admin_job(job_id):
+    """
+    Run the AdminJob in chunks of ADMIN_JOB_CHUNK_SIZE objects, each in its own
+    transaction. The progress is stored after every chunk, a failed job continues with
+    the first unfinished chunk when it is run again. Jobs which are done or already
+    running are skipped.
+    :param job_id:
+    :return: AdminJob
+    """
+    if not claim_admin_job(job_id):
+        LOGGER.info(f"AdminJob {job_id} is done or already running, skipping.")
+        return AdminJob.objects.get(pk=job_id)
+    job = AdminJob.objects.get(pk=job_id)
+    handler = CHUNK_HANDLERS[job.action]
+    chunk_size = settings.ADMIN_JOB_CHUNK_SIZE
+
+    processed = job.processed
+    try:
+        while processed < job.total:
+            started = time.perf_counter()
+            chunk = job.object_ids[processed : processed + chunk_size]
+            with transaction.atomic():
+                handler(chunk)
+                processed += len(chunk)
+                AdminJob.objects.filter(pk=job.pk).update(
+                    processed=processed, heartbeat_at=timezone.now()
+                )
+            LOGGER.info(
+                f"AdminJob {job.pk} ({job.action}): {processed}/{job.total} objects "
+                f"processed, chunk took {time.perf_counter() - started:.3f}s."
+            )
+    except Exception as error:
+        LOGGER.exception(f"AdminJob {job.pk} ({job.action}) failed.")
+        AdminJob.objects.filter(pk=job.pk).update(
+            status=AdminJob.FAILED, error=str(error), finished_at=timezone.now()
+        )
+        raise
+    AdminJob.objects.filter(pk=job.pk).update(
+        status=AdminJob.DONE, finished_at=timezone.now()
+    )
+    job.refresh_from_db()
+    return job
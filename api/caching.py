@@ -0,0 +1,159 @@
+"""
+Clock - Master your timesheets
+Copyright (C) 2023  Johann Wolfgang Goethe-Universität Frankfurt am Main
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU Affero General Public License as published by the Free Software Foundation, either version 3 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
+from django.utils.translation import get_language
+from rest_framework.response import Response
+
+# Namespace of the cached time-vault results of the supervisor reporting.
+SUPERVISOR_REPORTS_NAMESPACE = "supervisor_reports"
+
+
+def get_generation(namespace):
+    """
+    Provide the current generation of a cache namespace.
+
+    The generation is the timestamp of the last invalidation. It is part of every
+    cache key of the namespace, so bumping it invalidates all cached entries at once.
+    :param namespace:
+    :return: float
+    """
+    return cache.get_or_set(f"{namespace}:generation", time.time, timeout=None)
+
+
+def invalidate_namespace(namespace):
+    cache.set(f"{namespace}:generation", time.time(), timeout=None)
+
+
+def compute_etag(data):
+    return hashlib.sha1(
+        json.dumps(data, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def not_modified_or(request, response, etag):
+    """
+    Answer with 304 if the client's If-None-Match matches the current representation,
+    otherwise return the given response. Both carry the ETag header.
+
+    No Last-Modified is sent: the generation is local to the process with a per-process
+    cache, and the served rows have no modification date to derive it from.
+    :param request:
+    :param response:
+    :param etag:
+    :return: Response
+    """
+    response = get_conditional_response(request, etag=quote_etag(etag)) or response
+    response["ETag"] = quote_etag(etag)
+    return response
+
+
+class CachedListMixin:
+    """
+    Cache the serialized data of the list endpoint of a ViewSet in the Django cache.
+
+    The entries live in `cache_namespace` which is invalidated by signal receivers
+    whenever one of the underlying models is saved or deleted (see invalidate_namespace).
+    Every response carries an ETag derived from the data and requests with a matching
+    If-None-Match are answered with 304 without serializing the data again.
+    """
+
+    cache_namespace = None
+
+    def get_cache_key_parts(self):
+        """
+        Hook to add further parts, the cached data depends on, to the cache key.
+        :return: List
+        """
+        return [get_language()]
+
+    def get_cache_key(self, generation):
+        parts = [self.cache_namespace, "list", str(generation)]
+        parts += [str(part) for part in self.get_cache_key_parts()]
+        return ":".join(parts)
+
+    def list(self, request, *args, **kwargs):
+        generation = get_generation(self.cache_namespace)
+        key = self.get_cache_key(generation)
+        entry = cache.get(key)
+        if entry is None:
+            data = super(CachedListMixin, self).list(request, *args, **kwargs).data
+            entry = {"data": data, "etag": compute_etag(data)}
+            cache.set(key, entry, settings.API_CACHE_TIMEOUT)
+
+        return not_modified_or(request, Response(entry["data"]), entry["etag"])
+
+
+class VersionStampMixin:
+    """
+    Answer conditional GET requests on list endpoints with 304 before any serialization.
+
+    The version stamp of a queryset consists of its row count and the maximum of
+    every field in `version_stamp_fields`, computed in a single aggregate query.
+    The count covers deletions, the maxima cover creations and updates. The ETag is
+    derived from the stamp, the requesting user and the full path (incl. filters).
+    """
+
+    version_stamp_fields = ("modified_at",)
+
+    def get_version_stamp(self, queryset):
+        aggregates = {"count": Count("pk")}
+        aggregates.update(
+            {
+                f"max_{index}": Max(field)
+                for index, field in enumerate(self.version_stamp_fields)
+            }
+        )
+        return queryset.order_by().aggregate(**aggregates)
+
+    def get_version_etag(self, queryset):
+        request = self.request
+        return compute_etag(
+            [
+                request.user.pk,
+                request.headers.get("checkoutuser", ""),
+                request.get_full_path(),
+                self.get_version_stamp(queryset),
+            ]
+        )
+
+    def conditional_response(self, queryset, get_response):
+        """
+        Return 304 if the client's If-None-Match matches the current version of the
+        queryset, otherwise the response built by `get_response`.
+        :param queryset:
+        :param get_response: Function without arguments
+        :return: Response
+        """
+        etag = quote_etag(self.get_version_etag(queryset))
+        response = get_conditional_response(self.request, etag=etag) or get_response()
+        response["ETag"] = etag
+        patch_vary_headers(response, ("Authorization", "checkoutuser"))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.conditional_response(
+            queryset,
+            lambda: super(VersionStampMixin, self).list(request, *args, **kwargs),
+        )
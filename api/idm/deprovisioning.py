@@ -21,19 +21,30 @@ import json
 import logging
 import time
 
+import ijson
 import requests
 from dateutil.relativedelta import relativedelta
 from django.db import transaction
+from more_itertools import chunked
 
-from api.models import User
+from api.metrics import EXTERNAL_CALL_DURATION
+from api.models import ClockedInShift, Contract, LockRequest, Report, Shift, User
+from api.utilities import suspend_report_signals
 from config.settings.common import env
 
 LOGGER = logging.getLogger("deprovisioning")
 
 
+class IDMResponseError(Exception):
+    """
+    The IDM answered without the list of accounts, e.g. with a JSON-RPC error.
+    """
+
+
 class Deprovisioner:
     model = User
     REQUEST_OBJ_COUNT = 500
+    DELETE_CHUNK_SIZE = 500
     identifier_field = "username"
     deprovision_cond_field = "marked_for_deletion"
 
@@ -109,17 +120,55 @@ class Deprovisioner:
         2. Prepare data to call the IDM
         3. Handle the response
             3.1 Mark model instances that full-fill the deprovisioning condition for future deletion
+
+        The response body is parsed while it is downloaded, so the amount of accounts
+        returned by the IDM does not affect the memory used by the run.
         """
         LOGGER.info("Deprovisioning started.")
         self.set_current_time()
         self.pre_deprovision()
         body = self.prepare_request_body()
         headers = self.create_headers(self.create_hmac(body))
-        response = requests.post(
-            self.idm_api_url, data=body, headers=headers, verify=True
+        with EXTERNAL_CALL_DURATION.labels(service="idm").time():
+            response = requests.post(
+                self.idm_api_url, data=body, headers=headers, verify=True, stream=True
+            )
+        with response:
+            if not response.ok:
+                LOGGER.error(
+                    f"The IDM answered with status {response.status_code}, "
+                    "deprovisioning aborted."
+                )
+                response.raise_for_status()
+            self.handle_response(self.parse_response(response))
+
+    def parse_response(self, response):
+        """
+        Lazily yield the account objects contained in the streamed response.
+        :param response: streamed response of the IDM
+        :return: Iterator[Dict]
+        :raises IDMResponseError: once the response is consumed, if it contained no
+            list of accounts
+        """
+        # Let urllib3 undo a possible Content-Encoding before the raw stream is parsed.
+        response.raw.decode_content = True
+        has_data = False
+
+        def track_data(events):
+            nonlocal has_data
+            for prefix, event, value in events:
+                if prefix == "result.data" and event == "start_array":
+                    has_data = True
+                yield prefix, event, value
+
+        yield from ijson.items(
+            track_data(ijson.parse(response.raw)), "result.data.item"
         )
-        parsed_content = json.loads(response.content)
-        self.handle_response(parsed_content)
+        if not has_data:
+            LOGGER.error(
+                "The IDM response contains no accounts, deprovisioning aborted."
+            )
+            raise IDMResponseError("The IDM response contains no result.data.")
 
     def pre_deprovision(self):
         """
@@ -131,27 +180,73 @@ class Deprovisioner:
     def delete_marked_objects(self):
         """
         Delete all model instances where the deprovision_cond_field equals True.
+
+        The instances are deleted in chunks of DELETE_CHUNK_SIZE, each in its own
+        transaction and without the per-Shift receivers, since every Report they would
+        update is deleted as well.
         """
         LOGGER.info("Delete marked objects called.")
-        deleted_count = (
-            self.get_queryset().filter(**{self.deprovision_cond_field: True}).delete()
+        marked_ids = list(
+            self.get_queryset()
+            .filter(**{self.deprovision_cond_field: True})
+            .values_list("pk", flat=True)
         )
+        deleted_count = 0
+        for chunk in chunked(marked_ids, self.DELETE_CHUNK_SIZE):
+            started = time.perf_counter()
+            with transaction.atomic(), suspend_report_signals(recompute=False):
+                self.delete_related_objects(chunk)
+                chunk_count, _ = self.model.objects.filter(pk__in=chunk).delete()
+            deleted_count += len(chunk)
+            LOGGER.info(
+                f"{deleted_count}/{len(marked_ids)} User objects deleted "
+                f"({chunk_count} rows in {time.perf_counter() - started:.3f}s)."
+            )
         LOGGER.info(f"{deleted_count} User objects deleted.")
 
+    def delete_related_objects(self, user_ids):
+        """
+        Delete the data of the given users children first, so deleting the users does
+        not collect all of it at once.
+        :param user_ids: primary keys of the users to delete
+        """
+        shifts = Shift.objects.filter(user_id__in=user_ids)
+        while True:
+            shift_ids = list(
+                shifts.values_list("pk", flat=True)[: self.DELETE_CHUNK_SIZE]
+            )
+            if not shift_ids:
+                break
+            Shift.objects.filter(pk__in=shift_ids).delete()
+        for model in (ClockedInShift, LockRequest, Report, Contract):
+            model.objects.filter(user_id__in=user_ids).delete()
+
     def mark_for_deletion(self, response_body):
         """
         Update the field value of identifier_field for each model instance.
-        :param: request_body: JSON parsed response body
-        :type: Array[Dict]
+
+        The accounts are processed in chunks of REQUEST_OBJ_COUNT, each chunk is updated
+        in its own transaction.
+        :param: request_body: JSON parsed response body or an iterable of its data objects
+        :type: Dict or Iterable[Dict]
         """
         LOGGER.info("mark_for_deletion called")
-        with transaction.atomic():
-            data = response_body.get("result").get("data")
-            logins = [obj["hrzlogin"] for obj in data]
-            updated_cnt = self.model.objects.filter(username__in=logins).update(
-                **{self.deprovision_cond_field: True}
-            )
+        if isinstance(response_body, dict):
+            response_body = response_body.get("result").get("data")
+        logins = (obj["hrzlogin"] for obj in response_body)
+        for chunk_number, chunk in enumerate(
+            chunked(logins, self.REQUEST_OBJ_COUNT), start=1
+        ):
+            started = time.perf_counter()
+            with transaction.atomic():
+                updated_cnt = self.model.objects.filter(username__in=chunk).update(
+                    **{self.deprovision_cond_field: True}
+                )
             self.update_counter(updated_cnt)
+            LOGGER.info(
+                f"Chunk {chunk_number}: {updated_cnt} of {len(chunk)} Objects updated "
+                f"in {time.perf_counter() - started:.3f}s."
+            )
         LOGGER.info(f"{self.update_cnt} Objects updated.")
         self.reset_update_cnt()
 
@@ -0,0 +1,82 @@
+"""
+Clock - Master your timesheets
+Copyright (C) 2023  Johann Wolfgang Goethe-Universität Frankfurt am Main
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU Affero General Public License as published by the Free Software Foundation, either version 3 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
+"""
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current_metrics = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    """
+    Collect the SQL statistics and the durations of named sections of one request.
+
+    An instance is activated by the RequestTimingMiddleware and is used as database
+    execute_wrapper to count the queries and sum up their duration.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.sections = defaultdict(float)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+    def add_section(self, name, duration):
+        self.sections[name] += duration
+
+
+def get_current_metrics():
+    return _current_metrics.get()
+
+
+@contextmanager
+def activate_metrics(metrics):
+    token = _current_metrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current_metrics.reset(token)
+
+
+@contextmanager
+def timed_section(name, histogram=None):
+    """
+    Measure the duration of the enclosed block and attribute it to the section `name`
+    of the current request. Outside of an instrumented request this is a no-op
+    apart from the time measurement.
+    If a Prometheus histogram is given, the duration is observed there as well.
+    :param name:
+    :param histogram:
+    :return:
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        if histogram is not None:
+            histogram.observe(duration)
+        metrics = get_current_metrics()
+        if metrics is not None:
+            metrics.add_section(name, duration)
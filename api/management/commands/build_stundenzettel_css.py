@@ -0,0 +1,158 @@
+"""
+Clock - Master your timesheets
+Copyright (C) 2023  Johann Wolfgang Goethe-Universität Frankfurt am Main
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU Affero General Public License as published by the Free Software Foundation, either version 3 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
+"""
+import os
+import re
+
+import tinycss2
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+TEMPLATE = "templates/api/stundenzettel.html"
+SOURCES = ("static/api/css/stundenzettel.base.css", "static/api/css/tailwind.out.css")
+OUTPUT = "static/api/css/stundenzettel.css"
+
+# At-rules containing rules themselves, which are purged recursively.
+NESTED_AT_RULES = ("media", "supports")
+COMBINATORS = (",", ">", "+", "~")
+
+
+def get_used_names(html):
+    """
+    Collect the element names and classes used in the template.
+    :param html: template source
+    :return: tuple (set of element names, set of classes)
+    """
+    tags = {tag.lower() for tag in re.findall(r"<([a-zA-Z][a-zA-Z0-9]*)", html)}
+    classes = set()
+    for value in re.findall(r'class="([^"]*)"', html):
+        classes.update(value.split())
+    return tags, classes
+
+
+def selector_is_used(tokens, tags, classes):
+    """
+    A selector is used if every element name and class it requires occurs in the
+    template. Selectors without any of them, e.g. `*` or `::before`, are kept.
+    """
+    previous = None
+    for token in tokens:
+        if token.type == "ident":
+            if previous is None or previous.type == "whitespace":
+                is_tag = True
+            else:
+                is_tag = previous.type == "literal" and previous.value in COMBINATORS
+            if is_tag and token.value.lower() not in tags:
+                return False
+            if (
+                previous is not None
+                and previous.type == "literal"
+                and previous.value == "."
+                and token.value not in classes
+            ):
+                return False
+        if token.type != "comment":
+            previous = token
+    return True
+
+
+def split_selectors(prelude):
+    selectors = [[]]
+    for token in prelude:
+        if token.type == "literal" and token.value == ",":
+            selectors.append([])
+        else:
+            selectors[-1].append(token)
+    return selectors
+
+
+def purge_rules(rules, tags, classes):
+    """
+    Drop every rule (or the part of its selector list) which matches nothing in the
+    template and serialize the remaining rules.
+    :return: List[str]
+    """
+    css = []
+    for rule in rules:
+        if rule.type == "qualified-rule":
+            selectors = [
+                tinycss2.serialize(selector).strip()
+                for selector in split_selectors(rule.prelude)
+                if selector_is_used(selector, tags, classes)
+            ]
+            if selectors:
+                css.append(
+                    "{} {{{}}}".format(
+                        ", ".join(selectors), tinycss2.serialize(rule.content)
+                    )
+                )
+        elif rule.type == "at-rule" and rule.lower_at_keyword in NESTED_AT_RULES:
+            nested = purge_rules(
+                tinycss2.parse_rule_list(
+                    rule.content, skip_comments=True, skip_whitespace=True
+                ),
+                tags,
+                classes,
+            )
+            if nested:
+                css.append(
+                    "@{}{} {{\n{}\n}}".format(
+                        rule.at_keyword,
+                        tinycss2.serialize(rule.prelude).rstrip(),
+                        "\n".join(nested),
+                    )
+                )
+        elif rule.type == "at-rule":
+            css.append(tinycss2.serialize([rule]))
+    return css
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds the stylesheet of the Stundenzettel PDF, containing only the rules "
+        "of the Tailwind CSS the template actually uses."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            help="Write the stylesheet to this path instead of {}.".format(OUTPUT),
+        )
+
+    def handle(self, *args, **options):
+        app_path = apps.get_app_config("api").path
+        with open(os.path.join(app_path, TEMPLATE), encoding="utf-8") as template:
+            tags, classes = get_used_names(template.read())
+
+        css = []
+        for source in SOURCES:
+            with open(os.path.join(app_path, source), encoding="utf-8") as stylesheet:
+                rules = tinycss2.parse_stylesheet(
+                    stylesheet.read(), skip_comments=True, skip_whitespace=True
+                )
+            css += purge_rules(rules, tags, classes)
+
+        output_path = options["output"] or os.path.join(app_path, OUTPUT)
+        with open(output_path, "w", encoding="utf-8") as output:
+            output.write(
+                "/* Generated by `manage.py build_stundenzettel_css`, do not edit. */\n"
+            )
+            output.write("\n".join(css) + "\n")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "{} rules were written to {}.".format(len(css), output_path)
+            )
+        )
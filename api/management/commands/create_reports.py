@@ -15,51 +15,118 @@ along with this program.  If not, see <https://github.com/ClockGU/clock-backend/
 """
 import datetime
 
-from dateutil.relativedelta import relativedelta
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from more_itertools import chunked
 
-from api.models import Report, User
+from api.models import Contract, Report, User
+from api.utilities import update_reports
+
+MISSING_REPORTS_SQL = """
+SELECT contract.id, contract.user_id, month.month_year::date
+FROM {contract_table} AS contract
+JOIN {user_table} AS clock_user ON clock_user.id = contract.user_id
+CROSS JOIN LATERAL generate_series(
+    GREATEST(date_trunc('month', contract.start_date::timestamp), %(start)s::timestamp),
+    LEAST(contract.end_date::timestamp, %(end)s::timestamp),
+    interval '1 month'
+) AS month(month_year)
+WHERE clock_user.is_active
+    AND NOT clock_user.is_staff
+    AND contract.start_date <= %(end)s
+    AND contract.end_date >= %(start)s
+    AND NOT EXISTS (
+        SELECT 1 FROM {report_table} AS report
+        WHERE report.contract_id = contract.id
+            AND report.month_year = month.month_year::date
+    )
+ORDER BY contract.id, month.month_year
+"""
+
+
+def get_missing_reports(start, end):
+    """
+    Find the months between start and end in which a Contract of an active, non-staff
+    User is running but has no Report, in one query.
+    :param start: first day of the first month
+    :param end: first day of the last month
+    :return: List of (contract_id, user_id, month_year) tuples
+    """
+    sql = MISSING_REPORTS_SQL.format(
+        contract_table=Contract._meta.db_table,
+        user_table=User._meta.db_table,
+        report_table=Report._meta.db_table,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {"start": start, "end": end})
+        return cursor.fetchall()
 
 
 class Command(BaseCommand):
-    help = "Create missing Reports for all Users for the given month and year."
+    help = (
+        "Create missing Reports for all Users for the given month and year, or for all "
+        "months up to --until, and recompute the Reports of the affected Contracts."
+    )
+    CREATE_BATCH_SIZE = 1000
+    RECOMPUTE_CHUNK_SIZE = 100
 
     def add_arguments(self, parser):
         parser.add_argument("month", type=int)
 
         parser.add_argument("year", type=int)
+        parser.add_argument(
+            "--until",
+            nargs=2,
+            type=int,
+            metavar=("MONTH", "YEAR"),
+            help="Create the missing Reports of all months up to this month.",
+        )
 
     def handle(self, *args, **options):
-        report_cnt = 0
-        date = datetime.date(options["year"], options["month"], 1)
+        start = datetime.date(options["year"], options["month"], 1)
+        end = start
+        if options["until"]:
+            end = datetime.date(options["until"][1], options["until"][0], 1)
 
-        if date >= datetime.date.today():
+        if end < start:
+            raise CommandError("The end of the range is before its start.")
+        if end >= datetime.date.today():
             raise CommandError("It's not allowed to create Reports for future months.")
 
-        for user in User.objects.filter(is_active=True, is_staff=False):
-            for contract in user.contracts.filter(
-                start_date__lt=date, end_date__gt=date
-            ).exclude(reports__month_year=date):
-                last_report = Report.objects.get(
-                    contract=contract, month_year=date - relativedelta(months=1)
-                )
-                carry_over_worktime = datetime.timedelta(0)
-
-                if last_report:
-                    carry_over_worktime = last_report.worktime - datetime.timedelta(
-                        minutes=contract.minutes
+        missing_reports = get_missing_reports(start, end)
+        first_months = {}
+        for batch in chunked(missing_reports, self.CREATE_BATCH_SIZE):
+            with transaction.atomic():
+                Report.objects.bulk_create(
+                    Report(
+                        month_year=month_year,
+                        worktime=datetime.timedelta(0),
+                        vacation_time=datetime.timedelta(0),
+                        contract_id=contract_id,
+                        user_id=user_id,
+                        created_by_id=user_id,
+                        modified_by_id=user_id,
                     )
-
-                Report.objects.create(
-                    month_year=date,
-                    worktime=carry_over_worktime,
-                    contract=contract,
-                    user=user,
-                    created_by=user,
-                    modified_by=user,
+                    for contract_id, user_id, month_year in batch
                 )
-                report_cnt += 1
+            for contract_id, _, month_year in batch:
+                first_months.setdefault(contract_id, month_year)
+
+        # The created Reports may cover Shifts which were not counted so far, and the
+        # carryover of every following month depends on them.
+        for chunk in chunked(first_months.items(), self.RECOMPUTE_CHUNK_SIZE):
+            contracts = Contract.objects.in_bulk(
+                contract_id for contract_id, _ in chunk
+            )
+            with transaction.atomic():
+                for contract_id, month_year in chunk:
+                    update_reports(contracts[contract_id], month_year)
 
         self.stdout.write(
-            self.style.SUCCESS("{} Reports were created.".format(report_cnt))
+            self.style.SUCCESS("{} Reports were created.".format(len(missing_reports)))
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                "The Reports of {} Contracts were recomputed.".format(len(first_months))
+            )
         )
@@ -13,14 +13,19 @@ GNU Affero General Public License for more details.
 You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
 """
-from datetime import datetime
+import os
+import uuid
+from datetime import datetime, timedelta
 from io import StringIO
 
 import pytest
+from django.apps import apps
 from django.core.management import call_command
 from django.core.management.base import CommandError
 from pytz import utc
 
+from api.models import ExportSnapshot, Shift
+
 
 class TestCreateReportsCommand:
     @pytest.mark.django_db
@@ -66,6 +71,38 @@ class TestCreateReportsCommand:
         with pytest.raises(CommandError):
             call_command("create_reports", "2", "2019", stdout=out)
 
+    @pytest.mark.django_db
+    @pytest.mark.freeze_time("2019-01-02")
+    def test_range_is_backfilled_and_recomputed(
+        self, contract_ending_in_april, create_n_shift_objects, user_object, freezer
+    ):
+        """
+        Test that all missing months of the range are created and that Shifts of these
+        months are counted in their Reports.
+        """
+        freezer.move_to("2019-05-02")
+        create_n_shift_objects(
+            (1, 2),
+            user_object,
+            contract_ending_in_april,
+            started=datetime(2019, 3, 5, 10, tzinfo=utc),
+            stopped=datetime(2019, 3, 5, 12, tzinfo=utc),
+        )
+        out = StringIO()
+        call_command("create_reports", "2", "2019", "--until", "4", "2019", stdout=out)
+
+        assert "3 Reports were created." in out.getvalue()
+        assert "The Reports of 1 Contracts were recomputed." in out.getvalue()
+        reports = contract_ending_in_april.reports.order_by("month_year")
+        assert [report.month_year.month for report in reports] == [1, 2, 3, 4]
+        assert reports.get(month_year__month=3).worktime == timedelta(hours=2)
+
+    @pytest.mark.django_db
+    @pytest.mark.freeze_time("2019-01-02")
+    def test_range_must_not_end_before_start(self, contract_object):
+        with pytest.raises(CommandError):
+            call_command("create_reports", "2", "2018", "--until", "1", "2018")
+
 
 class TestUpdateReportsCommand:
     @pytest.mark.django_db
@@ -83,3 +120,136 @@ class TestUpdateReportsCommand:
         now = datetime.now(tz=utc)
 
         assert all([rep.modified_at == now for rep in contract.reports.all()])
+
+
+class TestUnlockMonthCommand:
+    @pytest.fixture
+    def locked_shifts(
+        self,
+        create_n_shift_objects,
+        user_object,
+        contract_object,
+        diff_user_object,
+        diff_user_contract_object,
+    ):
+        """
+        One locked Shift in each of January to March 2019 for two Users.
+        """
+        shifts = []
+        for user, contract in (
+            (user_object, contract_object),
+            (diff_user_object, diff_user_contract_object),
+        ):
+            for month in (1, 2, 3):
+                shifts += create_n_shift_objects(
+                    (1, 2),
+                    user,
+                    contract,
+                    started=datetime(2019, month, 5, 10, tzinfo=utc),
+                    stopped=datetime(2019, month, 5, 12, tzinfo=utc),
+                    locked=True,
+                )
+        return shifts
+
+    @pytest.mark.django_db
+    def test_range_is_unlocked_for_multiple_users(
+        self,
+        locked_shifts,
+        user_object,
+        diff_user_object,
+        report_object,
+        aggregated_report_data,
+    ):
+        ExportSnapshot.objects.create(
+            report=report_object, content=aggregated_report_data
+        )
+        out = StringIO()
+        call_command(
+            "unlock_month",
+            "1",
+            "2019",
+            str(user_object.pk),
+            str(diff_user_object.pk),
+            "--until",
+            "2",
+            "2019",
+            stdout=out,
+        )
+
+        assert "4 Shifts in 01.2019-02.2019 (MM.YYYY) are unlocked" in out.getvalue()
+        assert {shift.started.month for shift in Shift.objects.filter(locked=True)} == {
+            3
+        }
+        assert not ExportSnapshot.objects.exists()
+
+    @pytest.mark.django_db
+    def test_contract_is_unlocked(self, locked_shifts, diff_user_contract_object):
+        call_command(
+            "unlock_month",
+            "2",
+            "2019",
+            "--contract",
+            str(diff_user_contract_object.pk),
+            stdout=StringIO(),
+        )
+
+        unlocked = Shift.objects.filter(locked=False)
+        assert [(shift.contract, shift.started.month) for shift in unlocked] == [
+            (diff_user_contract_object, 2)
+        ]
+
+    @pytest.mark.django_db
+    def test_dry_run_changes_nothing(self, locked_shifts, user_object):
+        out = StringIO()
+        call_command(
+            "unlock_month",
+            "1",
+            "2019",
+            str(user_object.pk),
+            "--until",
+            "3",
+            "2019",
+            "--dry-run",
+            stdout=out,
+        )
+
+        assert "3 Shifts in 01.2019-03.2019 (MM.YYYY) would be unlocked" in (
+            out.getvalue()
+        )
+        assert not Shift.objects.filter(locked=False).exists()
+
+    @pytest.mark.django_db
+    @pytest.mark.parametrize("ids", [[], ["not-a-uuid"], [str(uuid.uuid4())]])
+    def test_invalid_selection_fails(self, ids):
+        with pytest.raises(CommandError):
+            call_command("unlock_month", "1", "2019", *ids)
+
+
+class TestBuildStundenzettelCssCommand:
+    def test_stylesheet_is_up_to_date(self, tmp_path):
+        """
+        Test that the committed stylesheet matches the template, i.e. the command was
+        run after the last change of the template.
+        :param tmp_path:
+        :return:
+        """
+        output = tmp_path / "stundenzettel.css"
+        call_command("build_stundenzettel_css", output=str(output), stdout=StringIO())
+
+        committed = os.path.join(
+            apps.get_app_config("api").path, "static/api/css/stundenzettel.css"
+        )
+        with open(committed, encoding="utf-8") as stylesheet:
+            assert output.read_text(encoding="utf-8") == stylesheet.read()
+
+    def test_unused_rules_are_purged(self, tmp_path):
+        output = tmp_path / "stundenzettel.css"
+        call_command("build_stundenzettel_css", output=str(output), stdout=StringIO())
+        css = output.read_text(encoding="utf-8")
+
+        assert ".w-1\\/3 {" in css
+        assert ".text-blue-600 {" in css
+        assert "@page" in css
+        assert "textarea" not in css
+        assert ".bg-gray-100" not in css
+        assert "@media" not in css
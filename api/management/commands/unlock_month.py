@@ -13,33 +13,131 @@ GNU Affero General Public License for more details.
 You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
 """
+import datetime
+import uuid
+
+from dateutil.relativedelta import relativedelta
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
 
-from api.models import Shift, User
+from api.models import Contract, ExportSnapshot, Shift, User
+from api.utilities import unlock_shifts
 
 
 class Command(BaseCommand):
-    help = "Unlock month in specified year for given user."
+    help = (
+        "Unlock the Shifts of the given Users and/or Contracts in the given month, or "
+        "in all months up to --until."
+    )
+    BATCH_SIZE = 1000
 
     def add_arguments(self, parser):
         parser.add_argument("month", type=int)
 
         parser.add_argument("year", type=int)
 
-        parser.add_argument("user_id", type=str)
+        parser.add_argument("user_id", type=str, nargs="*")
+        parser.add_argument(
+            "--contract",
+            action="append",
+            default=[],
+            dest="contract_ids",
+            metavar="CONTRACT_ID",
+            help="Unlock the Shifts of this Contract, can be given multiple times.",
+        )
+        parser.add_argument(
+            "--until",
+            nargs=2,
+            type=int,
+            metavar=("MONTH", "YEAR"),
+            help="Unlock all months up to this month.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report what would be unlocked.",
+        )
+
+    def get_selection(self, user_ids, contract_ids):
+        """
+        Validate the given IDs.
+        :param user_ids:
+        :param contract_ids:
+        :return: Tuple of the User and Contract UUIDs
+        """
+        if not user_ids and not contract_ids:
+            raise CommandError("Neither a User ID nor a Contract ID is defined.")
+        try:
+            user_ids = {uuid.UUID(pk) for pk in user_ids}
+            contract_ids = {uuid.UUID(pk) for pk in contract_ids}
+        except ValueError as error:
+            raise CommandError(f"Invalid ID: {error}")
 
-    def handle(self, *args, **options):
-        user = User.objects.get(id=options["user_id"])
+        unknown = user_ids - set(
+            User.objects.filter(pk__in=user_ids).values_list("pk", flat=True)
+        )
+        unknown |= contract_ids - set(
+            Contract.objects.filter(pk__in=contract_ids).values_list("pk", flat=True)
+        )
+        if unknown:
+            raise CommandError(
+                f"Unknown IDs: {', '.join(sorted(str(pk) for pk in unknown))}"
+            )
+        return user_ids, contract_ids
 
-        if user is None:
-            raise CommandError("User ID is not defined.")
+    def handle(self, *args, **options):
+        start = datetime.date(options["year"], options["month"], 1)
+        end = start
+        if options["until"]:
+            end = datetime.date(options["until"][1], options["until"][0], 1)
+        if end < start:
+            raise CommandError("The end of the range is before its start.")
+        user_ids, contract_ids = self.get_selection(
+            options["user_id"], options["contract_ids"]
+        )
+        selection = Q(user_id__in=user_ids) | Q(contract_id__in=contract_ids)
+        label = f"{start:%m.%Y}" if end == start else f"{start:%m.%Y}-{end:%m.%Y}"
 
-        shifts = Shift.objects.filter(
-            user=user, started__month=options["month"], started__year=options["year"]
+        # A range on started (instead of started__month etc.) can use its index.
+        locked_shifts = Shift.objects.filter(
+            selection,
+            started__gte=timezone.make_aware(
+                datetime.datetime.combine(start, datetime.time())
+            ),
+            started__lt=timezone.make_aware(
+                datetime.datetime.combine(
+                    end + relativedelta(months=1), datetime.time()
+                )
+            ),
+            locked=True,
+        )
+        snapshots = ExportSnapshot.objects.filter(
+            Q(report__user_id__in=user_ids) | Q(report__contract_id__in=contract_ids),
+            report__month_year__range=(start, end),
         )
-        shifts.update(locked=False)
+
+        if options["dry_run"]:
+            self.stdout.write(
+                f"{locked_shifts.count()} Shifts in {label} (MM.YYYY) would be "
+                f"unlocked, {snapshots.count()} export snapshots would be deleted."
+            )
+            return
+
+        unlocked = 0
+        while True:
+            batch = list(locked_shifts.values_list("pk", flat=True)[: self.BATCH_SIZE])
+            if not batch:
+                break
+            with transaction.atomic():
+                unlocked += unlock_shifts(Shift.objects.filter(pk__in=batch))
+        # Snapshots of months in which no Shift is locked anymore are dropped as well.
+        deleted, _ = snapshots.delete()
+
         self.stdout.write(
             self.style.SUCCESS(
-                f"All Shifts in {options['month']}.{options['year']} (MM.YYYY) are unlocked."
+                f"{unlocked} Shifts in {label} (MM.YYYY) are unlocked, {deleted} "
+                f"export snapshots were deleted."
             )
         )
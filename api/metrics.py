@@ -0,0 +1,127 @@
+"""
+Clock - Master your timesheets
+Copyright (C) 2023  Johann Wolfgang Goethe-Universität Frankfurt am Main
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU Affero General Public License as published by the Free Software Foundation, either version 3 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
+"""
+import os
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+REQUEST_LATENCY = Histogram(
+    "clock_request_duration_seconds",
+    "Duration of HTTP requests per view.",
+    ["view", "method", "status"],
+)
+PDF_RENDER_DURATION = Histogram(
+    "clock_pdf_render_duration_seconds",
+    "Duration of rendering a Stundenzettel PDF.",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32),
+)
+PDF_RENDER_QUEUE_DEPTH = Gauge(
+    "clock_pdf_render_queue_depth",
+    "Number of PDF exports waiting for a free render slot.",
+    multiprocess_mode="livesum",
+)
+PDF_RENDER_WAIT_DURATION = Histogram(
+    "clock_pdf_render_wait_seconds",
+    "Time PDF exports waited for a render slot, by whether they got one.",
+    ["outcome"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8),
+)
+UPDATE_REPORTS_DURATION = Histogram(
+    "clock_update_reports_duration_seconds",
+    "Duration of updating the Reports of a contract after a Shift was changed.",
+)
+CELERY_TASK_DURATION = Histogram(
+    "clock_celery_task_duration_seconds",
+    "Runtime of Celery tasks.",
+    ["task", "state"],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600),
+)
+EXTERNAL_CALL_DURATION = Histogram(
+    "clock_external_call_duration_seconds",
+    "Duration of calls to external services.",
+    ["service"],
+)
+
+# Start times of the running Celery tasks by task id.
+_task_started = {}
+
+
+def celery_task_prerun(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+def celery_task_postrun(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is None:
+        return
+    CELERY_TASK_DURATION.labels(task=task.name, state=state or "UNKNOWN").observe(
+        time.perf_counter() - started
+    )
+
+
+def get_registry():
+    """
+    Provide the registry to collect the metrics from.
+
+    If the application runs with several worker processes (e.g. gunicorn) the metrics
+    are written to PROMETHEUS_MULTIPROC_DIR by every process and aggregated on collection.
+    :return: CollectorRegistry
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def start_worker_metrics_server(**kwargs):
+    """
+    Reciever function:
+    Expose the metrics of the Celery worker on CELERY_METRICS_PORT once it is ready.
+    The pool processes write to the PROMETHEUS_MULTIPROC_DIR of the worker, so the
+    server started in the main process collects all of them.
+    """
+    if settings.CELERY_METRICS_PORT:
+        start_http_server(settings.CELERY_METRICS_PORT, registry=get_registry())
+
+
+def metrics_view(request):
+    """
+    Expose the collected metrics in the Prometheus text format to requests
+    authenticated with the METRICS_TOKEN.
+    :param request:
+    :return:
+    """
+    authorization = request.headers.get("Authorization", "")
+    if not settings.METRICS_TOKEN or not constant_time_compare(
+        authorization, f"Bearer {settings.METRICS_TOKEN}"
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST
+    )
@@ -0,0 +1,160 @@
+"""
+Clock - Master your timesheets
+Copyright (C) 2023  Johann Wolfgang Goethe-Universität Frankfurt am Main
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU Affero General Public License as published by the Free Software Foundation, either version 3 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
+"""
+import json
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from api.instrumentation import RequestMetrics, activate_metrics, get_current_metrics
+from api.metrics import REQUEST_LATENCY
+
+LOGGER = logging.getLogger("performance")
+
+
+def get_view_name(request):
+    resolver_match = getattr(request, "resolver_match", None)
+    if resolver_match is None:
+        return None
+    return resolver_match.view_name
+
+
+def to_ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+class RequestTimingMiddleware:
+    """
+    Record the SQL query count, the DB time, the rendering (serialization) time and the
+    response size of a request.
+
+    Sampled requests (see REQUEST_TIMING_SAMPLE_RATE) are fully instrumented and are
+    logged as structured (JSON) line to the "performance" logger. Their response gets
+    a Server-Timing header if DEBUG is on or the user is staff, other clients do not
+    see the internal timings. Requests slower than REQUEST_TIMING_SLOW_THRESHOLD_MS are always logged as
+    warning, for requests which were not sampled only the total duration is known.
+
+    The latency of every request is observed in the Prometheus histogram
+    REQUEST_LATENCY, labeled with the view name.
+
+    Besides db, serialize and total the Server-Timing header contains every section
+    measured with api.instrumentation.timed_section, e.g. the update of the Reports
+    triggered by saving a Shift.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+
+        if random.random() >= settings.REQUEST_TIMING_SAMPLE_RATE:
+            response = self.get_response(request)
+            total = time.perf_counter() - started
+            self.observe_latency(request, response, total)
+            if self.is_slow(total):
+                LOGGER.warning(
+                    json.dumps(self.get_log_data(request, response, total=total))
+                )
+            return response
+
+        metrics = RequestMetrics()
+        with activate_metrics(metrics), connection.execute_wrapper(metrics):
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+        self.observe_latency(request, response, total)
+
+        if self.exposes_timing(request):
+            response["Server-Timing"] = self.get_server_timing(metrics, total)
+        log_data = self.get_log_data(request, response, total=total, metrics=metrics)
+        if self.is_slow(total):
+            LOGGER.warning(json.dumps(log_data))
+        else:
+            LOGGER.info(json.dumps(log_data))
+        return response
+
+    def process_template_response(self, request, response):
+        """
+        Measure the time needed to render the response, e.g. the JSON encoding of
+        DRF Responses.
+        """
+        render_started = time.perf_counter()
+
+        def add_render_time(rendered_response):
+            metrics = get_current_metrics()
+            if metrics is not None:
+                metrics.add_section("serialize", time.perf_counter() - render_started)
+
+        response.add_post_render_callback(add_render_time)
+        return response
+
+    def observe_latency(self, request, response, total):
+        # Unresolved paths are grouped to keep the number of label values bounded.
+        REQUEST_LATENCY.labels(
+            view=get_view_name(request) or "unresolved",
+            method=request.method,
+            status=response.status_code,
+        ).observe(total)
+
+    def exposes_timing(self, request):
+        if settings.DEBUG:
+            return True
+        # DRF sets the user it authenticated on the underlying request as well.
+        user = getattr(request, "user", None)
+        return bool(user is not None and user.is_staff)
+
+    def is_slow(self, total):
+        return to_ms(total) >= settings.REQUEST_TIMING_SLOW_THRESHOLD_MS
+
+    def get_server_timing(self, metrics, total):
+        entries = [
+            'db;dur={};desc="{} queries"'.format(
+                to_ms(metrics.db_time), metrics.queries
+            )
+        ]
+        entries += [
+            "{};dur={}".format(name, to_ms(duration))
+            for name, duration in metrics.sections.items()
+        ]
+        entries.append("total;dur={}".format(to_ms(total)))
+        return ", ".join(entries)
+
+    def get_log_data(self, request, response, total, metrics=None):
+        data = {
+            "view": get_view_name(request),
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "total_ms": to_ms(total),
+        }
+        if metrics is None:
+            return data
+
+        data.update(
+            {
+                "queries": metrics.queries,
+                "db_ms": to_ms(metrics.db_time),
+                "sections_ms": {
+                    name: to_ms(duration) for name, duration in metrics.sections.items()
+                },
+                "response_bytes": (
+                    None if response.streaming else len(response.content)
+                ),
+            }
+        )
+        return data
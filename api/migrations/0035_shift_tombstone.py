@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0034_contract_reference'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShiftTombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shift_id', models.UUIDField()),
+                ('user_id', models.UUIDField()),
+                ('contract_id', models.UUIDField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='shift',
+            index=models.Index(fields=['user', 'modified_at'], name='api_shift_user_id_fc00be_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shifttombstone',
+            index=models.Index(fields=['user_id', 'deleted_at'], name='api_shiftto_user_id_d19b96_idx'),
+        ),
+    ]
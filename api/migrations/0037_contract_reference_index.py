@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:36
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0036_lock_request'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='contract',
+            name='reference',
+            field=models.UUIDField(db_index=True, default=uuid.uuid4),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-19 12:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0037_contract_reference_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportSnapshot',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, unique=True)),
+                ('content', models.JSONField()),
+                ('pdf', models.BinaryField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('report', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='export_snapshot', to='api.report')),
+            ],
+        ),
+    ]
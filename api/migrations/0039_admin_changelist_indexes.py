@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-19 12:42
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The Shift table is large, build its indexes without blocking writes.
+    atomic = False
+
+    dependencies = [
+        ('api', '0038_export_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contract',
+            index=models.Index(fields=['modified_at'], name='api_contrac_modifie_a6b680_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='shift',
+            index=models.Index(fields=['started'], name='api_shift_started_a0dd5b_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='shift',
+            index=models.Index(fields=['modified_at'], name='api_shift_modifie_2dd19e_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 13:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0041_admin_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='adminjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -21,7 +21,10 @@ from dateutil.relativedelta import relativedelta
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Upper
+from django.utils import timezone
 from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 from taggit.managers import TaggableManager
@@ -142,6 +145,17 @@ class User(AbstractUser):
 
     objects = CustomUserManager()
 
+    class Meta(AbstractUser.Meta):
+        # Trigram indexes for the case-insensitive substring search of the admin
+        # (UPPER(...) LIKE '%...%').
+        indexes = [
+            GinIndex(
+                OpClass(Upper(field), name="gin_trgm_ops"),
+                name=f"api_user_{field}_trgm",
+            )
+            for field in ("username", "first_name", "last_name", "email")
+        ]
+
 
 class Contract(models.Model):
     id = models.UUIDField(
@@ -151,7 +165,7 @@ class Contract(models.Model):
         to=User, related_name="contracts", on_delete=models.CASCADE
     )
     name = models.CharField(max_length=100)
-    reference = models.UUIDField(default=uuid.uuid4)
+    reference = models.UUIDField(default=uuid.uuid4, db_index=True)
     minutes = models.PositiveIntegerField()
     percent_fte = models.FloatField(
         null=True, blank=True, verbose_name="Prozent einer Vollzeitstelle"
@@ -174,6 +188,9 @@ class Contract(models.Model):
         to=User, related_name="+", on_delete=models.CASCADE
     )  # No backwards relation to these Fields
 
+    class Meta:
+        indexes = [models.Index(fields=["modified_at"])]
+
 
 class Shift(models.Model):
     TYPE_CHOICES = (
@@ -202,6 +219,30 @@ class Shift(models.Model):
     modified_at = models.DateTimeField(auto_now=True)
     modified_by = models.ForeignKey(to=User, related_name="+", on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "modified_at"]),
+            models.Index(fields=["started"]),
+            models.Index(fields=["modified_at"]),
+        ]
+
+
+class ShiftTombstone(models.Model):
+    """
+    Record of a deleted Shift, used to propagate deletions to syncing clients.
+
+    The ids are stored as plain values instead of foreign keys, since the tombstone
+    has to outlive the Shift and may outlive its Contract.
+    """
+
+    shift_id = models.UUIDField()
+    user_id = models.UUIDField()
+    contract_id = models.UUIDField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["user_id", "deleted_at"])]
+
 
 class ClockedInShift(models.Model):
     id = models.UUIDField(
@@ -336,3 +377,119 @@ class Report(models.Model):
     class Meta:
         ordering = ["month_year"]
         unique_together = ["month_year", "contract"]
+
+
+class LockRequest(models.Model):
+    """
+    Outbox entry for locking the Shifts of a month.
+
+    The entry is created in the transaction of the lock request and holds the export
+    content sent to time-vault. It is delivered asynchronously by a Celery task, which
+    locks the Shifts of the month once time-vault accepted the report.
+    """
+
+    PENDING = "pending"
+    DELIVERED = "delivered"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (PENDING, _("Pending")),
+        (DELIVERED, _("Delivered")),
+        (FAILED, _("Failed")),
+    )
+
+    id = models.UUIDField(
+        primary_key=True, default=uuid.uuid4, editable=False, unique=True
+    )
+    user = models.ForeignKey(
+        to=User, related_name="lock_requests", on_delete=models.CASCADE
+    )
+    contract = models.ForeignKey(
+        to=Contract, related_name="lock_requests", on_delete=models.CASCADE
+    )
+    month_year = models.DateField()
+    payload = models.JSONField()
+    status = models.CharField(choices=STATUS_CHOICES, default=PENDING, max_length=9)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+
+
+class ExportSnapshot(models.Model):
+    """
+    Frozen export content of a locked month.
+
+    Created from the payload time-vault accepted when the month was locked, so later
+    exports do not aggregate the Shifts again. The rendered PDF is stored on the first
+    export. Unlocking the month deletes the snapshot, see api.utilities.unlock_shifts.
+    """
+
+    id = models.UUIDField(
+        primary_key=True, default=uuid.uuid4, editable=False, unique=True
+    )
+    report = models.OneToOneField(
+        to=Report, related_name="export_snapshot", on_delete=models.CASCADE
+    )
+    content = models.JSONField()
+    pdf = models.BinaryField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class AdminJob(models.Model):
+    """
+    Bulk operation started by an admin action.
+
+    The primary keys of the selected objects are stored when the action is started,
+    the operation itself runs in chunks in a Celery task, see api.admin_jobs. processed
+    is updated after every chunk, so the progress is visible in the admin and a failed
+    job continues after the last finished chunk when it is run again. heartbeat_at is
+    set with it, a running job without a heartbeat for ADMIN_JOB_STALE_MINUTES is
+    considered dead and can be retried.
+    """
+
+    UNLOCK_SHIFTS = "unlock_shifts"
+    RECOMPUTE_REPORTS = "recompute_reports"
+    INVALIDATE_SNAPSHOTS = "invalidate_snapshots"
+    ACTION_CHOICES = (
+        (UNLOCK_SHIFTS, _("Unlock Shifts")),
+        (RECOMPUTE_REPORTS, _("Recompute Reports")),
+        (INVALIDATE_SNAPSHOTS, _("Invalidate export snapshots")),
+    )
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (PENDING, _("Pending")),
+        (RUNNING, _("Running")),
+        (DONE, _("Done")),
+        (FAILED, _("Failed")),
+    )
+
+    id = models.UUIDField(
+        primary_key=True, default=uuid.uuid4, editable=False, unique=True
+    )
+    action = models.CharField(choices=ACTION_CHOICES, max_length=20)
+    object_ids = models.JSONField(default=list)
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    status = models.CharField(choices=STATUS_CHOICES, default=PENDING, max_length=7)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(
+        to=User,
+        related_name="+",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("-created_at",)
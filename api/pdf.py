@@ -0,0 +1,329 @@
+"""
+Clock - Master your timesheets
+Copyright (C) 2023  Johann Wolfgang Goethe-Universität Frankfurt am Main
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU Affero General Public License as published by the Free Software Foundation, either version 3 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
+"""
+import abc
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
+
+import weasyprint
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.template.loader import get_template
+from unidecode import unidecode
+
+from api.instrumentation import timed_section
+from api.metrics import (
+    PDF_RENDER_DURATION,
+    PDF_RENDER_QUEUE_DEPTH,
+    PDF_RENDER_WAIT_DURATION,
+)
+
+STUNDENZETTEL_TEMPLATE = "api/stundenzettel.html"
+# Shown in the footer of the Stundenzettel by every backend.
+STUNDENZETTEL_VERSION = "17. November 2023"
+# First key of the Postgres advisory locks used as render slots, the second one is the
+# number of the slot.
+RENDER_SLOT_LOCK_ID = 1_347_634_258
+RENDER_SLOT_POLL_INTERVAL = 0.1
+
+
+class RenderSlotUnavailable(Exception):
+    """
+    Raised if no render slot became free within PDF_RENDER_MAX_WAIT_SECONDS.
+    """
+
+
+def acquire_render_slot():
+    """
+    Try to take one of the PDF_RENDER_SLOTS advisory locks, which are shared by all
+    processes using the database.
+    :return: number of the taken slot or None if all are taken
+    """
+    with connection.cursor() as cursor:
+        for slot in range(settings.PDF_RENDER_SLOTS):
+            cursor.execute(
+                "SELECT pg_try_advisory_lock(%s, %s)", [RENDER_SLOT_LOCK_ID, slot]
+            )
+            if cursor.fetchone()[0]:
+                return slot
+    return None
+
+
+def release_render_slot(slot):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_unlock(%s, %s)", [RENDER_SLOT_LOCK_ID, slot])
+
+
+@contextmanager
+def render_slot():
+    """
+    Limit the number of concurrent PDF renders, so exports at the end of a month can not
+    occupy every web worker.
+
+    Waits up to PDF_RENDER_MAX_WAIT_SECONDS for a free slot. The slots are session level
+    advisory locks: they are independent of the transaction of the request and released
+    by Postgres if the process dies while rendering.
+    :raises RenderSlotUnavailable: if no slot became free in time
+    """
+    started = time.perf_counter()
+    deadline = started + settings.PDF_RENDER_MAX_WAIT_SECONDS
+    with PDF_RENDER_QUEUE_DEPTH.track_inprogress():
+        slot = acquire_render_slot()
+        while slot is None and time.perf_counter() < deadline:
+            time.sleep(RENDER_SLOT_POLL_INTERVAL)
+            slot = acquire_render_slot()
+    PDF_RENDER_WAIT_DURATION.labels(
+        outcome="rejected" if slot is None else "admitted"
+    ).observe(time.perf_counter() - started)
+    if slot is None:
+        raise RenderSlotUnavailable
+    try:
+        yield
+    finally:
+        release_render_slot(slot)
+
+
+@lru_cache(maxsize=None)
+def get_stylesheet(path):
+    """
+    Parse a static stylesheet once per process.
+    :param path: path of the stylesheet relative to the static directories
+    :return: weasyprint.CSS
+    """
+    return weasyprint.CSS(filename=finders.find(path))
+
+
+class PDFRenderer(abc.ABC):
+    """
+    Interface of the backends used by ReportViewSet.compile_pdf, see PDF_RENDERER.
+    """
+
+    @abc.abstractmethod
+    def render(self, template_name, content_dict, base_url):
+        """
+        :param template_name: Django template describing the document
+        :param content_dict: context of the template
+        :param base_url: URL to resolve relative links against
+        :return: bytes
+        """
+
+
+class WeasyprintRenderer(PDFRenderer):
+    """
+    Render the Django template to HTML and convert it with weasyprint.
+    """
+
+    # The Stundenzettel template contains no styles, see the build_stundenzettel_css
+    # command.
+    stylesheets = {STUNDENZETTEL_TEMPLATE: ["api/css/stundenzettel.css"]}
+    extra_context = {STUNDENZETTEL_TEMPLATE: {"version": STUNDENZETTEL_VERSION}}
+
+    def render_html(self, template_name, content_dict):
+        context = {**self.extra_context.get(template_name, {}), **content_dict}
+        with timed_section("template"):
+            return get_template(template_name).render(context)
+
+    def render(self, template_name, content_dict, base_url):
+        html = self.render_html(template_name, content_dict)
+        # picture = finders.find("api/GU_Logo_blau_weiß_RGB.png")
+        with timed_section("pdf", PDF_RENDER_DURATION):
+            return weasyprint.HTML(string=html, base_url=base_url).write_pdf(
+                stylesheets=[
+                    get_stylesheet(path)
+                    for path in self.stylesheets.get(template_name, [])
+                ],
+                # attachments=[picture],
+                presentational_hints=True,
+                optimize_size=("fonts", "images"),
+            )
+
+
+TextItem = namedtuple("TextItem", ["x", "y", "width", "height", "text", "style"])
+
+
+class NativeStundenzettelRenderer(PDFRenderer):
+    """
+    Draw the fixed layout of the Stundenzettel directly with fpdf2, without HTML and
+    CSS. Much cheaper than weasyprint, but only supports the Stundenzettel.
+
+    Requires the optional dependency fpdf2.
+    """
+
+    BLUE = (49, 130, 206)
+    GRAY = (74, 85, 104)
+    # (header, key of the calendar row, width in mm)
+    COLUMNS = (
+        ("Datum", "date", 14),
+        ("Start", "started", 13),
+        ("Ende", "stopped", 13),
+        ("Pause", "breaktime", 14),
+        ("Arbeitszeit", "worktime", 19),
+        ("F/K/U", "absence_type", 12),
+        ("Notizen", "notes", 40),
+    )
+    ACCOUNT_FIELDS = (
+        ("Übertrag aus dem Vormonat", "last_month_carry_over"),
+        ("Monatliche Arbeitszeit", "debit_worktime"),
+        ("Geleistete Arbeitszeit", "total_worked_time"),
+        ("Übertrag in den Folgemonat", "next_month_carry_over"),
+    )
+    LEGEND = (
+        "F: Feiertag",
+        "K: Krank",
+        "U: Urlaub",
+        "",
+        "1: Arbeitszeit über 10 Stunden",
+        "2: Pausenzeit nicht ausreichend",
+        "3: Ruhezeit unter 11 Stunden",
+        "4: Arbeit nach 20 Uhr",
+        "5: Arbeit vor 8 Uhr",
+        "6: Arbeit an einem Sonntag",
+        "7: Arbeit an einem Feiertag",
+    )
+    FOOTER = (
+        "Dieser Stundenzettel wurde maschinell mit Hilfe von Clock erstellt.",
+        "Stand: {}".format(STUNDENZETTEL_VERSION),
+    )
+
+    def __init__(self):
+        try:
+            import fpdf
+        except ImportError:
+            raise ImproperlyConfigured(
+                "The native PDF renderer requires the package fpdf2."
+            )
+        self.fpdf = fpdf
+
+    def get_text_items(self, content_dict):
+        """
+        Lay out every text of the Stundenzettel.
+        :param content_dict: see ReportViewSet.aggregate_export_content
+        :return: List[TextItem] in reading order
+        """
+        general = content_dict["general"]
+        items = []
+        x, y, width = 12, 20, 58
+
+        def add(text, style, height=5, gap=0):
+            nonlocal y
+            items.append(TextItem(x, y, width, height, str(text), style))
+            y += height + gap
+
+        add("Stundenzettel", "title", height=8)
+        add("{} {}".format(general["long_month_name"], general["year"]), "text")
+        add(general["contract_name"], "text", gap=4)
+        add("Name", "label")
+        add(general["user_name"], "value", gap=4)
+        add("Personalnummer", "label")
+        add(general["personal_number"], "value", gap=10)
+        add("Arbeitszeitkonto", "title", height=8, gap=2)
+        for label, key in self.ACCOUNT_FIELDS:
+            add(label, "label")
+            add(general[key], "value", gap=4)
+
+        y = 215
+        add("Legende", "label", gap=2)
+        for entry in self.LEGEND:
+            add(entry, "small", height=4)
+
+        row_height = 7
+        y = 20
+        x = 75
+        for header, _, column_width in self.COLUMNS:
+            items.append(TextItem(x, y, column_width, row_height, header, "header"))
+            x += column_width
+        for row in content_dict["calendar_rows"]:
+            y += row_height
+            x = 75
+            for _, key, column_width in self.COLUMNS:
+                text = row[key].strip()
+                items.append(TextItem(x, y, column_width, row_height, text, "cell"))
+                x += column_width
+
+        y += row_height + 8
+        for line in self.FOOTER:
+            items.append(TextItem(75, y, 125, 4, line, "footer"))
+            y += 4
+        return items
+
+    def set_style(self, pdf, style):
+        font = {
+            "title": ("B", 14, self.BLUE),
+            "label": ("B", 9, self.BLUE),
+            "header": ("B", 8, (0, 0, 0)),
+            "small": ("", 7, (0, 0, 0)),
+            "footer": ("", 6, self.GRAY),
+        }.get(style, ("", 8, self.GRAY if style in ("text", "value") else (0, 0, 0)))
+        pdf.set_font("Helvetica", font[0], font[1])
+        pdf.set_text_color(*font[2])
+
+    def render(self, template_name, content_dict, base_url):
+        if template_name != STUNDENZETTEL_TEMPLATE:
+            raise ImproperlyConfigured(
+                "The native PDF renderer only supports {}.".format(
+                    STUNDENZETTEL_TEMPLATE
+                )
+            )
+        with timed_section("pdf", PDF_RENDER_DURATION):
+            pdf = self.fpdf.FPDF(format="A4", unit="mm")
+            pdf.set_auto_page_break(False)
+            pdf.add_page()
+            for item in self.get_text_items(content_dict):
+                self.set_style(pdf, item.style)
+                pdf.set_xy(item.x, item.y)
+                is_cell = item.style in ("header", "cell")
+                pdf.cell(
+                    item.width,
+                    item.height,
+                    to_latin1(item.text),
+                    border=1 if is_cell else 0,
+                    align="C" if is_cell else "L",
+                )
+            return bytes(pdf.output())
+
+
+def to_latin1(text):
+    """
+    The core fonts of fpdf2 only cover latin-1, transliterate everything else.
+    """
+    try:
+        text.encode("latin-1")
+    except UnicodeEncodeError:
+        return unidecode(text)
+    return text
+
+
+PDF_RENDERERS = {
+    "weasyprint": WeasyprintRenderer,
+    "native": NativeStundenzettelRenderer,
+}
+
+
+def get_pdf_renderer():
+    """
+    Provide the PDF backend configured with the PDF_RENDERER setting.
+    :return: PDFRenderer
+    """
+    try:
+        renderer_class = PDF_RENDERERS[settings.PDF_RENDERER]
+    except KeyError:
+        raise ImproperlyConfigured(
+            "PDF_RENDERER must be one of {}.".format(", ".join(PDF_RENDERERS))
+        )
+    return renderer_class()
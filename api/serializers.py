@@ -23,15 +23,17 @@ from django.utils.translation import gettext_lazy as _
 from pytz import datetime, utc
 from rest_framework import exceptions, serializers
 
-from api.models import ClockedInShift, Contract, Report, Shift, User
+from api.models import ClockedInShift, Contract, LockRequest, Report, Shift, User
 from api.utilities import (
     GermanyHolidays,
     calculate_break,
     calculate_worktime_breaktime,
     create_reports_for_contract,
     create_reports_until_current_month,
+    is_lock_pending,
+    schedule_report_update,
+    suspend_report_signals,
     timedelta_to_string,
-    update_reports,
 )
 
 
@@ -334,26 +336,28 @@ class ContractSerializer(RestrictModificationModelSerializer):
                 != instance.initial_vacation_carryover_minutes
             )
 
-        return_instance = super(ContractSerializer, self).update(
-            instance, validated_data
-        )
-        if start_date_changed:
-            # Delete all existing Reports
-            Report.objects.filter(contract=instance).delete()
-            # Recreate them.
-            create_reports_until_current_month(contract=instance)
-        if end_date_changed:
-            create_reports_for_contract(
-                contract=instance,
-                start=instance.end_date.replace(day=1),
-                stop=datetime.date.today(),
+        # Every branch below recomputes the Reports, do it once for all of them.
+        with suspend_report_signals():
+            return_instance = super(ContractSerializer, self).update(
+                instance, validated_data
             )
+            if start_date_changed:
+                # Delete all existing Reports
+                Report.objects.filter(contract=instance).delete()
+                # Recreate them.
+                create_reports_until_current_month(contract=instance)
+            if end_date_changed:
+                create_reports_for_contract(
+                    contract=instance,
+                    start=instance.end_date.replace(day=1),
+                    stop=datetime.date.today(),
+                )
 
-        if initial_carryover_minutes_changed:
-            update_reports(instance, instance.start_date.replace(day=1))
+            if initial_carryover_minutes_changed:
+                schedule_report_update(instance, instance.start_date.replace(day=1))
 
-        if initial_vacation_carryover_minutes_changed:
-            update_reports(instance, instance.start_date.replace(day=1))
+            if initial_vacation_carryover_minutes_changed:
+                schedule_report_update(instance, instance.start_date.replace(day=1))
 
         return return_instance
 
@@ -405,6 +409,15 @@ class ShiftSerializer(RestrictModificationModelSerializer):
                     "A Shift cannot be created or changed if the month has already been locked."
                 )
             )
+        shifts = [(contract, started)]
+        if uuid is not None:
+            shifts.append((self.instance.contract_id, self.instance.started))
+        if is_lock_pending(*shifts):
+            raise exceptions.PermissionDenied(
+                _(
+                    "A Shift cannot be created or changed while the month is being locked."
+                )
+            )
 
         this_day = Shift.objects.filter(started__date=started.date(), user=user)
 
@@ -592,24 +605,13 @@ class ShiftSerializer(RestrictModificationModelSerializer):
         :param validated_data:
         :return:
         """
-        # To update the old report if we change the contract we need
-        # to check this
-        contract_changed = bool(validated_data.get("contract"))
-        if not self.partial:
-            contract_changed = validated_data.get("contract") != instance.contract
-        # keep track of possibly old contract
-        # and old started value
-        orig_contract = instance.contract
-        orig_started = instance.started
+        # The Report of a previous contract or day is updated by the Shift receivers.
         tags = validated_data.pop("tags", None)
         updated_object = super(ShiftSerializer, self).update(instance, validated_data)
 
         if isinstance(tags, list):
             updated_object.tags.set(tags.copy())
 
-        if contract_changed:
-            update_reports(orig_contract, orig_started.date().replace(day=1))
-
         return updated_object
 
 
@@ -694,3 +696,23 @@ class ReportSerializer(RestrictModificationModelSerializer):
             "modified_by": {"write_only": True},
             "user": {"write_only": True},
         }
+
+
+class LockRequestSerializer(serializers.ModelSerializer):
+    """
+    Status of a request to lock a month, only used within a ReadOnlyViewSet.
+    """
+
+    class Meta:
+        model = LockRequest
+        fields = [
+            "id",
+            "contract",
+            "month_year",
+            "status",
+            "attempts",
+            "last_error",
+            "created_at",
+            "delivered_at",
+        ]
+        read_only_fields = fields
@@ -0,0 +1,213 @@
+"""
+Clock - Master your timesheets
+Copyright (C) 2023  Johann Wolfgang Goethe-Universität Frankfurt am Main
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU Affero General Public License as published by the Free Software Foundation, either version 3 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
+"""
+# This conftest file provides the synthetic data generators and the measurement helpers
+# of the benchmark suite. The benchmarks are excluded from the regular test run (see
+# norecursedirs in setup.cfg) and have to be started explicitly, e.g. with `make benchmark`.
+
+import datetime
+import json
+import pathlib
+import tracemalloc
+
+import pytest
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from pytz import timezone
+from rest_framework.test import APIClient
+
+from api.models import Shift
+from api.tests.conftest import *  # noqa
+from api.utilities import GermanyHolidays, update_reports
+
+tz = timezone(settings.TIME_ZONE)
+
+BASELINE_FILE = pathlib.Path(__file__).parent / "baselines.json"
+
+# Relative increase of a metric compared to its baseline, which is still accepted.
+THRESHOLDS = {"queries": 0.0, "peak_memory_kib": 0.2}
+
+# The synthetic data lives in a fixed year, so that the amount of generated data and
+# therefore all query counts are independent of the day the benchmarks are run.
+SYNTHETIC_YEAR = 2023
+
+# Start hours of the slots in which the shifts of the n-th contract are placed.
+# Keeping the contracts in disjoint slots avoids overlapping shifts of one user.
+CONTRACT_SLOT_HOURS = (7, 10, 13, 16)
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmark-update-baselines",
+        action="store_true",
+        default=False,
+        help="Write the measured query counts and peak memory to baselines.json.",
+    )
+
+
+def pytest_sessionfinish(session, exitstatus):
+    measured = getattr(session.config, "_measured_baselines", None)
+    if not measured:
+        return
+    baselines = load_baselines()
+    baselines.update(measured)
+    BASELINE_FILE.write_text(json.dumps(baselines, indent=4, sort_keys=True) + "\n")
+
+
+def load_baselines():
+    if not BASELINE_FILE.exists():
+        return {}
+    return json.loads(BASELINE_FILE.read_text())
+
+
+def working_days(year, month):
+    """
+    Provide all days of a month on which the synthetic user works (Monday to Friday,
+    without bank holidays).
+    :param year:
+    :param month:
+    :return:
+    """
+    holidays = GermanyHolidays(subdiv="HE", years=year)
+    day = datetime.date(year, month, 1)
+    while day.month == month:
+        if day.weekday() < 5 and day not in holidays:
+            yield day
+        day += datetime.timedelta(days=1)
+
+
+@pytest.fixture
+def create_synthetic_user(create_n_user_objects, create_n_contract_objects):
+    """
+    This fixture resembles a factory for users with many contracts and thousands of shifts.
+
+    Every contract runs through the whole SYNTHETIC_YEAR and gets `shifts_per_day` shifts on
+    every working day. The shifts are inserted with bulk_create (which bypasses the report
+    signals) and the reports are updated once per contract afterwards.
+
+    The last working day of November is kept free of shifts. It can be used to create
+    new shifts through the API, since the month is neither locked nor in the future.
+    :return: Function
+    """
+    user_count = iter(range(1000, 2000))
+
+    def create_user(contracts=4, shifts_per_day=2):
+        n = next(user_count)
+        user = create_n_user_objects((n, n + 1))[0]
+        contract_objects = create_n_contract_objects(
+            (contracts,),
+            user,
+            start_date=datetime.date(SYNTHETIC_YEAR, 1, 1),
+            end_date=datetime.date(SYNTHETIC_YEAR, 12, 31),
+        )
+        free_day = list(working_days(SYNTHETIC_YEAR, 11))[-1]
+
+        shifts = []
+        for slot, contract in zip(CONTRACT_SLOT_HOURS, contract_objects):
+            for month in range(1, 13):
+                for day in working_days(SYNTHETIC_YEAR, month):
+                    if day == free_day:
+                        continue
+                    for i in range(shifts_per_day):
+                        started = tz.localize(
+                            datetime.datetime.combine(day, datetime.time(slot))
+                        ) + datetime.timedelta(minutes=90 * i)
+                        shifts.append(
+                            Shift(
+                                started=started,
+                                stopped=started + datetime.timedelta(hours=1),
+                                type="st",
+                                note="synthetic",
+                                user=user,
+                                created_by=user,
+                                modified_by=user,
+                                contract=contract,
+                            )
+                        )
+        Shift.objects.bulk_create(shifts, batch_size=1000)
+
+        for contract in contract_objects:
+            update_reports(contract, contract.start_date)
+
+        return {"user": user, "contracts": contract_objects, "free_day": free_day}
+
+    return create_user
+
+
+@pytest.fixture
+def synthetic_user(create_synthetic_user):
+    return create_synthetic_user()
+
+
+@pytest.fixture
+def authenticated_client(synthetic_user):
+    client = APIClient()
+    client.force_authenticate(user=synthetic_user["user"])
+    return client
+
+
+@pytest.fixture
+def measure(benchmark, request):
+    """
+    This fixture measures the wall time of a callable via pytest-benchmark and
+    additionally its query count and peak memory in a separate, untimed run.
+
+    The query count and peak memory are compared against the baseline of the benchmark
+    (see baselines.json), the test fails if they increased more than THRESHOLDS allow.
+    If the option --benchmark-update-baselines is given, the measured values are
+    written to the baseline file instead.
+    :return: Function
+    """
+    update_baselines = request.config.getoption("--benchmark-update-baselines")
+
+    def run(name, func, setup=None, rounds=None):
+        args = setup()[0] if setup else ()
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as context:
+            func(*args)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        metrics = {
+            "queries": len(context.captured_queries),
+            "peak_memory_kib": round(peak_memory / 1024),
+        }
+        benchmark.extra_info.update(metrics)
+
+        if setup:
+            result = benchmark.pedantic(func, setup=setup, rounds=rounds or 5)
+        else:
+            result = benchmark(func)
+
+        if update_baselines:
+            measured = getattr(request.config, "_measured_baselines", {})
+            measured[name] = metrics
+            request.config._measured_baselines = measured
+            return result
+
+        baseline = load_baselines().get(name, {})
+        regressions = [
+            "{metric}: {value} (baseline {baseline})".format(
+                metric=metric, value=metrics[metric], baseline=baseline[metric]
+            )
+            for metric, threshold in THRESHOLDS.items()
+            if metric in baseline
+            and metrics[metric] > baseline[metric] * (1 + threshold)
+        ]
+        assert not regressions, "{} regressed: {}".format(name, ", ".join(regressions))
+        return result
+
+    return run
@@ -0,0 +1,44 @@
+"""
+Clock - Master your timesheets
+Copyright (C) 2023  Johann Wolfgang Goethe-Universität Frankfurt am Main
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU Affero General Public License as published by the Free Software Foundation, either version 3 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
+"""
+import pytest
+
+from api.utilities import update_reports
+
+
+class TestUpdateReportsBenchmarks:
+    @pytest.mark.django_db
+    def test_update_reports_whole_contract(self, measure, synthetic_user):
+        """
+        Update all twelve Reports of a contract, which happens e.g. after a change of
+        the initial carryover.
+        """
+        contract = synthetic_user["contracts"][0]
+        measure(
+            "update_reports_whole_contract",
+            lambda: update_reports(contract, contract.start_date),
+        )
+
+    @pytest.mark.django_db
+    def test_update_reports_last_month(self, measure, synthetic_user):
+        """
+        Update the last Report of a contract, which is the common case of a shift
+        being created in the current month.
+        """
+        contract = synthetic_user["contracts"][0]
+        measure(
+            "update_reports_last_month",
+            lambda: update_reports(contract, contract.end_date.replace(day=1)),
+        )
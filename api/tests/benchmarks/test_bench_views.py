@@ -0,0 +1,260 @@
+"""
+Clock - Master your timesheets
+Copyright (C) 2023  Johann Wolfgang Goethe-Universität Frankfurt am Main
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU Affero General Public License as published by the Free Software Foundation, either version 3 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
+"""
+import datetime
+import itertools
+import pathlib
+
+import pytest
+import weasyprint
+from django.contrib.staticfiles import finders
+from django.template.loader import get_template
+from django.test import RequestFactory
+from django.urls import reverse
+
+from api.models import Report, Shift
+from api.pdf import STUNDENZETTEL_TEMPLATE, WeasyprintRenderer
+from api.tests.benchmarks.conftest import SYNTHETIC_YEAR, tz
+from api.tests.conftest_files.general_conftest import setup_view
+from api.views import ReportViewSet
+
+
+def request_ok(method, path, **kwargs):
+    """
+    Wrap a request of the test client into a callable which asserts a successful response.
+    :param method: e.g. client.get
+    :param path:
+    :param kwargs:
+    :return: Function
+    """
+
+    def send(*args):
+        response = method(path, **kwargs)
+        assert response.status_code < 300, response.content
+        return response
+
+    return send
+
+
+@pytest.fixture
+def current_month_report(synthetic_user):
+    """
+    The synthetic contracts end in the past, so the report of the current month,
+    which is retrieved by the get_current endpoint, has to be created explicitly.
+    """
+    user = synthetic_user["user"]
+    contract = synthetic_user["contracts"][0]
+    return Report.objects.create(
+        month_year=datetime.date.today().replace(day=1),
+        worktime=datetime.timedelta(0),
+        contract=contract,
+        user=user,
+        created_by=user,
+        modified_by=user,
+    )
+
+
+@pytest.fixture
+def exportable_report(synthetic_user):
+    """
+    Provide the November report of the first contract with all shifts of the previous
+    months locked, which is required for the export.
+    """
+    contract = synthetic_user["contracts"][0]
+    november = datetime.date(SYNTHETIC_YEAR, 11, 1)
+    Shift.objects.filter(contract=contract, started__date__lt=november).update(
+        locked=True
+    )
+    return Report.objects.get(contract=contract, month_year=november)
+
+
+class TestShiftEndpointBenchmarks:
+    @pytest.mark.django_db
+    def test_shift_list(self, measure, authenticated_client):
+        measure(
+            "shift_list",
+            request_ok(authenticated_client.get, reverse("api:shifts-list")),
+        )
+
+    @pytest.mark.django_db
+    def test_shift_list_month_year(self, measure, authenticated_client):
+        measure(
+            "shift_list_month_year",
+            request_ok(
+                authenticated_client.get,
+                reverse("api:list-shifts", args=[11, SYNTHETIC_YEAR]),
+            ),
+        )
+
+    @pytest.mark.django_db
+    def test_shift_list_not_modified(self, measure, authenticated_client):
+        """
+        Revalidation of an unchanged list, which only computes the version stamp.
+        """
+        path = reverse("api:shifts-list")
+        etag = authenticated_client.get(path)["ETag"]
+
+        def revalidate():
+            response = authenticated_client.get(path, HTTP_IF_NONE_MATCH=etag)
+            assert response.status_code == 304
+
+        measure("shift_list_not_modified", revalidate)
+
+    @pytest.mark.django_db
+    def test_shift_create(self, measure, authenticated_client, synthetic_user):
+        """
+        Every round creates a new 30 minute shift on the free day of the synthetic user,
+        the shifts are placed one after another to avoid overlaps.
+        """
+        contract = synthetic_user["contracts"][0]
+        day = synthetic_user["free_day"]
+        slots = itertools.count()
+
+        def setup():
+            started = tz.localize(
+                datetime.datetime.combine(day, datetime.time(8))
+            ) + datetime.timedelta(minutes=40 * next(slots))
+            data = {
+                "started": started.isoformat(),
+                "stopped": (started + datetime.timedelta(minutes=30)).isoformat(),
+                "contract": str(contract.id),
+                "type": "st",
+                "note": "",
+                "tags": ["benchmark"],
+                "was_reviewed": True,
+            }
+            return (data,), {}
+
+        def create(data):
+            response = authenticated_client.post(
+                reverse("api:shifts-list"), data=data, format="json"
+            )
+            assert response.status_code == 201, response.content
+
+        measure("shift_create", create, setup=setup)
+
+    @pytest.mark.django_db
+    def test_shift_update(self, measure, authenticated_client, synthetic_user):
+        shift = Shift.objects.filter(user=synthetic_user["user"]).latest("started")
+        measure(
+            "shift_update",
+            request_ok(
+                authenticated_client.patch,
+                reverse("api:shifts-detail", args=[shift.id]),
+                data={"note": "updated"},
+                format="json",
+            ),
+        )
+
+
+class TestReportEndpointBenchmarks:
+    @pytest.mark.django_db
+    def test_report_list(self, measure, authenticated_client):
+        measure(
+            "report_list",
+            request_ok(authenticated_client.get, reverse("api:reports-list")),
+        )
+
+    @pytest.mark.django_db
+    def test_report_get_current(
+        self, measure, authenticated_client, current_month_report
+    ):
+        measure(
+            "report_get_current",
+            request_ok(
+                authenticated_client.get,
+                reverse(
+                    "api:reports-get_current", args=[current_month_report.contract.id]
+                ),
+            ),
+        )
+
+    @pytest.mark.django_db
+    def test_report_export(self, measure, authenticated_client, exportable_report):
+        measure(
+            "report_export",
+            request_ok(
+                authenticated_client.get,
+                reverse("api:reports-export", args=[exportable_report.id]),
+            ),
+        )
+
+    @pytest.mark.benchmark(group="report_pdf_render")
+    @pytest.mark.django_db
+    def test_report_pdf_render(self, measure, exportable_report):
+        """
+        Render the PDF of a report from its already aggregated content.
+        """
+        request = RequestFactory().get(
+            reverse("api:reports-export", args=[exportable_report.id])
+        )
+        view = setup_view(ReportViewSet(), request)
+        content = view.aggregate_export_content(exportable_report)
+        measure(
+            "report_pdf_render",
+            lambda: view.compile_pdf(
+                template_name="api/stundenzettel.html",
+                content_dict=content,
+            ),
+        )
+
+    @pytest.mark.benchmark(group="report_pdf_render")
+    @pytest.mark.django_db
+    def test_report_pdf_render_inline_css(self, measure, exportable_report):
+        """
+        Render the PDF like before build_stundenzettel_css: the complete Tailwind CSS is
+        inlined into the HTML and parsed on every export. Compare with report_pdf_render.
+        """
+        request = RequestFactory().get(
+            reverse("api:reports-export", args=[exportable_report.id])
+        )
+        content = setup_view(ReportViewSet(), request).aggregate_export_content(
+            exportable_report
+        )
+        style = "".join(
+            pathlib.Path(finders.find(path)).read_text(encoding="utf-8")
+            for path in ("api/css/stundenzettel.base.css", "api/css/tailwind.out.css")
+        )
+        renderer = WeasyprintRenderer()
+
+        def render():
+            html = renderer.render_html(STUNDENZETTEL_TEMPLATE, content).replace(
+                "</head>", "<style>{}</style></head>".format(style), 1
+            )
+            return weasyprint.HTML(
+                string=html, base_url=request.build_absolute_uri()
+            ).write_pdf(presentational_hints=True, optimize_size=("fonts", "images"))
+
+        measure("report_pdf_render_inline_css", render)
+
+    @pytest.mark.django_db
+    def test_report_template_render(self, measure, exportable_report):
+        """
+        Render the HTML of the Stundenzettel from its already aggregated content.
+        """
+        request = RequestFactory().get(
+            reverse("api:reports-export", args=[exportable_report.id])
+        )
+        content = setup_view(ReportViewSet(), request).aggregate_export_content(
+            exportable_report
+        )
+        template = get_template("api/stundenzettel.html")
+        measure("report_template_render", lambda: template.render(content))
+
+
+class TestGDPRExportBenchmarks:
+    @pytest.mark.django_db
+    def test_gdpr_export(self, measure, authenticated_client):
+        measure("gdpr_export", request_ok(authenticated_client.get, "/gdpr/"))
@@ -25,4 +25,5 @@ from api.tests.conftest_files.deprovision_conftest import *  # noqa
 from api.tests.conftest_files.general_conftest import *  # noqa
 from api.tests.conftest_files.report_conftest import *  # noqa
 from api.tests.conftest_files.shift_conftest import *  # noqa
+from api.tests.conftest_files.time_vault_conftest import *  # noqa
 from api.tests.conftest_files.user_conftest import *  # noqa
@@ -40,6 +40,7 @@ def test_deprovisioner_instance():
     """
     deprovisioner = Deprovisioner()
     deprovisioner.REQUEST_OBJ_COUNT = 2
+    deprovisioner.DELETE_CHUNK_SIZE = 2
     return deprovisioner
 
 
@@ -112,3 +113,34 @@ def user_marked_for_deletion(create_n_user_objects):
     user.marked_for_deletion = True
     user.save()
     return user
+
+
+@pytest.fixture
+def idm_response_body_for_test_users(deprovision_test_users):
+    """
+    Creates the IDM response body for the deprovision_test_users, every other user is
+    returned as locked account (5 of 10 Users).
+    """
+    return {
+        "jsonrpc": "2.0",
+        "id": "1",
+        "result": {
+            "success": True,
+            "data": [
+                {"hrzlogin": user.username}
+                for user in deprovision_test_users
+                if int(user.username[-1]) % 2
+            ],
+        },
+    }
+
+
+@pytest.fixture
+def marked_user_with_shifts(user_object, contract_object, create_n_shift_objects):
+    """
+    A user marked for deletion owning a Contract with its Reports and 5 Shifts.
+    """
+    create_n_shift_objects((5,), user_object, contract_object)
+    user_object.marked_for_deletion = True
+    user_object.save()
+    return user_object
@@ -16,7 +16,7 @@ along with this program.  If not, see <https://github.com/ClockGU/clock-backend/
 import pytest
 from pytz import datetime
 
-from api.models import Report
+from api.models import LockRequest, Report
 
 # This conftest file provides all necessary test data concerning the Report Model.
 # It will be imported by the conftest.py in the parent directory.
@@ -212,3 +212,20 @@ def aggregated_report_data():
             "next_month_carry_over": "-18:00",
         },
     }
+
+
+@pytest.fixture
+def lock_request_object(contract_object, shift_object, aggregated_report_data):
+    """
+    This fixture creates a pending LockRequest for the month of the shift_object.
+    :param contract_object:
+    :param shift_object:
+    :param aggregated_report_data:
+    :return: LockRequest
+    """
+    return LockRequest.objects.create(
+        user=contract_object.user,
+        contract=contract_object,
+        month_year=shift_object.started.date().replace(day=1),
+        payload=aggregated_report_data,
+    )
@@ -0,0 +1,103 @@
+"""
+Clock - Master your timesheets
+Copyright (C) 2023  Johann Wolfgang Goethe-Universität Frankfurt am Main
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU Affero General Public License as published by the Free Software Foundation, either version 3 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from api.time_vault import reset_time_vault_client
+
+
+class TimeVaultStubServer(ThreadingHTTPServer):
+    """
+    Local HTTP server standing in for time-vault.
+
+    The answers are taken from `responses` in order, tuples of (status, json body,
+    delay in seconds); if it is exhausted the last answer is repeated.
+    Every received request is recorded as (method, path).
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), TimeVaultStubHandler)
+        self.responses = [(200, {}, 0)]
+        self.requests = []
+
+    @property
+    def url(self):
+        return "http://{}:{}".format(*self.server_address)
+
+    def next_response(self):
+        if len(self.responses) > 1:
+            return self.responses.pop(0)
+        return self.responses[0]
+
+
+class TimeVaultStubHandler(BaseHTTPRequestHandler):
+    def handle_request(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        self.server.requests.append((self.command, self.path))
+        status, body, delay = self.server.next_response()
+        time.sleep(delay)
+        content = json.dumps(body).encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up after its read timeout.
+            pass
+
+    do_GET = handle_request
+    do_POST = handle_request
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def fresh_time_vault_client():
+    """
+    Every test starts with a new time-vault client, so the state of the circuit breaker
+    does not leak between tests.
+    """
+    reset_time_vault_client()
+    yield
+    reset_time_vault_client()
+
+
+@pytest.fixture
+def time_vault_stub(settings):
+    """
+    This fixture starts a local time-vault stub server and points the shared
+    time-vault client to it.
+    :return: TimeVaultStubServer
+    """
+    server = TimeVaultStubServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    settings.TIME_VAULT_URL = server.url
+    settings.TIME_VAULT_BACKOFF_FACTOR = 0
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,361 @@
+"""
+Clock - Master your timesheets
+Copyright (C) 2023  Johann Wolfgang Goethe-Universität Frankfurt am Main
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU Affero General Public License as published by the Free Software Foundation, either version 3 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
+"""
+import datetime
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from pytz import utc
+
+from api import admin, admin_jobs
+from api.admin import (
+    EstimatedCountPaginator,
+    filter_by_started,
+    get_estimated_count,
+    get_uuid_range,
+)
+from api.admin_jobs import create_admin_job, run_admin_job
+from api.models import AdminJob, Contract, ExportSnapshot, Report, Shift
+
+
+class TestChangelists:
+    @pytest.mark.django_db
+    @pytest.mark.parametrize("model_name", ["shift", "contract", "report"])
+    def test_query_count_does_not_depend_on_rows(
+        self,
+        admin_client,
+        model_name,
+        create_n_shift_objects,
+        create_n_contract_objects,
+        user_object,
+        contract_object,
+    ):
+        path = reverse(f"admin:api_{model_name}_changelist")
+        create_n_contract_objects((1, 3), user_object)
+        create_n_shift_objects((1, 3), user_object, contract_object)
+        with CaptureQueriesContext(connection) as few_rows:
+            assert admin_client.get(path).status_code == 200
+
+        create_n_contract_objects((3, 9), user_object)
+        create_n_shift_objects((3, 9), user_object, contract_object)
+        with CaptureQueriesContext(connection) as more_rows:
+            assert admin_client.get(path).status_code == 200
+
+        assert len(more_rows) == len(few_rows)
+
+
+class TestEstimatedCountPaginator:
+    @pytest.mark.django_db
+    def test_unfiltered_big_table_uses_estimate(self, monkeypatch, shift_object):
+        monkeypatch.setattr(admin, "get_estimated_count", lambda model: 10**6)
+        paginator = EstimatedCountPaginator(Shift.objects.order_by("pk"), 200)
+        assert paginator.count == 10**6
+
+    @pytest.mark.django_db
+    def test_filtered_table_is_counted(self, monkeypatch, shift_object):
+        monkeypatch.setattr(admin, "get_estimated_count", lambda model: 10**6)
+        paginator = EstimatedCountPaginator(
+            Shift.objects.filter(pk=shift_object.pk).order_by("pk"), 200
+        )
+        assert paginator.count == 1
+
+    @pytest.mark.django_db
+    def test_small_table_is_counted(self, settings, shift_object):
+        settings.ADMIN_ESTIMATED_COUNT_THRESHOLD = 10**6
+        paginator = EstimatedCountPaginator(Shift.objects.order_by("pk"), 200)
+        assert paginator.count == 1
+
+    @pytest.mark.django_db
+    def test_estimated_count_is_not_negative(self):
+        assert get_estimated_count(Shift) >= 0
+
+
+class TestFilterByStarted:
+    @pytest.mark.django_db
+    @pytest.mark.parametrize(
+        "year, month, expected",
+        [
+            ("2019", "2", 1),
+            ("2019", "1", 0),
+            ("2019", None, 1),
+            ("2018", None, 0),
+            (None, "2", 1),
+        ],
+    )
+    def test_local_month_boundaries(
+        self,
+        year,
+        month,
+        expected,
+        create_n_shift_objects,
+        user_object,
+        contract_object,
+    ):
+        # 2019-02-01 00:30 in Europe/Berlin
+        started = datetime.datetime(2019, 1, 31, 23, 30, tzinfo=utc)
+        create_n_shift_objects(
+            (1,),
+            user_object,
+            contract_object,
+            started=started,
+            stopped=started + datetime.timedelta(hours=1),
+        )
+        shifts = filter_by_started(Shift.objects.all(), year=year, month=month)
+        assert shifts.count() == expected
+
+
+class TestUUIDSearch:
+    @pytest.mark.parametrize(
+        "search_term, expected",
+        [
+            (
+                "d5d6ea83-df80-46df-ad85-341ae62b491c",
+                ("d5d6ea83-df80-46df-ad85-341ae62b491c",) * 2,
+            ),
+            (
+                " D5D6EA83-DF ",
+                (
+                    "d5d6ea83-df00-0000-0000-000000000000",
+                    "d5d6ea83-dfff-ffff-ffff-ffffffffffff",
+                ),
+            ),
+            ("d5d6ea8", None),
+            ("deadbeef", None),
+            (
+                "deadbeef1234",
+                (
+                    "deadbeef-1234-0000-0000-000000000000",
+                    "deadbeef-1234-ffff-ffff-ffffffffffff",
+                ),
+            ),
+            ("Testfirstname", None),
+            ("d5d6ea83-df80-46df-ad85-341ae62b491c0", None),
+        ],
+    )
+    def test_get_uuid_range(self, search_term, expected):
+        uuid_range = get_uuid_range(search_term)
+        if expected is None:
+            assert uuid_range is None
+        else:
+            assert tuple(str(value) for value in uuid_range) == expected
+
+    @pytest.mark.django_db
+    def test_shift_is_found_by_contract_reference_prefix(
+        self, admin_client, shift_object
+    ):
+        reference = str(shift_object.contract.reference)
+        response = admin_client.get(
+            reverse("admin:api_shift_changelist"), {"q": reference[:13]}
+        )
+        assert list(response.context["cl"].result_list) == [shift_object]
+
+    @pytest.mark.django_db
+    def test_name_search_skips_uuid_fields(self, admin_client, shift_object):
+        response = admin_client.get(
+            reverse("admin:api_shift_changelist"),
+            {"q": shift_object.user.first_name},
+        )
+        assert list(response.context["cl"].result_list) == [shift_object]
+
+    @pytest.mark.django_db
+    def test_hex_name_is_found_by_name_search(self, admin_client, shift_object):
+        shift_object.user.first_name = "Deadbeef"
+        shift_object.user.save()
+        response = admin_client.get(
+            reverse("admin:api_shift_changelist"), {"q": "deadbeef"}
+        )
+        assert list(response.context["cl"].result_list) == [shift_object]
+
+    @pytest.mark.django_db
+    def test_report_search_by_user_name(self, admin_client, report_object):
+        response = admin_client.get(
+            reverse("admin:api_report_changelist"),
+            {"q": report_object.user.last_name},
+        )
+        assert report_object in response.context["cl"].result_list
+
+
+class TestAdminJobs:
+    @pytest.mark.django_db
+    def test_action_starts_job_after_commit(
+        self,
+        admin_client,
+        create_n_shift_objects,
+        user_object,
+        contract_object,
+        django_capture_on_commit_callbacks,
+    ):
+        shifts = create_n_shift_objects(
+            (1, 4), user_object, contract_object, locked=True
+        )
+        with django_capture_on_commit_callbacks() as callbacks:
+            response = admin_client.post(
+                reverse("admin:api_shift_changelist"),
+                {
+                    "action": "unlock_shifts_action",
+                    "_selected_action": [str(shift.pk) for shift in shifts],
+                },
+            )
+
+        assert response.status_code == 302
+        job = AdminJob.objects.get()
+        assert job.action == AdminJob.UNLOCK_SHIFTS
+        assert job.total == 3
+        assert job.status == AdminJob.PENDING
+        assert len(callbacks) == 1
+        # Nothing is unlocked before the task runs.
+        assert Shift.objects.filter(locked=True).count() == 3
+
+    @pytest.mark.django_db
+    def test_unlock_shifts_in_chunks(
+        self, settings, create_n_shift_objects, user_object, contract_object
+    ):
+        settings.ADMIN_JOB_CHUNK_SIZE = 2
+        create_n_shift_objects((1, 6), user_object, contract_object, locked=True)
+        job = create_admin_job(AdminJob.UNLOCK_SHIFTS, Shift.objects.all())
+
+        job = run_admin_job(job.pk)
+
+        assert job.status == AdminJob.DONE
+        assert job.processed == job.total == 5
+        assert job.finished_at is not None
+        assert not Shift.objects.filter(locked=True).exists()
+
+    @pytest.mark.django_db
+    def test_failed_job_continues_after_last_chunk(
+        self,
+        settings,
+        monkeypatch,
+        create_n_shift_objects,
+        user_object,
+        contract_object,
+    ):
+        settings.ADMIN_JOB_CHUNK_SIZE = 2
+        create_n_shift_objects((1, 6), user_object, contract_object, locked=True)
+        job = create_admin_job(AdminJob.UNLOCK_SHIFTS, Shift.objects.all())
+        chunks = []
+
+        def fail_on_second_chunk(object_ids):
+            chunks.append(object_ids)
+            if len(chunks) == 2:
+                raise RuntimeError("connection lost")
+            admin_jobs.unlock_shifts_chunk(object_ids)
+
+        monkeypatch.setitem(
+            admin_jobs.CHUNK_HANDLERS, AdminJob.UNLOCK_SHIFTS, fail_on_second_chunk
+        )
+        with pytest.raises(RuntimeError):
+            run_admin_job(job.pk)
+
+        job.refresh_from_db()
+        assert job.status == AdminJob.FAILED
+        assert job.error == "connection lost"
+        assert job.processed == 2
+        assert Shift.objects.filter(locked=True).count() == 3
+
+        job = run_admin_job(job.pk)
+
+        assert job.status == AdminJob.DONE
+        assert job.processed == 5
+        assert chunks[2] == chunks[1]
+        assert not Shift.objects.filter(locked=True).exists()
+
+    @pytest.mark.django_db
+    def test_running_job_is_not_run_twice(
+        self, create_n_shift_objects, user_object, contract_object
+    ):
+        create_n_shift_objects((1, 3), user_object, contract_object, locked=True)
+        job = create_admin_job(AdminJob.UNLOCK_SHIFTS, Shift.objects.all())
+        AdminJob.objects.filter(pk=job.pk).update(status=AdminJob.RUNNING)
+
+        job = run_admin_job(job.pk)
+
+        assert job.status == AdminJob.RUNNING
+        assert job.processed == 0
+        assert Shift.objects.filter(locked=True).count() == 2
+
+    @pytest.mark.django_db
+    def test_retry_action_runs_failed_and_stale_jobs(
+        self, admin_client, contract_object, django_capture_on_commit_callbacks
+    ):
+        jobs = {
+            status: create_admin_job(AdminJob.RECOMPUTE_REPORTS, Contract.objects.all())
+            for status in ("failed", "stale", "running", "done")
+        }
+        now = timezone.now()
+        AdminJob.objects.filter(pk=jobs["failed"].pk).update(status=AdminJob.FAILED)
+        AdminJob.objects.filter(pk=jobs["stale"].pk).update(
+            status=AdminJob.RUNNING, heartbeat_at=now - datetime.timedelta(hours=1)
+        )
+        AdminJob.objects.filter(pk=jobs["running"].pk).update(
+            status=AdminJob.RUNNING, heartbeat_at=now
+        )
+        AdminJob.objects.filter(pk=jobs["done"].pk).update(status=AdminJob.DONE)
+
+        with django_capture_on_commit_callbacks() as callbacks:
+            response = admin_client.post(
+                reverse("admin:api_adminjob_changelist"),
+                {
+                    "action": "retry_admin_jobs_action",
+                    "_selected_action": [str(job.pk) for job in jobs.values()],
+                },
+            )
+
+        assert response.status_code == 302
+        assert len(callbacks) == 2
+        assert dict(AdminJob.objects.values_list("pk", "status")) == {
+            jobs["failed"].pk: AdminJob.FAILED,
+            jobs["stale"].pk: AdminJob.FAILED,
+            jobs["running"].pk: AdminJob.RUNNING,
+            jobs["done"].pk: AdminJob.DONE,
+        }
+
+    @pytest.mark.django_db
+    def test_recompute_reports(
+        self, create_n_shift_objects, user_object, contract_object
+    ):
+        create_n_shift_objects((1, 3), user_object, contract_object)
+        expected = dict(Report.objects.values_list("pk", "worktime"))
+        Report.objects.update(worktime=datetime.timedelta(hours=99))
+        job = create_admin_job(AdminJob.RECOMPUTE_REPORTS, Contract.objects.all())
+
+        run_admin_job(job.pk)
+
+        assert dict(Report.objects.values_list("pk", "worktime")) == expected
+
+    @pytest.mark.django_db
+    def test_invalidate_snapshots(self, report_object, aggregated_report_data):
+        ExportSnapshot.objects.create(
+            report=report_object, content=aggregated_report_data
+        )
+        job = create_admin_job(
+            AdminJob.INVALIDATE_SNAPSHOTS, Report.objects.filter(pk=report_object.pk)
+        )
+
+        run_admin_job(job.pk)
+
+        assert not ExportSnapshot.objects.exists()
+
+    @pytest.mark.django_db
+    def test_changelist_shows_progress(self, admin_client, contract_object):
+        create_admin_job(AdminJob.RECOMPUTE_REPORTS, Contract.objects.all())
+
+        response = admin_client.get(reverse("admin:api_adminjob_changelist"))
+
+        assert response.status_code == 200
+        assert "0/1 (0%)" in response.content.decode()
@@ -18,10 +18,11 @@ import json
 import time
 
 import pytest
+import requests
 from dateutil.relativedelta import relativedelta
 
-from api.idm.deprovisioning import Deprovisioner
-from api.models import User
+from api.idm.deprovisioning import Deprovisioner, IDMResponseError
+from api.models import Contract, Report, Shift, ShiftTombstone, User
 
 
 class TestClassAttributes:
@@ -230,6 +231,22 @@ class TestDeprovisionSteps:
         test_deprovisioner_instance.delete_marked_objects()
         assert User.objects.all().count() == 0
 
+    @pytest.mark.django_db
+    def test_delete_marked_objects_deletes_related_objects(
+        self, marked_user_with_shifts, diff_user_object, test_deprovisioner_instance
+    ):
+        """
+        Test whether the data of the marked user is deleted in chunks (DELETE_CHUNK_SIZE=2)
+        without running the per-Shift receivers, which would create tombstones.
+        """
+        test_deprovisioner_instance.delete_marked_objects()
+
+        assert list(User.objects.all()) == [diff_user_object]
+        assert not Shift.objects.exists()
+        assert not Report.objects.exists()
+        assert not Contract.objects.exists()
+        assert not ShiftTombstone.objects.exists()
+
     @pytest.mark.django_db
     def test_pre_deprovision_deletes_marked_objs(
         self, user_marked_for_deletion, test_deprovisioner_instance
@@ -243,3 +260,72 @@ class TestDeprovisionSteps:
         assert User.objects.all().count() == 1
         test_deprovisioner_instance.pre_deprovision()
         assert User.objects.all().count() == 0
+
+    @pytest.mark.django_db
+    def test_mark_for_deletion_marks_users_in_chunks(
+        self,
+        idm_response_body_for_test_users,
+        test_deprovisioner_instance,
+        django_assert_num_queries,
+    ):
+        """
+        Test whether `mark_for_deletion` marks every returned user while updating at most
+        REQUEST_OBJ_COUNT (2) users per query.
+
+        5 users to mark --> 3 chunks, each one UPDATE wrapped in SAVEPOINT/RELEASE.
+        """
+        with django_assert_num_queries(9):
+            test_deprovisioner_instance.mark_for_deletion(
+                idm_response_body_for_test_users
+            )
+
+        assert User.objects.filter(marked_for_deletion=True).count() == 5
+
+    @pytest.mark.django_db
+    def test_deprovision_streams_response(
+        self,
+        idm_response_body_for_test_users,
+        test_deprovisioner_instance,
+        mock_api,
+    ):
+        mock_api.post(
+            test_deprovisioner_instance.idm_api_url,
+            content=json.dumps(idm_response_body_for_test_users).encode(),
+        )
+
+        test_deprovisioner_instance.deprovision()
+
+        assert mock_api.last_request.json()["params"]["filter"] == [
+            "db.accountstatus=L"
+        ]
+        assert User.objects.filter(marked_for_deletion=True).count() == 5
+        assert test_deprovisioner_instance.update_cnt == 0
+
+    @pytest.mark.django_db
+    def test_deprovision_aborts_on_error_status(
+        self, test_deprovisioner_instance, mock_api
+    ):
+        mock_api.post(
+            test_deprovisioner_instance.idm_api_url,
+            content=b"Service Unavailable",
+            status_code=503,
+        )
+
+        with pytest.raises(requests.HTTPError):
+            test_deprovisioner_instance.deprovision()
+
+        assert not User.objects.filter(marked_for_deletion=True).exists()
+
+    @pytest.mark.django_db
+    def test_deprovision_aborts_without_accounts(
+        self, test_deprovisioner_instance, mock_api
+    ):
+        mock_api.post(
+            test_deprovisioner_instance.idm_api_url,
+            content=json.dumps(
+                {"jsonrpc": "2.0", "id": "1", "error": {"message": "forbidden"}}
+            ).encode(),
+        )
+
+        with pytest.raises(IDMResponseError):
+            test_deprovisioner_instance.deprovision()
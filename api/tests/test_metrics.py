@@ -0,0 +1,141 @@
+"""
+Clock - Master your timesheets
+Copyright (C) 2023  Johann Wolfgang Goethe-Universität Frankfurt am Main
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU Affero General Public License as published by the Free Software Foundation, either version 3 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
+"""
+import json
+from types import SimpleNamespace
+
+import pytest
+from django.conf import settings
+from django.urls import reverse
+from prometheus_client import REGISTRY
+
+from api.metrics import celery_task_postrun, celery_task_prerun
+from project_celery.tasks import deliver_lock_requests
+
+
+def sample_count(name, **labels):
+    """
+    Provide the number of observations of a histogram, 0 if it was never observed.
+    :param name:
+    :param labels:
+    :return:
+    """
+    return REGISTRY.get_sample_value(name + "_count", labels) or 0
+
+
+class TestMetricsEndpoint:
+    @pytest.mark.django_db
+    def test_metrics_endpoint_exposes_histograms(self, client, settings):
+        settings.METRICS_TOKEN = "scrape-token"
+        response = client.get("/metrics", HTTP_AUTHORIZATION="Bearer scrape-token")
+        assert response.status_code == 200
+        content = response.content.decode()
+        for name in (
+            "clock_request_duration_seconds",
+            "clock_pdf_render_duration_seconds",
+            "clock_update_reports_duration_seconds",
+            "clock_celery_task_duration_seconds",
+            "clock_external_call_duration_seconds",
+        ):
+            assert name in content
+
+    @pytest.mark.django_db
+    @pytest.mark.parametrize(
+        "token, authorization",
+        [("", ""), ("", "Bearer "), ("scrape-token", ""), ("scrape-token", "Bearer x")],
+    )
+    def test_metrics_endpoint_requires_token(
+        self, client, settings, token, authorization
+    ):
+        settings.METRICS_TOKEN = token
+        response = client.get("/metrics", HTTP_AUTHORIZATION=authorization)
+        assert response.status_code == 403
+
+    @pytest.mark.django_db
+    def test_request_latency_per_view(self, client, user_object_jwt):
+        labels = {"view": "api:shifts-list", "method": "GET", "status": "200"}
+        before = sample_count("clock_request_duration_seconds", **labels)
+        client.credentials(HTTP_AUTHORIZATION="Bearer {}".format(user_object_jwt))
+        client.get(path=reverse("api:shifts-list"))
+        assert sample_count("clock_request_duration_seconds", **labels) == before + 1
+
+    @pytest.mark.django_db
+    def test_update_reports_duration(self, client, user_object_jwt, valid_shift_json):
+        before = sample_count("clock_update_reports_duration_seconds")
+        client.credentials(HTTP_AUTHORIZATION="Bearer {}".format(user_object_jwt))
+        response = client.post(
+            path=reverse("api:shifts-list"),
+            data=json.dumps(valid_shift_json),
+            content_type="application/json",
+        )
+        assert response.status_code == 201
+        assert sample_count("clock_update_reports_duration_seconds") == before + 1
+
+    @pytest.mark.django_db
+    def test_time_vault_call_duration(
+        self,
+        client,
+        contract_object,
+        shift_object,
+        user_object_jwt,
+        mock_api,
+        aggregated_report_data,
+    ):
+        mock_api.post(
+            f"{settings.TIME_VAULT_URL}/reports/",
+            json=aggregated_report_data,
+            status_code=201,
+        )
+        before = sample_count(
+            "clock_external_call_duration_seconds", service="time_vault"
+        )
+        client.credentials(HTTP_AUTHORIZATION="Bearer {}".format(user_object_jwt))
+        client.post(
+            path=reverse(
+                "api:contracts-lock-shifts",
+                args=[
+                    str(contract_object.id),
+                    shift_object.started.month,
+                    shift_object.started.year,
+                ],
+            ),
+            content_type="application/json",
+        )
+        deliver_lock_requests()
+        assert (
+            sample_count("clock_external_call_duration_seconds", service="time_vault")
+            == before + 1
+        )
+
+
+class TestCeleryTaskMetrics:
+    def test_task_runtime_is_observed(self):
+        task = SimpleNamespace(name="project_celery.tasks.create_reports_monthly")
+        labels = {"task": task.name, "state": "SUCCESS"}
+        before = sample_count("clock_celery_task_duration_seconds", **labels)
+
+        celery_task_prerun(task_id="1", task=task)
+        celery_task_postrun(task_id="1", task=task, state="SUCCESS")
+
+        assert (
+            sample_count("clock_celery_task_duration_seconds", **labels) == before + 1
+        )
+
+    def test_unknown_task_is_ignored(self):
+        task = SimpleNamespace(name="unknown")
+        celery_task_postrun(task_id="2", task=task, state="SUCCESS")
+        assert not sample_count(
+            "clock_celery_task_duration_seconds", task="unknown", state="SUCCESS"
+        )
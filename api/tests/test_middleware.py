@@ -0,0 +1,134 @@
+"""
+Clock - Master your timesheets
+Copyright (C) 2023  Johann Wolfgang Goethe-Universität Frankfurt am Main
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU Affero General Public License as published by the Free Software Foundation, either version 3 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
+"""
+import json
+import logging
+
+import pytest
+from django.test import override_settings
+from django.urls import reverse
+
+from api.instrumentation import RequestMetrics, activate_metrics, timed_section
+
+
+def parse_server_timing(header):
+    """
+    Split a Server-Timing header into a dictionary of metric name to parameters.
+    :param header:
+    :return: Dict
+    """
+    metrics = {}
+    for entry in header.split(", "):
+        name, *params = entry.split(";")
+        metrics[name] = dict(param.split("=", 1) for param in params)
+    return metrics
+
+
+def performance_records(caplog):
+    return [record for record in caplog.records if record.name == "performance"]
+
+
+class TestTimedSection:
+    def test_section_is_added_to_active_metrics(self):
+        metrics = RequestMetrics()
+        with activate_metrics(metrics):
+            with timed_section("pdf"):
+                pass
+            with timed_section("pdf"):
+                pass
+        assert list(metrics.sections) == ["pdf"]
+        assert metrics.sections["pdf"] >= 0
+
+    def test_section_without_active_metrics(self):
+        with timed_section("pdf"):
+            pass
+
+
+class TestRequestTimingMiddleware:
+    @pytest.mark.django_db
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=1.0)
+    def test_sampled_request_has_server_timing(
+        self, client, user_object, user_object_jwt, valid_shift_json
+    ):
+        """
+        Test that creating a Shift reports the queries and the time spent in the
+        update of the Reports triggered by the signal to staff users.
+        :param client:
+        :param user_object:
+        :param user_object_jwt:
+        :param valid_shift_json:
+        :return:
+        """
+        user_object.is_staff = True
+        user_object.save()
+        client.credentials(HTTP_AUTHORIZATION="Bearer {}".format(user_object_jwt))
+        response = client.post(
+            path=reverse("api:shifts-list"),
+            data=json.dumps(valid_shift_json),
+            content_type="application/json",
+        )
+        assert response.status_code == 201
+
+        server_timing = parse_server_timing(response["Server-Timing"])
+        assert {"db", "serialize", "update_reports", "total"} <= set(server_timing)
+        assert int(server_timing["db"]["desc"].strip('"').split()[0]) > 0
+
+    @pytest.mark.django_db
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=1.0, DEBUG=False)
+    def test_server_timing_is_hidden_from_other_users(self, client, user_object_jwt):
+        client.credentials(HTTP_AUTHORIZATION="Bearer {}".format(user_object_jwt))
+        response = client.get(path=reverse("api:shifts-list"))
+
+        assert response.status_code == 200
+        assert "Server-Timing" not in response
+
+    @pytest.mark.django_db
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=1.0)
+    def test_sampled_request_is_logged(self, client, user_object_jwt, caplog):
+        client.credentials(HTTP_AUTHORIZATION="Bearer {}".format(user_object_jwt))
+        with caplog.at_level(logging.INFO, logger="performance"):
+            response = client.get(path=reverse("api:shifts-list"))
+
+        record = json.loads(performance_records(caplog)[-1].getMessage())
+        assert record["view"] == "api:shifts-list"
+        assert record["status"] == 200
+        assert record["queries"] > 0
+        assert record["response_bytes"] == len(response.content)
+
+    @pytest.mark.django_db
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=0.0)
+    def test_unsampled_request_is_not_instrumented(
+        self, client, user_object_jwt, caplog
+    ):
+        client.credentials(HTTP_AUTHORIZATION="Bearer {}".format(user_object_jwt))
+        with caplog.at_level(logging.INFO, logger="performance"):
+            response = client.get(path=reverse("api:shifts-list"))
+
+        assert "Server-Timing" not in response
+        assert not performance_records(caplog)
+
+    @pytest.mark.django_db
+    @override_settings(
+        REQUEST_TIMING_SAMPLE_RATE=0.0, REQUEST_TIMING_SLOW_THRESHOLD_MS=0
+    )
+    def test_slow_request_is_always_logged(self, client, user_object_jwt, caplog):
+        client.credentials(HTTP_AUTHORIZATION="Bearer {}".format(user_object_jwt))
+        with caplog.at_level(logging.INFO, logger="performance"):
+            client.get(path=reverse("api:shifts-list"))
+
+        assert performance_records(caplog)[-1].levelno == logging.WARNING
+        record = json.loads(performance_records(caplog)[-1].getMessage())
+        assert record["view"] == "api:shifts-list"
+        assert "queries" not in record
@@ -0,0 +1,182 @@
+"""
+Clock - Master your timesheets
+Copyright (C) 2023  Johann Wolfgang Goethe-Universität Frankfurt am Main
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU Affero General Public License as published by the Free Software Foundation, either version 3 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
+"""
+import json
+from html.parser import HTMLParser
+from pathlib import Path
+
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+
+from api.pdf import (
+    RENDER_SLOT_LOCK_ID,
+    STUNDENZETTEL_TEMPLATE,
+    STUNDENZETTEL_VERSION,
+    NativeStundenzettelRenderer,
+    PDFRenderer,
+    RenderSlotUnavailable,
+    WeasyprintRenderer,
+    acquire_render_slot,
+    get_pdf_renderer,
+    release_render_slot,
+    render_slot,
+)
+
+GOLDEN_DIR = Path(__file__).parent / "golden"
+
+
+def load_golden(name):
+    with open(GOLDEN_DIR / name, encoding="utf-8") as golden_file:
+        return json.load(golden_file)
+
+
+class TextCollector(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.texts = []
+        self.skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("style", "svg"):
+            self.skip += 1
+
+    def handle_endtag(self, tag):
+        if tag in ("style", "svg"):
+            self.skip -= 1
+
+    def handle_data(self, data):
+        text = " ".join(data.split())
+        if text and not self.skip:
+            self.texts.append(text)
+
+
+def is_subsequence(expected, texts):
+    remaining = iter(texts)
+    return all(any(text == value for text in remaining) for value in expected)
+
+
+@pytest.fixture
+def golden_content():
+    return load_golden("stundenzettel_content.json")
+
+
+@pytest.fixture
+def golden_fields():
+    return load_golden("stundenzettel_fields.json")
+
+
+@pytest.fixture
+def native_renderer():
+    pytest.importorskip("fpdf")
+    return NativeStundenzettelRenderer()
+
+
+class TestPDFRenderers:
+    def test_weasyprint_html_contains_golden_fields(
+        self, golden_content, golden_fields
+    ):
+        html = WeasyprintRenderer().render_html(STUNDENZETTEL_TEMPLATE, golden_content)
+        collector = TextCollector()
+        collector.feed(html)
+        assert is_subsequence(golden_fields, collector.texts)
+        assert f"Stand: {STUNDENZETTEL_VERSION}" in collector.texts
+
+    def test_native_layout_contains_golden_fields(
+        self, native_renderer, golden_content, golden_fields
+    ):
+        texts = [item.text for item in native_renderer.get_text_items(golden_content)]
+        assert is_subsequence(golden_fields, texts)
+        assert f"Stand: {STUNDENZETTEL_VERSION}" in texts
+
+    def test_native_renders_pdf(self, native_renderer, golden_content):
+        pdf = native_renderer.render(
+            STUNDENZETTEL_TEMPLATE, golden_content, base_url=None
+        )
+        assert pdf.startswith(b"%PDF")
+
+    def test_native_rejects_other_templates(self, native_renderer, golden_content):
+        with pytest.raises(ImproperlyConfigured):
+            native_renderer.render("api/other.html", golden_content, base_url=None)
+
+    def test_renderer_must_implement_render(self):
+        with pytest.raises(TypeError):
+            PDFRenderer()
+
+    @pytest.mark.parametrize(
+        "setting, renderer_class",
+        [("weasyprint", WeasyprintRenderer), ("native", NativeStundenzettelRenderer)],
+    )
+    def test_get_pdf_renderer(self, settings, setting, renderer_class):
+        if setting == "native":
+            pytest.importorskip("fpdf")
+        settings.PDF_RENDERER = setting
+        assert isinstance(get_pdf_renderer(), renderer_class)
+
+    def test_get_pdf_renderer_unknown_backend(self, settings):
+        settings.PDF_RENDERER = "unknown"
+        with pytest.raises(ImproperlyConfigured):
+            get_pdf_renderer()
+
+
+@pytest.fixture
+def other_connection():
+    """
+    A second database session, e.g. of another gunicorn worker.
+    """
+    other = connections.create_connection("default")
+    yield other
+    other.close()
+
+
+def hold_slots(other_connection, slots):
+    with other_connection.cursor() as cursor:
+        for slot in slots:
+            cursor.execute(
+                "SELECT pg_advisory_lock(%s, %s)", [RENDER_SLOT_LOCK_ID, slot]
+            )
+
+
+class TestRenderSlot:
+    @pytest.mark.django_db
+    def test_free_slot_is_taken_and_released(self, settings, other_connection):
+        settings.PDF_RENDER_SLOTS = 1
+        with render_slot():
+            with other_connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT pg_try_advisory_lock(%s, 0)", [RENDER_SLOT_LOCK_ID]
+                )
+                slot_was_free = cursor.fetchone()[0]
+        assert not slot_was_free
+        slot = acquire_render_slot()
+        release_render_slot(slot)
+        assert slot == 0
+
+    @pytest.mark.django_db
+    def test_next_free_slot_is_taken(self, settings, other_connection):
+        settings.PDF_RENDER_SLOTS = 2
+        hold_slots(other_connection, [0])
+        slot = acquire_render_slot()
+        release_render_slot(slot)
+        assert slot == 1
+
+    @pytest.mark.django_db
+    def test_busy_slots_raise_after_waiting(self, settings, other_connection):
+        settings.PDF_RENDER_SLOTS = 2
+        settings.PDF_RENDER_MAX_WAIT_SECONDS = 0.2
+        hold_slots(other_connection, [0, 1])
+        with pytest.raises(RenderSlotUnavailable):
+            with render_slot():
+                pass
@@ -0,0 +1,146 @@
+"""
+Clock - Master your timesheets
+Copyright (C) 2023  Johann Wolfgang Goethe-Universität Frankfurt am Main
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU Affero General Public License as published by the Free Software Foundation, either version 3 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
+"""
+import pytest
+from django.db import connection
+from django.utils import timezone
+
+from api.models import LockRequest, Shift
+from api.time_vault import (
+    CircuitBreaker,
+    TimeVaultClient,
+    TimeVaultUnavailable,
+    claim_lock_requests,
+    deliver_lock_requests,
+    get_time_vault_client,
+)
+
+
+class TestTimeVaultClient:
+    def test_get_is_retried_on_server_error(self, time_vault_stub):
+        time_vault_stub.responses = [(503, {}, 0), (200, {"reports": []}, 0)]
+
+        response = get_time_vault_client().retrieve_reports(1, 2023, ["a", "b"])
+
+        assert response.json() == {"reports": []}
+        assert (
+            time_vault_stub.requests
+            == [("GET", "/retrieve/1/2023?references=a&references=b")] * 2
+        )
+
+    def test_post_is_not_retried_on_server_error(self, time_vault_stub):
+        time_vault_stub.responses = [(503, {}, 0), (201, {}, 0)]
+
+        response = get_time_vault_client().post_report({})
+
+        assert response.status_code == 503
+        assert len(time_vault_stub.requests) == 1
+
+    def test_timeout_raises_unavailable(self, time_vault_stub):
+        time_vault_stub.responses = [(201, {}, 0.5)]
+        client = TimeVaultClient(timeout=(1, 0.1), retries=0)
+
+        with pytest.raises(TimeVaultUnavailable):
+            client.post_report({})
+
+    def test_connection_error_raises_unavailable(self):
+        # Nothing listens on the discard port.
+        client = TimeVaultClient(base_url="http://127.0.0.1:9", retries=0)
+
+        with pytest.raises(TimeVaultUnavailable):
+            client.post_report({})
+
+    def test_circuit_breaker_opens(self, time_vault_stub):
+        time_vault_stub.responses = [(500, {}, 0)]
+        client = TimeVaultClient(retries=0, breaker=CircuitBreaker(2, 60))
+
+        client.post_report({})
+        client.post_report({})
+        with pytest.raises(TimeVaultUnavailable):
+            client.post_report({})
+
+        assert len(time_vault_stub.requests) == 2
+
+    def test_circuit_breaker_half_open(self, time_vault_stub):
+        time_vault_stub.responses = [(500, {}, 0), (201, {}, 0)]
+        breaker = CircuitBreaker(1, 0)
+        client = TimeVaultClient(retries=0, breaker=breaker)
+
+        client.post_report({})
+        assert breaker.opened_at is not None
+
+        assert client.post_report({}).status_code == 201
+        assert breaker.opened_at is None
+
+
+class TestLockRequestDelivery:
+    @pytest.mark.django_db
+    def test_claimed_lock_requests_are_skipped(self, lock_request_object):
+        assert claim_lock_requests(10) == [lock_request_object]
+        assert claim_lock_requests(10) == []
+
+        lock_request_object.refresh_from_db()
+        assert lock_request_object.status == LockRequest.PENDING
+        assert lock_request_object.next_attempt_at > timezone.now()
+
+    @pytest.mark.django_db
+    def test_report_is_sent_without_row_lock(
+        self, lock_request_object, time_vault_stub, monkeypatch
+    ):
+        """
+        Test that the claim is committed before the report is sent.
+        """
+        atomic_depths = []
+        post_report = TimeVaultClient.post_report
+
+        def record_atomic_depth(client, payload):
+            atomic_depths.append(len(connection.savepoint_ids))
+            return post_report(client, payload)
+
+        monkeypatch.setattr(TimeVaultClient, "post_report", record_atomic_depth)
+        time_vault_stub.responses = [(201, {}, 0)]
+
+        test_depth = len(connection.savepoint_ids)
+        deliver_lock_requests()
+
+        # Only the transactions of the test itself are open.
+        assert atomic_depths == [test_depth]
+
+    @pytest.mark.django_db
+    def test_timeout_keeps_lock_request_pending(
+        self, shift_object, lock_request_object, time_vault_stub, settings
+    ):
+        time_vault_stub.responses = [(201, {}, 0.5)]
+        settings.TIME_VAULT_READ_TIMEOUT = 0.1
+
+        deliver_lock_requests()
+
+        lock_request_object.refresh_from_db()
+        assert lock_request_object.status == LockRequest.PENDING
+        assert lock_request_object.attempts == 1
+        assert lock_request_object.next_attempt_at > lock_request_object.created_at
+        assert not Shift.objects.get(pk=shift_object.pk).locked
+
+    @pytest.mark.django_db
+    def test_last_attempt_fails_lock_request(
+        self, shift_object, lock_request_object, time_vault_stub, settings
+    ):
+        time_vault_stub.responses = [(503, {}, 0)]
+        settings.LOCK_REQUEST_MAX_ATTEMPTS = 1
+
+        deliver_lock_requests()
+
+        lock_request_object.refresh_from_db()
+        assert lock_request_object.status == LockRequest.FAILED
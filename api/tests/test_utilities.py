@@ -16,11 +16,20 @@ along with this program.  If not, see <https://github.com/ClockGU/clock-backend/
 import datetime
 
 import pytest
+from dateutil.relativedelta import relativedelta
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from freezegun import freeze_time
 from pytz import utc
 
-from api.models import Contract, Report, Shift
-from api.utilities import relativedelta_to_string
+from api.models import Contract, ExportSnapshot, Report, Shift, ShiftTombstone
+from api.utilities import (
+    relativedelta_to_string,
+    suspend_report_signals,
+    unlock_shifts,
+    update_reports,
+)
+from project_celery.tasks import purge_shift_tombstones_daily
 
 
 def test_relativedelta_to_string_positive_delta(positive_relativedelta_object):
@@ -483,11 +492,90 @@ class TestUpdateSignals:
             contract=contract_210h_carryover, month_year=datetime.date(2019, 1, 1)
         ).carryover == datetime.timedelta(minutes=12600 + 3 * 60 - 1200)
 
+    @freeze_time("2020-02-15")
+    @pytest.mark.django_db
+    def test_signal_moves_worktime_between_months(
+        self, contract_ending_in_february, user_object, create_n_shift_objects
+    ):
+        shift = create_n_shift_objects((1,), user_object, contract_ending_in_february)[
+            0
+        ]
+        shift.started = datetime.datetime(2019, 2, 4, 10, tzinfo=utc)
+        shift.stopped = datetime.datetime(2019, 2, 4, 17, tzinfo=utc)
+        shift.save()
+
+        reports = Report.objects.filter(contract=contract_ending_in_february)
+        assert {report.month_year: report.worktime for report in reports} == {
+            datetime.date(2019, 1, 1): datetime.timedelta(0),
+            # 7 hours without break --> 30 minutes are subtracted
+            datetime.date(2019, 2, 1): datetime.timedelta(minutes=390),
+        }
+
+    @pytest.mark.django_db
+    def test_signal_delta_matches_full_update(
+        self, report_object, contract_object, user_object, create_n_shift_objects
+    ):
+        shifts = create_n_shift_objects((3,), user_object, contract_object)
+        create_n_shift_objects(
+            (1,), user_object, contract_object, type="vn", was_reviewed=False
+        )
+        shifts[0].type = "vn"
+        shifts[0].save()
+        shifts[1].was_reviewed = False
+        shifts[1].save()
+        shifts[2].delete()
+        report_object.refresh_from_db()
+
+        update_reports(contract_object, report_object.month_year)
+
+        updated = Report.objects.get(pk=report_object.pk)
+        assert (report_object.worktime, report_object.vacation_time) == (
+            updated.worktime,
+            updated.vacation_time,
+        )
+        assert report_object.vacation_time == datetime.timedelta(minutes=120)
+
+    @pytest.mark.freeze_time("2020-02-15")
+    @pytest.mark.django_db
+    def test_unchanged_time_keeps_later_reports(
+        self, contract_ending_in_february, user_object, create_n_shift_objects, freezer
+    ):
+        shift = create_n_shift_objects((1,), user_object, contract_ending_in_february)[
+            0
+        ]
+        before = dict(
+            Report.objects.filter(contract=contract_ending_in_february).values_list(
+                "month_year", "modified_at"
+            )
+        )
+        freezer.move_to("2020-02-16")
+        shift.note = "only the note changed"
+        shift.save()
+
+        after = dict(
+            Report.objects.filter(contract=contract_ending_in_february).values_list(
+                "month_year", "modified_at"
+            )
+        )
+        assert after == before
+
+    @pytest.mark.django_db
+    def test_save_locks_the_report(
+        self, report_object, contract_object, user_object, create_n_shift_objects
+    ):
+        with CaptureQueriesContext(connection) as context:
+            create_n_shift_objects((1,), user_object, contract_object)
+
+        assert any(
+            '"api_report"' in query["sql"] and "FOR UPDATE" in query["sql"]
+            for query in context.captured_queries
+        )
+
 
 class TestContractSignals:
     @pytest.mark.django_db
     def test_update_last_used(self, user_object, contract_object, freezer):
-        time_stamp = datetime.datetime(2019, 2, 15, 1, 0, 0)
+        time_stamp = datetime.datetime(2019, 2, 15, 1, 0, 0, tzinfo=utc)
         assert contract_object.last_used != time_stamp
         freezer.move_to(time_stamp)
         Shift.objects.create(
@@ -504,3 +592,172 @@ class TestContractSignals:
             was_reviewed=False,
         )
         assert contract_object.last_used == time_stamp
+
+        contract_object.refresh_from_db()
+        assert contract_object.last_used == time_stamp
+
+    @pytest.mark.django_db
+    def test_update_last_used_is_debounced(
+        self, user_object, contract_object, create_n_shift_objects, freezer, settings
+    ):
+        settings.CONTRACT_LAST_USED_DEBOUNCE_MINUTES = 5
+        freezer.move_to("2019-02-15 01:00:00")
+        create_n_shift_objects((1,), user_object, contract_object)
+        modified_at = Contract.objects.get(pk=contract_object.pk).modified_at
+
+        freezer.move_to("2019-02-15 01:04:00")
+        create_n_shift_objects((1,), user_object, contract_object)
+        contract_object.refresh_from_db()
+        assert contract_object.last_used == datetime.datetime(
+            2019, 2, 15, 1, tzinfo=utc
+        )
+
+        freezer.move_to("2019-02-15 01:06:00")
+        create_n_shift_objects((1,), user_object, contract_object)
+        contract_object.refresh_from_db()
+        assert contract_object.last_used == datetime.datetime(
+            2019, 2, 15, 1, 6, tzinfo=utc
+        )
+        assert contract_object.modified_at == modified_at
+
+
+class TestShiftTombstones:
+    @pytest.mark.django_db
+    def test_delete_creates_tombstone(self, shift_object):
+        shift_id = shift_object.id
+        shift_object.delete()
+
+        tombstone = ShiftTombstone.objects.get(shift_id=shift_id)
+        assert tombstone.user_id == shift_object.user_id
+        assert tombstone.contract_id == shift_object.contract_id
+
+    @pytest.mark.django_db
+    def test_purge_removes_expired_tombstones(self, shift_object, freezer):
+        freezer.move_to("2019-01-01")
+        shift_object.delete()
+        freezer.move_to("2019-06-01")
+
+        purge_shift_tombstones_daily()
+
+        assert not ShiftTombstone.objects.exists()
+
+
+class TestSuspendReportSignals:
+    @pytest.mark.django_db
+    def test_reports_are_updated_once_on_exit(
+        self,
+        report_object,
+        contract_object,
+        user_object,
+        create_n_shift_objects,
+    ):
+        with suspend_report_signals():
+            create_n_shift_objects((3,), user_object, contract_object)
+            report_object.refresh_from_db()
+            assert report_object.worktime == datetime.timedelta(0)
+
+        report_object.refresh_from_db()
+        contract_object.refresh_from_db()
+        assert report_object.worktime == datetime.timedelta(minutes=360)
+        assert contract_object.last_used is not None
+
+    @pytest.mark.django_db
+    def test_nested_blocks_join_the_outermost(
+        self, report_object, contract_object, user_object, create_n_shift_objects
+    ):
+        with suspend_report_signals() as outer:
+            with suspend_report_signals() as inner:
+                create_n_shift_objects((1,), user_object, contract_object)
+            assert inner is outer
+            report_object.refresh_from_db()
+            assert report_object.worktime == datetime.timedelta(0)
+
+        report_object.refresh_from_db()
+        assert report_object.worktime == datetime.timedelta(minutes=120)
+
+    @freeze_time("2020-02-15")
+    @pytest.mark.django_db
+    def test_moved_shift_updates_both_months_on_exit(
+        self, contract_ending_in_february, user_object, create_n_shift_objects
+    ):
+        shift = create_n_shift_objects((1,), user_object, contract_ending_in_february)[
+            0
+        ]
+        with suspend_report_signals():
+            shift.started = datetime.datetime(2019, 2, 4, 10, tzinfo=utc)
+            shift.stopped = datetime.datetime(2019, 2, 4, 17, tzinfo=utc)
+            shift.save()
+
+        reports = Report.objects.filter(contract=contract_ending_in_february)
+        assert {report.month_year: report.worktime for report in reports} == {
+            datetime.date(2019, 1, 1): datetime.timedelta(0),
+            datetime.date(2019, 2, 1): datetime.timedelta(minutes=390),
+        }
+
+    @pytest.mark.django_db
+    def test_created_contract_gets_reports_on_exit(
+        self, user_object, create_n_contract_objects
+    ):
+        with suspend_report_signals():
+            contract = create_n_contract_objects((1,), user_object)[0]
+            assert not Report.objects.filter(contract=contract).exists()
+
+        assert Report.objects.filter(contract=contract).exists()
+
+    @pytest.mark.django_db
+    def test_without_recompute_nothing_is_recomputed(
+        self, report_object, contract_object, user_object, create_n_shift_objects
+    ):
+        with suspend_report_signals(recompute=False):
+            shift = create_n_shift_objects((1,), user_object, contract_object)[0]
+            shift.delete()
+
+        report_object.refresh_from_db()
+        assert report_object.worktime == datetime.timedelta(0)
+        assert not ShiftTombstone.objects.exists()
+
+    @pytest.mark.django_db
+    def test_without_recompute_delete_reads_no_shift(self, shift_object):
+        with suspend_report_signals(recompute=False):
+            with CaptureQueriesContext(connection) as context:
+                shift_object.delete()
+
+        assert not any(
+            query["sql"].startswith("SELECT") and 'FROM "api_shift"' in query["sql"]
+            for query in context.captured_queries
+        )
+
+    def test_recompute_cannot_be_nested_without_recompute(self):
+        with suspend_report_signals(recompute=False) as outer:
+            with suspend_report_signals(recompute=False) as inner:
+                assert inner is outer
+            with pytest.raises(RuntimeError):
+                with suspend_report_signals():
+                    pass
+
+
+class TestUnlockShifts:
+    @pytest.mark.django_db
+    def test_export_snapshot_of_unlocked_month_is_deleted(
+        self, contract_object, shift_object, aggregated_report_data
+    ):
+        unlocked_month = Report.objects.get(
+            contract=contract_object,
+            month_year=shift_object.started.date().replace(day=1),
+        )
+        other_month = Report.objects.create(
+            contract=contract_object,
+            user=contract_object.user,
+            month_year=unlocked_month.month_year + relativedelta(months=1),
+            worktime=datetime.timedelta(0),
+            created_by=contract_object.user,
+            modified_by=contract_object.user,
+        )
+        for report in (unlocked_month, other_month):
+            ExportSnapshot.objects.create(report=report, content=aggregated_report_data)
+
+        unlock_shifts(Shift.objects.filter(pk=shift_object.pk))
+
+        assert list(ExportSnapshot.objects.values_list("report", flat=True)) == [
+            other_month.pk
+        ]
@@ -14,17 +14,32 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
 """
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import pytest
 from dateutil.parser import parse
 from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 from freezegun import freeze_time
 from rest_framework import serializers, status
 
-from api.models import Contract, Report, Shift, User
+from api.models import Contract, ExportSnapshot, LockRequest, Report, Shift, User
+from api.views import ReportViewSet
+from project_celery.tasks import deliver_lock_requests
+
+
+def first_query_index(queries, *fragments):
+    """
+    Index of the first captured query containing all fragments.
+    """
+    return next(
+        index
+        for index, query in enumerate(queries)
+        if all(fragment in query["sql"] for fragment in fragments)
+    )
 
 
 class TestContractApiEndpoint:
@@ -349,7 +364,12 @@ class TestContractApiEndpoint:
         user_object_jwt,
         mock_api,
         aggregated_report_data,
+        django_capture_on_commit_callbacks,
     ):
+        """
+        Test that locking a month is accepted with 202 and the Shifts are locked once
+        the LockRequest was delivered to time-vault.
+        """
         mock_api.post(
             f"{settings.TIME_VAULT_URL}/reports/",
             json=aggregated_report_data,
@@ -357,20 +377,127 @@ class TestContractApiEndpoint:
         )
         assert not shift_object.locked
         client.credentials(HTTP_AUTHORIZATION="Bearer {}".format(user_object_jwt))
-        response = client.post(
-            path=reverse(
-                "api:contracts-lock-shifts",
-                args=[
-                    str(contract_object.id),
-                    shift_object.started.month,
-                    shift_object.started.year,
-                ],
-            ),
-            content_type="application/json",
+        with django_capture_on_commit_callbacks() as callbacks:
+            response = client.post(
+                path=reverse(
+                    "api:contracts-lock-shifts",
+                    args=[
+                        str(contract_object.id),
+                        shift_object.started.month,
+                        shift_object.started.year,
+                    ],
+                ),
+                content_type="application/json",
+            )
+        assert response.status_code == 202
+        assert response.json()["status"] == LockRequest.PENDING
+        assert len(callbacks) == 1
+        assert not mock_api.called
+        assert not Shift.objects.get(pk=shift_object.pk).locked
+
+        deliver_lock_requests()
+
+        assert Shift.objects.get(pk=shift_object.pk).locked
+        status_response = client.get(path=response["Location"])
+        assert status_response.json()["status"] == LockRequest.DELIVERED
+
+    @pytest.mark.django_db
+    def test_locking_shifts_is_idempotent_while_pending(
+        self, client, contract_object, shift_object, user_object_jwt
+    ):
+        client.credentials(HTTP_AUTHORIZATION="Bearer {}".format(user_object_jwt))
+        path = reverse(
+            "api:contracts-lock-shifts",
+            args=[
+                str(contract_object.id),
+                shift_object.started.month,
+                shift_object.started.year,
+            ],
         )
-        assert response.status_code == 200
+        first = client.post(path=path, content_type="application/json")
+        second = client.post(path=path, content_type="application/json")
+
+        assert first.json()["id"] == second.json()["id"]
+        assert LockRequest.objects.count() == 1
+
+    @pytest.mark.django_db
+    def test_locking_shifts_locks_the_report_first(
+        self, client, contract_object, shift_object, user_object_jwt
+    ):
+        client.credentials(HTTP_AUTHORIZATION="Bearer {}".format(user_object_jwt))
+        path = reverse(
+            "api:contracts-lock-shifts",
+            args=[
+                str(contract_object.id),
+                shift_object.started.month,
+                shift_object.started.year,
+            ],
+        )
+        with CaptureQueriesContext(connection) as context:
+            client.post(path=path, content_type="application/json")
+
+        queries = context.captured_queries
+        assert first_query_index(
+            queries, 'FROM "api_report"', "FOR UPDATE"
+        ) < first_query_index(queries, 'INSERT INTO "api_lockrequest"')
+
+    @pytest.mark.django_db
+    def test_lock_request_delivery_is_retried(
+        self, contract_object, shift_object, lock_request_object, mock_api
+    ):
+        mock_api.post(
+            f"{settings.TIME_VAULT_URL}/reports/",
+            [{"status_code": 502}, {"status_code": 201}],
+        )
+        deliver_lock_requests()
+
+        lock_request_object.refresh_from_db()
+        assert lock_request_object.status == LockRequest.PENDING
+        assert lock_request_object.attempts == 1
+        assert not Shift.objects.get(pk=shift_object.pk).locked
+
+        LockRequest.objects.update(next_attempt_at=lock_request_object.created_at)
+        deliver_lock_requests()
+
+        lock_request_object.refresh_from_db()
+        assert lock_request_object.status == LockRequest.DELIVERED
         assert Shift.objects.get(pk=shift_object.pk).locked
 
+    @pytest.mark.django_db
+    def test_lock_request_rejected_by_time_vault(
+        self, contract_object, shift_object, lock_request_object, mock_api
+    ):
+        mock_api.post(
+            f"{settings.TIME_VAULT_URL}/reports/",
+            status_code=400,
+            text="invalid report",
+        )
+        deliver_lock_requests()
+
+        lock_request_object.refresh_from_db()
+        assert lock_request_object.status == LockRequest.FAILED
+        assert lock_request_object.last_error == "invalid report"
+        assert not Shift.objects.get(pk=shift_object.pk).locked
+
+    @pytest.mark.django_db
+    def test_delivered_lock_request_creates_export_snapshot(
+        self, contract_object, shift_object, lock_request_object, mock_api
+    ):
+        mock_api.post(f"{settings.TIME_VAULT_URL}/reports/", status_code=201)
+        deliver_lock_requests()
+
+        snapshot = ExportSnapshot.objects.get(
+            report__contract=contract_object,
+            report__month_year=lock_request_object.month_year,
+        )
+        # The snapshot is taken from the locked Shifts.
+        locked_content = ReportViewSet().aggregate_export_content(
+            snapshot.report, with_calendar_rows=False, validate=False
+        )
+        assert snapshot.content == json.loads(json.dumps(locked_content))
+        assert snapshot.content["days_content"]
+        assert snapshot.pdf is None
+
     @pytest.mark.django_db
     def test_locking_shifts_without_personal_number(
         self, client, contract_object, shift_object, user_object_jwt, user_object
@@ -584,6 +711,119 @@ class TestShiftApiEndpoint:
         print(json.loads(response.content))
         assert response.status_code == 403
 
+    @pytest.mark.django_db
+    def test_shift_of_month_being_locked_cannot_be_changed(
+        self,
+        client,
+        user_object_jwt,
+        shift_object,
+        lock_request_object,
+        patch_empty_tags_json,
+    ):
+        client.credentials(HTTP_AUTHORIZATION="Bearer {}".format(user_object_jwt))
+        path = reverse("api:shifts-detail", args=[shift_object.id])
+        patched = client.patch(
+            path=path,
+            data=json.dumps(patch_empty_tags_json),
+            content_type="application/json",
+        )
+        deleted = client.delete(path=path)
+
+        assert patched.status_code == 403
+        assert deleted.status_code == 403
+        assert Shift.objects.filter(pk=shift_object.pk).exists()
+
+        lock_request_object.status = LockRequest.FAILED
+        lock_request_object.save()
+        assert client.delete(path=path).status_code == 204
+
+    @pytest.mark.django_db
+    def test_pending_lock_check_holds_the_report_lock(
+        self,
+        client,
+        user_object_jwt,
+        shift_object,
+        report_object,
+        patch_empty_tags_json,
+    ):
+        client.credentials(HTTP_AUTHORIZATION="Bearer {}".format(user_object_jwt))
+        with CaptureQueriesContext(connection) as context:
+            response = client.patch(
+                path=reverse("api:shifts-detail", args=[shift_object.id]),
+                data=json.dumps(patch_empty_tags_json),
+                content_type="application/json",
+            )
+
+        assert response.status_code == 200
+        queries = context.captured_queries
+        assert first_query_index(
+            queries, 'FROM "api_report"', "FOR UPDATE"
+        ) < first_query_index(queries, 'FROM "api_lockrequest"')
+
+
+class TestShiftChangesEndpoint:
+    @pytest.mark.django_db
+    def test_without_token_returns_all_shifts(
+        self, client, user_object_jwt, shift_object
+    ):
+        client.credentials(HTTP_AUTHORIZATION="Bearer {}".format(user_object_jwt))
+        response = client.get(path=reverse("api:shifts-changes"))
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["reset"]
+        assert [shift["id"] for shift in data["changed"]] == [str(shift_object.id)]
+        assert data["deleted"] == []
+
+    @pytest.mark.django_db
+    def test_returns_changes_and_deletions_since_token(
+        self,
+        client,
+        create_n_shift_objects,
+        user_object,
+        contract_object,
+        freezer,
+    ):
+        freezer.move_to("2019-02-01 10:00:00")
+        unchanged, changed, deleted = create_n_shift_objects(
+            (3,), user_object, contract_object
+        )
+        # The JWT would not be valid at the frozen times.
+        client.force_authenticate(user=user_object)
+        freezer.move_to("2019-02-01 10:30:00")
+        token = client.get(path=reverse("api:shifts-changes")).json()["token"]
+
+        freezer.move_to("2019-02-01 11:00:00")
+        changed.note = "changed"
+        changed.save()
+        deleted_id = deleted.id
+        deleted.delete()
+
+        response = client.get(path=reverse("api:shifts-changes"), data={"since": token})
+        data = response.json()
+        assert not data["reset"]
+        assert [shift["id"] for shift in data["changed"]] == [str(changed.id)]
+        assert data["deleted"] == [str(deleted_id)]
+
+    @pytest.mark.django_db
+    def test_expired_token_resets(self, client, user_object, shift_object, freezer):
+        freezer.move_to("2019-02-01")
+        client.force_authenticate(user=user_object)
+        token = client.get(path=reverse("api:shifts-changes")).json()["token"]
+
+        freezer.move_to("2019-06-01")
+        response = client.get(path=reverse("api:shifts-changes"), data={"since": token})
+        assert response.json()["reset"]
+        assert len(response.json()["changed"]) == 1
+
+    @pytest.mark.django_db
+    def test_invalid_token(self, client, user_object_jwt):
+        client.credentials(HTTP_AUTHORIZATION="Bearer {}".format(user_object_jwt))
+        response = client.get(
+            path=reverse("api:shifts-changes"), data={"since": "yesterday"}
+        )
+        assert response.status_code == 400
+
 
 class TestClockedInShiftEndpoint:
     @pytest.mark.django_db
@@ -756,6 +996,27 @@ class TestReportApiEndpoint:
         assert content["26.01.2019"]["worktime"] == "06:00"
         assert content["26.01.2019"]["breaktime"] == "02:00"
 
+    @pytest.mark.django_db
+    def test_aggregate_calendar_rows_contains_every_day(
+        self,
+        prepared_ReportViewSet_view,
+        shift_content_aggregation_merges_shifts,
+        report_object,
+    ):
+        days_content = prepared_ReportViewSet_view.aggregate_days_content(
+            shift_content_aggregation_merges_shifts
+        )
+        rows = prepared_ReportViewSet_view.aggregate_calendar_rows(
+            report_object.month_year, days_content
+        )
+
+        assert [row["date"] for row in rows] == [
+            "{:02d}.01.".format(day) for day in range(1, 32)
+        ]
+        assert rows[25] == {"date": "26.01.", **days_content["26.01.2019"]}
+        assert rows[0]["started"] == "\xa0"
+        assert rows[0]["notes"] == "\xa0"
+
     @pytest.mark.django_db
     def test_aggregate_shift_content_handles_vacation_shifts(
         self, prepared_ReportViewSet_view, two_vacation_shifts
@@ -825,6 +1086,61 @@ class TestReportApiEndpoint:
 
         assert response.status_code == 200
 
+    @pytest.mark.django_db
+    def test_export_endpoint_is_throttled_without_render_slot(
+        self, settings, report_object, client, user_object_jwt
+    ):
+        """
+        Test that an export which does not get a render slot is rejected quickly.
+        """
+        settings.PDF_RENDER_SLOTS = 0
+        settings.PDF_RENDER_MAX_WAIT_SECONDS = 0
+        settings.PDF_RENDER_RETRY_AFTER_SECONDS = 7
+        client.credentials(HTTP_AUTHORIZATION="Bearer {}".format(user_object_jwt))
+        response = client.get(
+            path=reverse("api:reports-export", args=[report_object.pk])
+        )
+
+        assert response.status_code == 429
+        assert response["Retry-After"] == "7"
+
+    @pytest.mark.django_db
+    def test_export_endpoint_serves_snapshot(
+        self,
+        report_object,
+        aggregated_report_data,
+        client,
+        user_object_jwt,
+        monkeypatch,
+    ):
+        """
+        Test that a locked month is exported from its ExportSnapshot and the PDF is
+        rendered only once.
+        """
+        snapshot = ExportSnapshot.objects.create(
+            report=report_object, content=aggregated_report_data
+        )
+        monkeypatch.setattr(
+            ReportViewSet,
+            "aggregate_export_content",
+            lambda *args, **kwargs: pytest.fail("Shifts were aggregated."),
+        )
+        client.credentials(HTTP_AUTHORIZATION="Bearer {}".format(user_object_jwt))
+        path = reverse("api:reports-export", args=[report_object.pk])
+
+        first = client.get(path=path)
+        snapshot.refresh_from_db()
+        assert first.status_code == 200
+        assert bytes(snapshot.pdf) == first.content
+
+        monkeypatch.setattr(
+            ReportViewSet,
+            "compile_pdf",
+            lambda *args, **kwargs: pytest.fail("The PDF was rendered again."),
+        )
+        second = client.get(path=path)
+        assert second.content == first.content
+
     @pytest.mark.django_db
     def test_export_endpoint_validates_overlapping_shifts(
         self, prepared_ReportViewSet_view, overlapping_shifts
@@ -866,6 +1182,80 @@ class TestReportApiEndpoint:
         assert aggregated_shift_content["29.01.2019"]["notes"] == "1, 5"
 
 
+class TestConditionalListRequests:
+    """
+    The list endpoints of Shifts, Reports and Contracts answer requests with a matching
+    If-None-Match header with 304 based on a version stamp of the listed objects.
+    """
+
+    @pytest.mark.django_db
+    @pytest.mark.parametrize(
+        "url_name, args",
+        [("api:shifts-list", []), ("api:reports-list", []), ("api:contracts-list", [])],
+    )
+    def test_not_modified(self, client, user_object_jwt, shift_object, url_name, args):
+        client.credentials(HTTP_AUTHORIZATION="Bearer {}".format(user_object_jwt))
+        response = client.get(path=reverse(url_name, args=args))
+        assert response.status_code == 200
+        assert "Authorization" in response["Vary"]
+
+        with CaptureQueriesContext(connection) as context:
+            not_modified = client.get(
+                path=reverse(url_name, args=args),
+                HTTP_IF_NONE_MATCH=response["ETag"],
+            )
+        assert not_modified.status_code == 304
+        assert not not_modified.content
+        version_queries = [
+            query
+            for query in context.captured_queries
+            if "COUNT" in query["sql"] and "MAX" in query["sql"]
+        ]
+        assert len(version_queries) == 1
+
+    @pytest.mark.django_db
+    def test_list_month_year_not_modified(self, client, user_object_jwt, shift_object):
+        client.credentials(HTTP_AUTHORIZATION="Bearer {}".format(user_object_jwt))
+        path = reverse(
+            "api:list-shifts",
+            args=[shift_object.started.month, shift_object.started.year],
+        )
+        response = client.get(path=path)
+        assert len(response.json()) == 1
+
+        not_modified = client.get(path=path, HTTP_IF_NONE_MATCH=response["ETag"])
+        assert not_modified.status_code == 304
+
+    @pytest.mark.django_db
+    def test_shift_change_modifies_all_lists(
+        self, client, user_object_jwt, shift_object
+    ):
+        client.credentials(HTTP_AUTHORIZATION="Bearer {}".format(user_object_jwt))
+        etags = {
+            url_name: client.get(path=reverse(url_name))["ETag"]
+            # The contracts only change with last_used, which is debounced.
+            for url_name in ("api:shifts-list", "api:reports-list")
+        }
+
+        shift_object.stopped += timedelta(hours=1)
+        shift_object.save()
+
+        for url_name, etag in etags.items():
+            response = client.get(path=reverse(url_name), HTTP_IF_NONE_MATCH=etag)
+            assert response.status_code == 200, url_name
+
+    @pytest.mark.django_db
+    def test_deletion_modifies_list(self, client, user_object_jwt, shift_object):
+        client.credentials(HTTP_AUTHORIZATION="Bearer {}".format(user_object_jwt))
+        etag = client.get(path=reverse("api:shifts-list"))["ETag"]
+
+        Shift.objects.filter(pk=shift_object.pk).delete()
+
+        response = client.get(path=reverse("api:shifts-list"), HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response.json() == []
+
+
 class TestDjoserCustomizing:
     @pytest.mark.django_db
     def test_delete_user_custom_serializer(self, user_object, user_object_jwt, client):
@@ -0,0 +1,331 @@
+"""
+Clock - Master your timesheets
+Copyright (C) 2023  Johann Wolfgang Goethe-Universität Frankfurt am Main
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU Affero General Public License as published by the Free Software Foundation, either version 3 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
+"""
+import datetime
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from requests.adapters import HTTPAdapter
+from rest_framework.exceptions import APIException
+from urllib3.util.retry import Retry
+
+from api.metrics import EXTERNAL_CALL_DURATION
+from api.models import ExportSnapshot, LockRequest, Report, Shift
+
+LOGGER = logging.getLogger("time_vault")
+
+
+class TimeVaultUnavailable(APIException):
+    """
+    time-vault could not be reached, did not answer in time or the circuit breaker is open.
+    """
+
+    status_code = 503
+    default_detail = _("The time-vault service is currently unavailable.")
+    default_code = "time_vault_unavailable"
+
+
+class CircuitBreaker:
+    """
+    Stop calling a failing service for `reset_timeout` seconds after `failure_threshold`
+    consecutive failures. Afterwards a single trial call is let through (half-open), which
+    closes the breaker on success and opens it again on failure.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow_request(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            # Half-open: let this request through, the others wait for its outcome.
+            self.opened_at = time.monotonic()
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class TimeVaultClient:
+    """
+    Client for the time-vault API sharing one pooled session per process.
+
+    Every request is bounded by a connect and read timeout. Connection errors are retried
+    with exponential backoff, server errors only for idempotent GET requests. Failing
+    requests are counted by a circuit breaker, which rejects further requests right away
+    while time-vault is down. All failures raise TimeVaultUnavailable (503).
+    """
+
+    def __init__(
+        self,
+        base_url=None,
+        api_key=None,
+        timeout=None,
+        retries=None,
+        backoff_factor=None,
+        breaker=None,
+    ):
+        self.base_url = (base_url or settings.TIME_VAULT_URL).rstrip("/")
+        self.api_key = api_key if api_key is not None else settings.TIME_VAULT_API_KEY
+        self.timeout = timeout or (
+            settings.TIME_VAULT_CONNECT_TIMEOUT,
+            settings.TIME_VAULT_READ_TIMEOUT,
+        )
+        self.breaker = breaker or CircuitBreaker(
+            settings.TIME_VAULT_BREAKER_THRESHOLD,
+            settings.TIME_VAULT_BREAKER_RESET_SECONDS,
+        )
+        retries = settings.TIME_VAULT_RETRIES if retries is None else retries
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=(
+                settings.TIME_VAULT_BACKOFF_FACTOR
+                if backoff_factor is None
+                else backoff_factor
+            ),
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"GET"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_maxsize=settings.TIME_VAULT_POOL_SIZE, max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"X-API-KEY": self.api_key})
+
+    def request(self, method, path, **kwargs):
+        """
+        Send a request to time-vault.
+        :param method:
+        :param path: relative to TIME_VAULT_URL
+        :param kwargs: passed on to requests
+        :return: Response, also for 4xx status codes
+        """
+        if not self.breaker.allow_request():
+            raise TimeVaultUnavailable()
+
+        try:
+            with EXTERNAL_CALL_DURATION.labels(service="time_vault").time():
+                response = self.session.request(
+                    method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs
+                )
+        except requests.RequestException as error:
+            LOGGER.warning(f"time-vault {method} {path} failed: {error}")
+            self.breaker.record_failure()
+            raise TimeVaultUnavailable()
+
+        if response.status_code >= 500:
+            LOGGER.warning(
+                f"time-vault {method} {path} returned {response.status_code}."
+            )
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def post_report(self, payload):
+        return self.request("POST", "/reports/", json=payload)
+
+    def retrieve_reports(self, month, year, references):
+        return self.request(
+            "GET", f"/retrieve/{month}/{year}", params={"references": references}
+        )
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_time_vault_client():
+    """
+    Provide the client shared by all threads of the process.
+    :return: TimeVaultClient
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = TimeVaultClient()
+        return _client
+
+
+def reset_time_vault_client():
+    """
+    Drop the shared client, e.g. after the settings changed in tests.
+    """
+    global _client
+    with _client_lock:
+        _client = None
+
+
+def get_retry_delay(attempts):
+    """
+    Exponential backoff for failed deliveries of LockRequests.
+    :param attempts:
+    :return: timedelta
+    """
+    return datetime.timedelta(
+        seconds=min(
+            settings.LOCK_REQUEST_RETRY_DELAY_SECONDS * 2 ** (attempts - 1),
+            settings.LOCK_REQUEST_MAX_RETRY_DELAY_SECONDS,
+        )
+    )
+
+
+def deliver_lock_request(lock_request, client):
+    """
+    Send the report of a claimed LockRequest to time-vault and lock the Shifts of the
+    month if it was accepted.
+
+    The report is sent outside of a transaction, the outcome is recorded in a
+    transaction afterwards. Unavailability and server errors are retried later until
+    LOCK_REQUEST_MAX_ATTEMPTS is reached, other rejections by time-vault fail the
+    LockRequest right away.
+    :param lock_request:
+    :param client:
+    :return:
+    """
+    lock_request.attempts += 1
+    try:
+        response = client.post_report(lock_request.payload)
+    except TimeVaultUnavailable as error:
+        status_code, error_message = 503, str(error.detail)
+    else:
+        status_code, error_message = response.status_code, response.text
+
+    with transaction.atomic():
+        if status_code == 201:
+            lock_request.status = LockRequest.DELIVERED
+            lock_request.delivered_at = timezone.now()
+            lock_request.last_error = ""
+            Shift.objects.filter(
+                contract=lock_request.contract,
+                started__month=lock_request.month_year.month,
+                started__year=lock_request.month_year.year,
+            ).update(locked=True, modified_at=timezone.now())
+            create_export_snapshot(lock_request)
+        elif status_code >= 500 and (
+            lock_request.attempts < settings.LOCK_REQUEST_MAX_ATTEMPTS
+        ):
+            lock_request.last_error = error_message
+            lock_request.next_attempt_at = timezone.now() + get_retry_delay(
+                lock_request.attempts
+            )
+        else:
+            LOGGER.error(
+                f"Locking {lock_request.month_year} of contract {lock_request.contract_id} "
+                f"failed with {status_code}: {error_message}"
+            )
+            lock_request.status = LockRequest.FAILED
+            lock_request.last_error = error_message
+        lock_request.save()
+
+
+def create_export_snapshot(lock_request):
+    """
+    Freeze the export content of a month which was just locked. The content is
+    aggregated from the Shifts locked in the same transaction, so later exports show
+    exactly the locked data. The Shifts could not change while the LockRequest was
+    pending, so it matches the payload time-vault accepted.
+    :param lock_request: delivered LockRequest
+    :return:
+    """
+    # api.views imports this module through the Celery tasks.
+    from api.views import ReportViewSet
+
+    report = Report.objects.filter(
+        contract=lock_request.contract, month_year=lock_request.month_year
+    ).first()
+    if report is None:
+        return
+    # The month was validated when the lock was requested.
+    content = ReportViewSet().aggregate_export_content(
+        report, with_calendar_rows=False, validate=False
+    )
+    ExportSnapshot.objects.update_or_create(
+        report=report, defaults={"content": content, "pdf": None}
+    )
+
+
+def claim_lock_requests(batch_size):
+    """
+    Claim a batch of the due pending LockRequests for delivery.
+
+    The entries are selected with SKIP LOCKED and their next attempt is moved
+    LOCK_REQUEST_CLAIM_SECONDS ahead, so other workers skip them once the short
+    claiming transaction is committed. No row lock is held while the reports are sent.
+    :param batch_size:
+    :return: List of LockRequests
+    """
+    with transaction.atomic():
+        batch = list(
+            LockRequest.objects.select_for_update(skip_locked=True)
+            .filter(status=LockRequest.PENDING, next_attempt_at__lte=timezone.now())
+            .select_related("contract")
+            .order_by("next_attempt_at")[:batch_size]
+        )
+        LockRequest.objects.filter(pk__in=[entry.pk for entry in batch]).update(
+            next_attempt_at=timezone.now()
+            + datetime.timedelta(seconds=settings.LOCK_REQUEST_CLAIM_SECONDS)
+        )
+    return batch
+
+
+def deliver_lock_requests(batch_size=None):
+    """
+    Deliver the due pending LockRequests in batches.
+
+    Every batch is claimed first (see claim_lock_requests), so several workers can
+    deliver concurrently without sending an entry twice. Delivery is at-least-once: if
+    the worker dies after time-vault accepted a report, the claim expires and the
+    report is sent again.
+    :param batch_size:
+    :return: Number of processed LockRequests
+    """
+    batch_size = batch_size or settings.LOCK_REQUEST_BATCH_SIZE
+    client = get_time_vault_client()
+    processed = 0
+    while True:
+        batch = claim_lock_requests(batch_size)
+        for lock_request in batch:
+            deliver_lock_request(lock_request, client)
+        processed += len(batch)
+        if len(batch) < batch_size:
+            return processed
@@ -20,6 +20,7 @@ from api.views import (
     ClockedInShiftViewSet,
     ContractViewSet,
     GDPRExportView,
+    LockRequestViewSet,
     ReportViewSet,
     ShiftViewSet,
     index,
@@ -37,6 +38,7 @@ router.register(r"contracts", ContractViewSet, basename="contracts")
 router.register(r"shifts", ShiftViewSet, basename="shifts")
 router.register(r"clockedinshifts", ClockedInShiftViewSet, basename="clockedinshifts")
 router.register(r"reports", ReportViewSet, basename="reports")
+router.register(r"lock-requests", LockRequestViewSet, basename="lock-requests")
 
 list_month_year_shifts = ShiftViewSet.as_view({"get": "list_month_year"})
 lock_shifts = ContractViewSet.as_view({"post": "lock_shifts"})
@@ -14,27 +14,134 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
 """
 import datetime
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import date
 
 from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.db import transaction
 from django.db.models import (
     Case,
+    DateField,
     DurationField,
     ExpressionWrapper,
     F,
     Max,
     Min,
+    Q,
     Sum,
     Value,
     When,
     Window,
 )
-from django.db.models.functions import Trunc
-from django.db.models.signals import post_delete, post_save
+from django.db.models.functions import Trunc, TruncMonth
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.utils import timezone
 from holidays.countries import Germany
 from more_itertools import pairwise
 
-from api.models import Contract, Report, Shift
+from api.caching import SUPERVISOR_REPORTS_NAMESPACE, invalidate_namespace
+from api.instrumentation import timed_section
+from api.metrics import UPDATE_REPORTS_DURATION
+from api.models import (
+    Contract,
+    ExportSnapshot,
+    LockRequest,
+    Report,
+    Shift,
+    ShiftTombstone,
+)
+
+_suspended_report_signals = ContextVar("suspended_report_signals", default=None)
+
+
+class SuspendedReportSignals:
+    """
+    Collects the work of the suspended receivers, see suspend_report_signals.
+    """
+
+    def __init__(self, recompute=True):
+        self.recompute = recompute
+        self.report_updates = {}
+        self.created_contracts = set()
+        self.used_contracts = set()
+
+    def schedule_report_update(self, contract_id, month_year):
+        scheduled = self.report_updates.get(contract_id)
+        if scheduled is None or month_year < scheduled:
+            self.report_updates[contract_id] = month_year
+
+    def run(self):
+        """
+        Run the collected work once for every affected Contract which still exists.
+        """
+        contract_ids = (
+            set(self.report_updates) | self.created_contracts | self.used_contracts
+        )
+        if not contract_ids:
+            return
+        contracts = Contract.objects.in_bulk(contract_ids)
+        with timed_section("update_reports", UPDATE_REPORTS_DURATION):
+            for contract_id in self.created_contracts & contracts.keys():
+                # Creating the Reports already updates all of them.
+                create_reports_until_current_month(contracts[contract_id])
+            for contract_id, month_year in self.report_updates.items():
+                if (
+                    contract_id in contracts
+                    and contract_id not in self.created_contracts
+                ):
+                    update_reports(contracts[contract_id], month_year)
+        touch_last_used(self.used_contracts & contracts.keys())
+
+
+@contextmanager
+def suspend_report_signals(recompute=True):
+    """
+    Suspend the receivers updating Reports and Contract.last_used after a Shift is
+    saved or deleted and creating the Reports of a new Contract.
+
+    The affected Contracts are collected and, when the block exits without error, their
+    Reports are created / recomputed and last_used is set once per Contract instead of
+    once per row. Nested blocks join the outermost one, a block which recomputes can
+    not be nested in one which does not.
+
+    :param recompute: Pass False if the affected data is discarded anyway, e.g. while
+        deleting Users. Nothing is recomputed and no Shift tombstones are created.
+    """
+    outer = _suspended_report_signals.get()
+    if outer is not None:
+        if recompute and not outer.recompute:
+            raise RuntimeError(
+                "suspend_report_signals() would not recompute the Reports inside of "
+                "suspend_report_signals(recompute=False)."
+            )
+        yield outer
+        return
+
+    suspended = SuspendedReportSignals(recompute=recompute)
+    token = _suspended_report_signals.set(suspended)
+    try:
+        yield suspended
+    finally:
+        _suspended_report_signals.reset(token)
+    if recompute:
+        suspended.run()
+
+
+def schedule_report_update(contract, month_year):
+    """
+    Update the Reports of the contract starting with month_year, or defer the update
+    until the surrounding suspend_report_signals block exits.
+    :param contract:
+    :param month_year:
+    :return:
+    """
+    suspended = _suspended_report_signals.get()
+    if suspended is None:
+        update_reports(contract, month_year)
+    else:
+        suspended.schedule_report_update(contract.pk, month_year)
 
 
 def calculate_break(shifts_queryset, new_shift_started=None, new_shift_stopped=None):
@@ -178,7 +285,7 @@ def create_reports_for_contract(contract, start, stop):
             modified_by=contract.user,
         )
         _month_year += relativedelta(months=1)
-    update_reports(contract, contract.start_date.replace(day=1))
+    schedule_report_update(contract, contract.start_date.replace(day=1))
 
 
 def create_report_after_contract_creation(sender, instance, created, **kwargs):
@@ -197,8 +304,13 @@ def create_report_after_contract_creation(sender, instance, created, **kwargs):
     :param kwargs:
     :return:
     """
-    if created:
-        create_reports_until_current_month(contract=instance)
+    if not created:
+        return None
+    suspended = _suspended_report_signals.get()
+    if suspended is not None:
+        suspended.created_contracts.add(instance.pk)
+        return None
+    create_reports_until_current_month(contract=instance)
 
 
 post_save.connect(
@@ -279,12 +391,207 @@ def update_reports(contract, month_year):
         report.save()
 
 
+def recompute_reports(contracts):
+    """
+    Recompute all Reports of the given contracts from the Shifts, starting with the
+    month the contract started in.
+    :param contracts: Contract queryset or iterable
+    :return:
+    """
+    for contract in contracts:
+        update_reports(contract, contract.start_date.replace(day=1))
+
+
+def get_day_contribution(contract_id, day):
+    """
+    Calculate what the reviewed Shifts of one day add to the Report of their month.
+
+    This is the day-level part of update_reports: the work time of the day minus the
+    missing break time, and the vacation time.
+    :param contract_id:
+    :param day: date in the current time zone
+    :return: tuple (worktime, vacation_time)
+    """
+    shifts = Shift.objects.filter(
+        contract_id=contract_id, started__date=day, was_reviewed=True
+    ).values_list("started", "stopped", "type")
+    if not shifts:
+        return datetime.timedelta(0), datetime.timedelta(0)
+
+    day_worktime = sum(
+        (stopped - started for started, stopped, _ in shifts), datetime.timedelta(0)
+    )
+    breaktime = (
+        max(stopped for _, stopped, _ in shifts)
+        - min(started for started, _, _ in shifts)
+        - day_worktime
+    )
+    worktime, _ = calculate_worktime_breaktime(day_worktime, breaktime)
+    vacation_time = sum(
+        (stopped - started for started, stopped, type in shifts if type == "vn"),
+        datetime.timedelta(0),
+    )
+    return worktime, vacation_time
+
+
+def apply_report_delta(contract_id, month_year, worktime, vacation_time):
+    """
+    Add the given differences to the Report of the month.
+    :param contract_id:
+    :param month_year:
+    :param worktime:
+    :param vacation_time:
+    :return:
+    """
+    Report.objects.filter(contract_id=contract_id, month_year=month_year).update(
+        worktime=F("worktime") + worktime,
+        vacation_time=F("vacation_time") + vacation_time,
+        modified_at=timezone.now(),
+    )
+
+
+def propagate_carryover(contract_id, month_year):
+    """
+    Mark the Reports after the given month as modified.
+
+    Their carryover is derived from the work time of the previous months when it is
+    read, so only their modification time needs to follow a changed month.
+    :param contract_id:
+    :param month_year:
+    :return:
+    """
+    Report.objects.filter(contract_id=contract_id, month_year__gt=month_year).update(
+        modified_at=timezone.now()
+    )
+
+
+def get_shift_day(started):
+    if timezone.is_naive(started):
+        started = timezone.make_aware(started)
+    return timezone.localtime(started).date()
+
+
+def lock_reports(months):
+    """
+    Lock the Reports of the given months until the end of the transaction, so the
+    Shifts of those months are changed one after another. Otherwise two transactions
+    could both read the contribution of a day before the other one commits and apply
+    overlapping differences.
+
+    Outside of a transaction there is nothing to hold the lock, nothing is locked.
+    :param months: iterable of (contract_id, month_year)
+    :return:
+    """
+    condition = Q()
+    for contract_id, month_year in months:
+        condition |= Q(contract_id=contract_id, month_year=month_year)
+    if not condition or not transaction.get_connection().in_atomic_block:
+        return None
+    # A fixed order prevents deadlocks between transactions locking several months.
+    list(
+        Report.objects.select_for_update()
+        .filter(condition)
+        .order_by("contract_id", "month_year")
+        .values_list("pk", flat=True)
+    )
+
+
+def is_lock_pending(*shifts):
+    """
+    Whether the month of one of the given Shift positions is requested to be locked and
+    not yet delivered. The content sent to time-vault is taken when the lock is
+    requested, so the Shifts of the month must not change until the LockRequest is
+    processed.
+
+    The Reports of the months are locked first, ContractViewSet.lock_shifts locks the
+    Report as well. So a Shift change which passed this check is committed before the
+    content of the lock is taken.
+    :param shifts: tuples (contract or its primary key, started)
+    :return: bool
+    """
+    months = {
+        (getattr(contract, "pk", contract), get_shift_day(started).replace(day=1))
+        for contract, started in shifts
+    }
+    lock_reports(months)
+    condition = Q()
+    for contract_id, month_year in months:
+        condition |= Q(contract_id=contract_id, month_year=month_year)
+    return LockRequest.objects.filter(condition, status=LockRequest.PENDING).exists()
+
+
+def capture_report_contributions(sender, instance, **kwargs):
+    """
+    Reciever function:
+    Before saving or deleting a Shift remember the contribution of every day the Shift
+    belonged to or will belong to, so update_report_after_shift_save only needs to
+    apply the difference.
+
+    Planned Shifts (was_reviewd=False) do not contribute to Reports, changes only
+    touching planned Shifts are skipped. While the Report signals are suspended the
+    months of those days are scheduled for a full update instead.
+
+    :param sender:
+    :param instance:
+    :param kwargs:
+    :return:
+    """
+    instance._report_contributions = {}
+    suspended = _suspended_report_signals.get()
+    if suspended is not None and not suspended.recompute:
+        return None
+
+    days = set()
+    if instance.was_reviewed:
+        days.add((instance.contract_id, get_shift_day(instance.started)))
+    # A deleted Shift only leaves the day it is stored on, which is the one of the
+    # instance. A saved one may move away from its stored day.
+    if kwargs.get("signal") is not pre_delete and not instance._state.adding:
+        stored = (
+            Shift.objects.filter(pk=instance.pk, was_reviewed=True)
+            .values_list("contract_id", "started")
+            .first()
+        )
+        if stored is not None:
+            days.add((stored[0], get_shift_day(stored[1])))
+
+    months = {(contract_id, day.replace(day=1)) for contract_id, day in days}
+    if suspended is not None:
+        # The Shift may move to another contract or month, the Reports of the stored
+        # one need to be recomputed as well.
+        for contract_id, month_year in months:
+            suspended.schedule_report_update(contract_id, month_year)
+        return None
+
+    lock_reports(months)
+    instance._report_contributions = {
+        (contract_id, day): get_day_contribution(contract_id, day)
+        for contract_id, day in days
+    }
+
+
+pre_save.connect(
+    capture_report_contributions,
+    sender=Shift,
+    dispatch_uid="capture_report_contributions_save",
+)
+pre_delete.connect(
+    capture_report_contributions,
+    sender=Shift,
+    dispatch_uid="capture_report_contributions_delete",
+)
+
+
 def update_report_after_shift_save(sender, instance, created=False, **kwargs):
     """
     Reciever function:
     After saving a Shift we need to update the corresponding Report to reflect the now
     possibly updated overall work time.
 
+    Only the days captured by capture_report_contributions are recalculated. If their
+    contribution changed the difference is added to the Report of their month and the
+    later Reports are marked as modified (see propagate_carryover).
+
     While updating we skip the whole mechanism if a Shift is planned (was_reviewd=False).
     Furthermore we skip all planned Shifts inside the Update mechanism.
 
@@ -294,13 +601,32 @@ def update_report_after_shift_save(sender, instance, created=False, **kwargs):
     :param kwargs:
     :return:
     """
-    # Only run the Report update mechanism if a Shift which is not planned (was_reviewd=True) is
-    # saved. Planned Shifts are not considered while updating Reports.
-    if not instance.was_reviewed:
+    if _suspended_report_signals.get() is not None:
+        # The months were scheduled by capture_report_contributions.
         return None
 
-    current_month_year = instance.started.date().replace(day=1)
-    update_reports(instance.contract, current_month_year)
+    contributions = getattr(instance, "_report_contributions", {})
+    if not contributions:
+        return None
+    with timed_section("update_reports", UPDATE_REPORTS_DURATION):
+        first_months = {}
+        for (contract_id, day), (worktime, vacation_time) in contributions.items():
+            new_worktime, new_vacation_time = get_day_contribution(contract_id, day)
+            if new_worktime == worktime and new_vacation_time == vacation_time:
+                # E.g. only the note or the tags changed, the Reports stay as they are.
+                continue
+            month_year = day.replace(day=1)
+            apply_report_delta(
+                contract_id,
+                month_year,
+                new_worktime - worktime,
+                new_vacation_time - vacation_time,
+            )
+            if month_year < first_months.get(contract_id, datetime.date.max):
+                first_months[contract_id] = month_year
+        for contract_id, month_year in first_months.items():
+            propagate_carryover(contract_id, month_year)
+    instance._report_contributions = {}
 
 
 post_save.connect(
@@ -326,9 +652,36 @@ def update_last_used_on_contract(sender, instance, created=False, **kwargs):
     :param kwargs:
     :return:
     """
-    contract = instance.contract
-    contract.last_used = datetime.datetime.now()
-    contract.save()
+    suspended = _suspended_report_signals.get()
+    if suspended is not None:
+        suspended.used_contracts.add(instance.contract_id)
+        return None
+    last_used = touch_last_used([instance.contract_id])
+    # Keep an already loaded Contract in sync with the database.
+    if last_used is not None and Shift.contract.is_cached(instance):
+        instance.contract.last_used = last_used
+
+
+def touch_last_used(contract_ids):
+    """
+    Set `last_used` of the given contracts to now, skipping contracts whose value was
+    set less than CONTRACT_LAST_USED_DEBOUNCE_MINUTES ago.
+
+    Only the `last_used` column is written, so neither `modified_at` changes nor the
+    Contract receivers run.
+    :param contract_ids:
+    :return: The new value if any contract was updated, else None
+    """
+    now = timezone.now()
+    recently = now - datetime.timedelta(
+        minutes=settings.CONTRACT_LAST_USED_DEBOUNCE_MINUTES
+    )
+    updated = (
+        Contract.objects.filter(pk__in=contract_ids)
+        .exclude(last_used__gt=recently, last_used__lte=now)
+        .update(last_used=now)
+    )
+    return now if updated else None
 
 
 post_save.connect(
@@ -343,6 +696,56 @@ post_delete.connect(
 )
 
 
+def create_shift_tombstone(sender, instance, **kwargs):
+    """
+    Reciever function:
+    After deleting a Shift record a tombstone, so the deletion can be propagated to
+    clients syncing their Shifts through the changes endpoint.
+    :param sender:
+    :param instance:
+    :param kwargs:
+    :return:
+    """
+    suspended = _suspended_report_signals.get()
+    if suspended is not None and not suspended.recompute:
+        return None
+    ShiftTombstone.objects.create(
+        shift_id=instance.id,
+        user_id=instance.user_id,
+        contract_id=instance.contract_id,
+    )
+
+
+post_delete.connect(
+    create_shift_tombstone,
+    sender=Shift,
+    dispatch_uid="create_shift_tombstone",
+)
+
+
+def unlock_shifts(shifts):
+    """
+    Unlock the given Shifts and drop everything cached under the assumption that their
+    months are locked, including the ExportSnapshots of the months.
+    :param shifts: Shift queryset
+    :return: Number of unlocked Shifts
+    """
+    months = (
+        shifts.order_by()
+        .annotate(month_year=TruncMonth("started", output_field=DateField()))
+        .values_list("contract_id", "month_year")
+        .distinct()
+    )
+    snapshots = Q()
+    for contract_id, month_year in months:
+        snapshots |= Q(report__contract_id=contract_id, report__month_year=month_year)
+    if snapshots:
+        ExportSnapshot.objects.filter(snapshots).delete()
+    unlocked = shifts.update(locked=False, modified_at=timezone.now())
+    invalidate_namespace(SUPERVISOR_REPORTS_NAMESPACE)
+    return unlocked
+
+
 class GermanyHolidays(Germany):
     def _populate(self, year):
         """
@@ -14,15 +14,16 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
 """
 import json
+from calendar import monthrange
 
-import requests
-import weasyprint
 from dateutil.relativedelta import relativedelta
 from django.conf import settings
+from django.db import transaction
 from django.db.models import DurationField, F, Prefetch, Sum
 from django.db.models.functions import Coalesce
 from django.http import HttpResponse
-from django.template.loader import get_template
+from django.urls import reverse
+from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 from drf_yasg.utils import swagger_auto_schema
 from holidays import country_holidays
@@ -30,17 +31,30 @@ from more_itertools import pairwise
 from pytz import datetime, timezone
 from rest_framework import serializers, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, Throttled
 from rest_framework.generics import get_object_or_404
 from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from taggit.models import Tag
 from unidecode import unidecode
 
+from api.caching import VersionStampMixin
 from api.filters import ReportFilterSet, ShiftFilterSet
-from api.models import ClockedInShift, Contract, Report, Shift, User
+from api.models import (
+    ClockedInShift,
+    Contract,
+    ExportSnapshot,
+    LockRequest,
+    Report,
+    Shift,
+    ShiftTombstone,
+    User,
+)
+from api.pdf import RenderSlotUnavailable, get_pdf_renderer, render_slot
 from api.serializers import (
     ClockedInShiftSerializer,
     ContractSerializer,
+    LockRequestSerializer,
     ReportSerializer,
     ShiftSerializer,
     UserSerializer,
@@ -48,10 +62,18 @@ from api.serializers import (
 from api.utilities import (
     calculate_break,
     calculate_worktime_breaktime,
+    is_lock_pending,
     relativedelta_to_string,
+    suspend_report_signals,
     timedelta_to_string,
 )
-from project_celery.tasks import async_5_user_creation
+from project_celery.tasks import async_5_user_creation, deliver_lock_requests
+
+# Cells of a day without Shifts in the Stundenzettel (non-breaking spaces).
+EMPTY_CALENDAR_ROW = dict.fromkeys(
+    ("started", "stopped", "breaktime", "worktime", "absence_type", "notes"), "\xa0"
+)
+
 
 # Proof of Concept that celery works
 
@@ -67,11 +89,13 @@ def index(request):
     return HttpResponse("A Dummy site.")
 
 
-class ContractViewSet(viewsets.ModelViewSet):
+class ContractViewSet(VersionStampMixin, viewsets.ModelViewSet):
     queryset = Contract.objects.all()
     serializer_class = ContractSerializer
 
     name = "contracts"
+    # last_used is written without touching modified_at.
+    version_stamp_fields = ("modified_at", "last_used")
 
     def get_queryset(self):
         """
@@ -86,6 +110,11 @@ class ContractViewSet(viewsets.ModelViewSet):
         queryset = super(ContractViewSet, self).get_queryset()
         return queryset.filter(user__id=user.id).order_by("-last_used")
 
+    def perform_destroy(self, instance):
+        # Deleting the Shifts of the Contract would update its Reports once per Shift.
+        with suspend_report_signals():
+            instance.delete()
+
     @action(detail=True, url_name="shifts", url_path="shifts", methods=["get"])
     def get_shifts_list(self, request, *args, **kwargs):
         """
@@ -101,7 +130,9 @@ class ContractViewSet(viewsets.ModelViewSet):
 
     def lock_shifts(self, request, month=None, year=None, *args, **kwargs):
         instance = self.get_object()
-        report = Report.objects.get(
+        # Changes of the month's Shifts lock the Report too (see is_lock_pending), so
+        # the content is taken after all of them are committed.
+        report = Report.objects.select_for_update().get(
             contract=instance, month_year__month=month, month_year__year=year
         )
 
@@ -114,24 +145,63 @@ class ContractViewSet(viewsets.ModelViewSet):
                 status=400,
             )
 
-        response = requests.post(
-            url=f"{settings.TIME_VAULT_URL}/reports/",
-            json=ReportViewSet().aggregate_export_content(report),
-            headers={"X-API-KEY": settings.TIME_VAULT_API_KEY},
+        lock_request = LockRequest.objects.filter(
+            contract=instance,
+            month_year=report.month_year,
+            status=LockRequest.PENDING,
+        ).first()
+        if lock_request is None:
+            # A locked month is sent again with the content it was locked with.
+            payload = (
+                ExportSnapshot.objects.filter(report=report)
+                .values_list("content", flat=True)
+                .first()
+            )
+            if payload is None:
+                payload = ReportViewSet().aggregate_export_content(
+                    report, with_calendar_rows=False
+                )
+            lock_request = LockRequest.objects.create(
+                user=instance.user,
+                contract=instance,
+                month_year=report.month_year,
+                payload=payload,
+            )
+            transaction.on_commit(deliver_lock_requests.delay)
+
+        return Response(
+            data=LockRequestSerializer(lock_request).data,
+            status=202,
+            headers={
+                "Location": reverse("api:lock-requests-detail", args=[lock_request.id])
+            },
         )
 
-        if response.status_code != 201:
-            return Response(
-                data={"inital": response.content}, status=response.status_code
-            )
-        Shift.objects.filter(
-            contract=instance, started__month=month, started__year=year
-        ).update(locked=True)
 
-        return Response()
+class LockRequestViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Status resource of the requests to lock a month, see ContractViewSet.lock_shifts.
+    """
+
+    queryset = LockRequest.objects.all()
+    serializer_class = LockRequestSerializer
+    name = "lock-requests"
+
+    def get_queryset(self):
+        """
+        Customized method to only retrieve Objects owned by the User issueing the request.
+        :return:
+        """
+        user = self.request.user
+        if self.request.user.is_superuser and self.request.headers.get(
+            "checkoutuser", False
+        ):
+            user = User.objects.get(id=self.request.headers["checkoutuser"])
+        queryset = super(LockRequestViewSet, self).get_queryset()
+        return queryset.filter(user__id=user.id).order_by("-created_at")
 
 
-class ShiftViewSet(viewsets.ModelViewSet):
+class ShiftViewSet(VersionStampMixin, viewsets.ModelViewSet):
     queryset = Shift.objects.all()
     serializer_class = ShiftSerializer
     filterset_class = ShiftFilterSet
@@ -152,6 +222,13 @@ class ShiftViewSet(viewsets.ModelViewSet):
             "tags"
         )  # Prefetch related tags
 
+    def perform_destroy(self, instance):
+        if is_lock_pending((instance.contract_id, instance.started)):
+            raise PermissionDenied(
+                _("A Shift cannot be deleted while the month is being locked.")
+            )
+        instance.delete()
+
     def list_month_year(self, request, month=None, year=None, *args, **kwargs):
         """
         Custom endpoint which retrieves all shifts corresponding to the provided <month> and <year> url params.
@@ -163,8 +240,69 @@ class ShiftViewSet(viewsets.ModelViewSet):
         :return:
         """
         queryset = self.get_queryset().filter(started__month=month, started__year=year)
+        return self.conditional_response(
+            queryset,
+            lambda: Response(self.get_serializer(queryset, many=True).data),
+        )
+
+    @action(detail=False, url_name="changes", url_path="changes")
+    def changes(self, request, *args, **kwargs):
+        """
+        Custom endpoint for the delta sync of Shifts.
+
+        Returns all Shifts created or modified and the ids of all Shifts deleted after the
+        `since` token, together with the token for the next sync. Without a token, or if
+        the token is older than the tombstone retention, all Shifts are returned and
+        `reset` is set, so the client has to replace its local store.
+        :param request:
+        :param args:
+        :param kwargs:
+        :return:
+        """
+        user = self.request.user
+        if self.request.user.is_superuser and self.request.headers.get(
+            "checkoutuser", False
+        ):
+            user = User.objects.get(id=self.request.headers["checkoutuser"])
+        token = now()
+        since = self.parse_sync_token(request.query_params.get("since"))
+        queryset = self.get_queryset()
+        reset = since is None or since < token - datetime.timedelta(
+            days=settings.SHIFT_TOMBSTONE_RETENTION_DAYS
+        )
+
+        deleted = []
+        if not reset:
+            since -= datetime.timedelta(seconds=settings.SHIFT_SYNC_GRACE_SECONDS)
+            queryset = queryset.filter(modified_at__gt=since)
+            deleted = ShiftTombstone.objects.filter(
+                user_id=user.id, deleted_at__gt=since
+            ).values_list("shift_id", flat=True)
+
         serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return Response(
+            {
+                "token": str(int(token.timestamp() * 1_000_000)),
+                "reset": reset,
+                "changed": serializer.data,
+                "deleted": list(deleted),
+            }
+        )
+
+    def parse_sync_token(self, token):
+        """
+        Convert a sync token (microseconds since the epoch) into a datetime.
+        :param token:
+        :return: datetime or None if no token was provided
+        """
+        if token is None:
+            return None
+        try:
+            return datetime.datetime.fromtimestamp(
+                int(token) / 1_000_000, tz=datetime.timezone.utc
+            )
+        except (ValueError, OverflowError, OSError):
+            raise serializers.ValidationError({"since": _("Invalid sync token.")})
 
 
 class ClockedInShiftViewSet(viewsets.ModelViewSet):
@@ -192,11 +330,13 @@ class ClockedInShiftViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class ReportViewSet(viewsets.ReadOnlyModelViewSet):
+class ReportViewSet(VersionStampMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Report.objects.all()
     serializer_class = ReportSerializer
     filterset_class = ReportFilterSet
     name = "reports"
+    # The debit worktime and the carryover of a Report depend on its Contract.
+    version_stamp_fields = ("modified_at", "contract__modified_at")
 
     def get_queryset(self):
         """
@@ -248,10 +388,19 @@ class ReportViewSet(viewsets.ReadOnlyModelViewSet):
         :return:
         """
         report = self.get_object()
-        aggregated_content = self.aggregate_export_content(report_object=report)
-        pdf = self.compile_pdf(
-            template_name="api/stundenzettel.html", content_dict=aggregated_content
-        )
+        try:
+            snapshot = report.export_snapshot
+        except ExportSnapshot.DoesNotExist:
+            snapshot = None
+        if snapshot is None:
+            aggregated_content = self.aggregate_export_content(report_object=report)
+            pdf = self.compile_pdf(
+                template_name="api/stundenzettel.html",
+                content_dict=aggregated_content,
+            )
+        else:
+            aggregated_content = snapshot.content
+            pdf = self.get_snapshot_pdf(snapshot)
         response = HttpResponse(pdf, content_type="application/pdf")
         response[
             "Content-Disposition"
@@ -261,26 +410,46 @@ class ReportViewSet(viewsets.ReadOnlyModelViewSet):
         )
         return response
 
+    def get_snapshot_pdf(self, snapshot):
+        """
+        Provide the PDF of a locked month, it is rendered once and stored with the
+        ExportSnapshot.
+        :param snapshot:
+        :return:
+        """
+        if snapshot.pdf is None:
+            content = dict(snapshot.content)
+            content["calendar_rows"] = self.aggregate_calendar_rows(
+                snapshot.report.month_year, content["days_content"]
+            )
+            snapshot.pdf = self.compile_pdf(
+                template_name="api/stundenzettel.html", content_dict=content
+            )
+            snapshot.save(update_fields=["pdf"])
+        return bytes(snapshot.pdf)
+
     def compile_pdf(self, template_name, content_dict):
         """
-        Compile a PDF given a Django HTML-Tmeplate name as string, a content dictionary and possible options.
+        Compile a PDF given a Django HTML-Tmeplate name as string and a content dictionary.
+        The backend is configured with the PDF_RENDERER setting, see api.pdf.
+        If all render slots are busy the client is asked to retry later (429).
         :param template_name:
         :param content_dict:
         :return:
         """
-        template = get_template(template_name)
-        html = template.render(content_dict)
-        # css_tailwind = finders.find("api/css/tailwind.out.css")
-        # picture = finders.find("api/GU_Logo_blau_weiß_RGB.png")
-        pdf = weasyprint.HTML(
-            string=html, base_url=self.request.build_absolute_uri()
-        ).write_pdf(
-            # stylesheets=[css_tailwind],
-            # attachments=[picture],
-            presentational_hints=True,
-            optimize_size=("fonts", "images"),
-        )
-        return pdf
+        renderer = get_pdf_renderer()
+        try:
+            with render_slot():
+                return renderer.render(
+                    template_name,
+                    content_dict,
+                    base_url=self.request.build_absolute_uri(),
+                )
+        except RenderSlotUnavailable:
+            raise Throttled(
+                wait=settings.PDF_RENDER_RETRY_AFTER_SECONDS,
+                detail=str(_("Too many timesheets are being exported right now.")),
+            )
 
     def get_shifts_to_export(self, report_object):
         """
@@ -523,24 +692,51 @@ class ReportViewSet(viewsets.ReadOnlyModelViewSet):
         )
         return content
 
-    def aggregate_export_content(self, report_object):
+    def aggregate_calendar_rows(self, month_year, days_content):
+        """
+        Provide the rows of the Stundenzettel table: one row per day of the month in
+        order, days without Shifts get empty cells.
+        :param month_year:
+        :param days_content: see aggregate_days_content
+        :return: List[Dict]
+        """
+        year, month = month_year.year, month_year.month
+        rows = []
+        for day in range(1, monthrange(year, month)[1] + 1):
+            content = days_content.get(
+                "{:02d}.{:02d}.{}".format(day, month, year), EMPTY_CALENDAR_ROW
+            )
+            rows.append({"date": "{:02d}.{:02d}.".format(day, month), **content})
+        return rows
+
+    def aggregate_export_content(
+        self, report_object, with_calendar_rows=True, validate=True
+    ):
         """
         Method which aggregates a dictionary to fill in the Stundenzettel HTML-Template.
         :param report_object:
+        :param with_calendar_rows: Whether to add the rows of the table (only needed to
+            render the template)
+        :param validate: Whether to check that the month may be exported
         :return:
         """
         content = {}
         shift_queryset = self.get_shifts_to_export(report_object)
 
-        # Check for overlapping shifts
-        self.check_for_overlapping_shifts(shift_queryset)
-        self.check_for_not_locked_shifts(report_object)
+        if validate:
+            # Check for overlapping shifts
+            self.check_for_overlapping_shifts(shift_queryset)
+            self.check_for_not_locked_shifts(report_object)
 
         # Get all dates the user has worked on
         content["days_content"] = self.aggregate_days_content(shift_queryset)
         content["general"] = self.aggregate_general_content(
             report_object, shift_queryset
         )
+        if with_calendar_rows:
+            content["calendar_rows"] = self.aggregate_calendar_rows(
+                report_object.month_year, content["days_content"]
+            )
 
         return content
 
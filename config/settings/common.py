@@ -74,6 +74,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "api.middleware.RequestTimingMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.locale.LocaleMiddleware",
@@ -226,6 +227,69 @@ CELERY_ALWAYS_EAGER = True
 
 TIME_VAULT_URL = env("TIME_VAULT_URL", default="")
 TIME_VAULT_API_KEY = env("TIME_VAULT_API_KEY", default="")
+TIME_VAULT_CONNECT_TIMEOUT = env.float("TIME_VAULT_CONNECT_TIMEOUT", default=3.05)
+TIME_VAULT_READ_TIMEOUT = env.float("TIME_VAULT_READ_TIMEOUT", default=10)
+# Retries of connection errors (all requests) and server errors (GET requests only).
+TIME_VAULT_RETRIES = env.int("TIME_VAULT_RETRIES", default=2)
+TIME_VAULT_BACKOFF_FACTOR = env.float("TIME_VAULT_BACKOFF_FACTOR", default=0.5)
+TIME_VAULT_POOL_SIZE = env.int("TIME_VAULT_POOL_SIZE", default=10)
+# Consecutive failures after which time-vault is not called for the reset period.
+TIME_VAULT_BREAKER_THRESHOLD = env.int("TIME_VAULT_BREAKER_THRESHOLD", default=5)
+TIME_VAULT_BREAKER_RESET_SECONDS = env.int(
+    "TIME_VAULT_BREAKER_RESET_SECONDS", default=30
+)
+# Supervisor reports are requested from time-vault in parallel chunks of references.
+SUPERVISOR_REFERENCES_CHUNK_SIZE = env.int(
+    "SUPERVISOR_REFERENCES_CHUNK_SIZE", default=50
+)
+SUPERVISOR_REPORTS_MAX_WORKERS = env.int("SUPERVISOR_REPORTS_MAX_WORKERS", default=4)
+SUPERVISOR_REPORTS_CACHE_TIMEOUT = env.int(
+    "SUPERVISOR_REPORTS_CACHE_TIMEOUT", default=60
+)
+# Months locked for all references of a chunk no longer change until they are unlocked.
+# Only used with a shared cache (see CACHE_IS_SHARED), as unlocking invalidates them.
+SUPERVISOR_REPORTS_LOCKED_CACHE_TIMEOUT = env.int(
+    "SUPERVISOR_REPORTS_LOCKED_CACHE_TIMEOUT", default=60 * 60 * 24
+)
+# Delivery of the lock requests (outbox) to time-vault.
+LOCK_REQUEST_BATCH_SIZE = env.int("LOCK_REQUEST_BATCH_SIZE", default=20)
+LOCK_REQUEST_MAX_ATTEMPTS = env.int("LOCK_REQUEST_MAX_ATTEMPTS", default=10)
+LOCK_REQUEST_RETRY_DELAY_SECONDS = env.int(
+    "LOCK_REQUEST_RETRY_DELAY_SECONDS", default=30
+)
+LOCK_REQUEST_MAX_RETRY_DELAY_SECONDS = env.int(
+    "LOCK_REQUEST_MAX_RETRY_DELAY_SECONDS", default=3600
+)
+# A claimed batch is due again after this, e.g. if the delivering worker died. It has to
+# exceed the time needed to send a whole batch.
+LOCK_REQUEST_CLAIM_SECONDS = env.int("LOCK_REQUEST_CLAIM_SECONDS", default=600)
+
+# Contract.last_used is only rewritten if it is older than this.
+CONTRACT_LAST_USED_DEBOUNCE_MINUTES = env.int(
+    "CONTRACT_LAST_USED_DEBOUNCE_MINUTES", default=5
+)
+
+# Backend of the Stundenzettel export, "weasyprint" or "native" (requires the
+# native-pdf extra), see api.pdf.
+PDF_RENDERER = env.str("PDF_RENDERER", default="weasyprint")
+# Number of PDFs rendered at the same time across all web processes. Exports which do
+# not get a slot within PDF_RENDER_MAX_WAIT_SECONDS are answered with 429 and a
+# Retry-After of PDF_RENDER_RETRY_AFTER_SECONDS.
+PDF_RENDER_SLOTS = env.int("PDF_RENDER_SLOTS", default=2)
+PDF_RENDER_MAX_WAIT_SECONDS = env.float("PDF_RENDER_MAX_WAIT_SECONDS", default=2.0)
+PDF_RENDER_RETRY_AFTER_SECONDS = env.int("PDF_RENDER_RETRY_AFTER_SECONDS", default=10)
+
+# Unfiltered admin changelists of tables with at least this many rows show the row
+# count estimated by Postgres instead of running COUNT(*).
+ADMIN_ESTIMATED_COUNT_THRESHOLD = env.int(
+    "ADMIN_ESTIMATED_COUNT_THRESHOLD", default=100000
+)
+# Number of objects an admin action running in the background (see api.admin_jobs)
+# processes per transaction.
+ADMIN_JOB_CHUNK_SIZE = env.int("ADMIN_JOB_CHUNK_SIZE", default=200)
+# A running admin job without progress for this long is considered dead and can be
+# retried from the admin.
+ADMIN_JOB_STALE_MINUTES = env.int("ADMIN_JOB_STALE_MINUTES", default=30)
 # Locale
 
 LANGUAGES = [("de", _("German")), ("en", _("English"))]
@@ -259,6 +323,33 @@ LOGGING = {
             "interval": 1,
             "backupCount": 10,
         },
+        "timevaultlogfile": {
+            "level": "DEBUG",
+            "class": "logging.handlers.TimedRotatingFileHandler",
+            "filename": os.path.join(str(LOG_ROOT.path("api_logs")), "time_vault.log"),
+            "formatter": "verbose",
+            "when": "midnight",
+            "interval": 1,
+            "backupCount": 10,
+        },
+        "performancelogfile": {
+            "level": "DEBUG",
+            "class": "logging.handlers.TimedRotatingFileHandler",
+            "filename": os.path.join(str(LOG_ROOT.path("api_logs")), "performance.log"),
+            "formatter": "verbose",
+            "when": "midnight",
+            "interval": 1,
+            "backupCount": 10,
+        },
+        "adminjobslogfile": {
+            "level": "DEBUG",
+            "class": "logging.handlers.TimedRotatingFileHandler",
+            "filename": os.path.join(str(LOG_ROOT.path("api_logs")), "admin_jobs.log"),
+            "formatter": "verbose",
+            "when": "midnight",
+            "interval": 1,
+            "backupCount": 10,
+        },
     },
     "loggers": {
         "deprovisioning": {
@@ -271,5 +362,53 @@ LOGGING = {
             "level": "INFO",
             "propagate": True,
         },
+        "time_vault": {
+            "handlers": ["timevaultlogfile"],
+            "level": "INFO",
+            "propagate": True,
+        },
+        "performance": {
+            "handlers": ["performancelogfile"],
+            "level": "INFO",
+            "propagate": True,
+        },
+        "admin_jobs": {
+            "handlers": ["adminjobslogfile"],
+            "level": "INFO",
+            "propagate": True,
+        },
     },
 }
+
+# CACHES
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+# Whether all web and worker processes share the cache. Otherwise invalidations only
+# reach the current process and long-lived entries would be stale elsewhere.
+CACHE_IS_SHARED = not CACHES["default"]["BACKEND"].endswith(
+    ("LocMemCache", "DummyCache", "FileBasedCache")
+)
+# Lifetime of cached API responses (Messages, FAQs). Invalidation through signals only
+# reaches all processes with a shared cache backend, e.g. CACHE_URL=redis://...
+API_CACHE_TIMEOUT = env.int("API_CACHE_TIMEOUT", default=300)
+
+# SHIFT SYNC
+# Tombstones of deleted Shifts are kept this long, older sync tokens require a full resync.
+SHIFT_TOMBSTONE_RETENTION_DAYS = env.int("SHIFT_TOMBSTONE_RETENTION_DAYS", default=30)
+# Changes are returned with an overlap to the token, to include Shifts of transactions
+# which committed after the token was issued.
+SHIFT_SYNC_GRACE_SECONDS = env.int("SHIFT_SYNC_GRACE_SECONDS", default=60)
+
+# REQUEST TIMING
+# Fraction of requests which are fully instrumented (query count, DB time, Server-Timing header).
+REQUEST_TIMING_SAMPLE_RATE = env.float("REQUEST_TIMING_SAMPLE_RATE", default=0.1)
+# Requests taking longer are always logged as warning to the performance log.
+REQUEST_TIMING_SLOW_THRESHOLD_MS = env.int(
+    "REQUEST_TIMING_SLOW_THRESHOLD_MS", default=1000
+)
+
+# METRICS
+# Bearer token Prometheus has to send to scrape /metrics, the endpoint is closed if unset.
+METRICS_TOKEN = env.str("METRICS_TOKEN", default="")
+# Port on which the Celery worker exposes the metrics of its pool processes, the worker
+# metrics are not part of /metrics of the web processes. Disabled if unset.
+CELERY_METRICS_PORT = env.int("CELERY_METRICS_PORT", default=None)
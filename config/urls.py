@@ -19,6 +19,8 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from api.metrics import metrics_view
+
 urlpatterns = [
     path("", include("api.urls"), name="api"),
     path("", include("api-docs.api_docs"), name="api_docs"),
@@ -27,6 +29,7 @@ urlpatterns = [
     path("", include("faq.urls"), name="faq-app"),
     path("supervisor/", include("supervisor_api.urls"), name="supervisor_api-app"),
     path("admin/", admin.site.urls),
+    path("metrics", metrics_view, name="metrics"),
     path("auth/", include("djoser.urls"), name="djoser-auth"),
     path("auth/", include("djoser.urls.jwt")),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
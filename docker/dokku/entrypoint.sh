@@ -1,4 +1,10 @@
 #!/bin/sh
 set -e
 
+# Every process of the container writes its Prometheus metrics to this directory,
+# they are collected by /metrics (web) or on CELERY_METRICS_PORT (worker).
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 exec "$@"
@@ -18,3 +18,6 @@ from django.apps import AppConfig
 
 class FaqConfig(AppConfig):
     name = "faq"
+
+    def ready(self):
+        import faq.signals
@@ -0,0 +1,41 @@
+"""
+Clock - Master your timesheets
+Copyright (C) 2023  Johann Wolfgang Goethe-Universität Frankfurt am Main
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU Affero General Public License as published by the Free Software Foundation, either version 3 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
+"""
+from django.db.models.signals import post_delete, post_save
+
+from api.caching import invalidate_namespace
+
+from .models import Faq, FaqHeading
+
+
+def invalidate_faq_cache(sender, instance, **kwargs):
+    """
+    Reciever function:
+    Invalidate the cached FAQs after a Faq or FaqHeading was saved or deleted.
+    """
+    invalidate_namespace("faq")
+
+
+for model in (Faq, FaqHeading):
+    post_save.connect(
+        invalidate_faq_cache,
+        sender=model,
+        dispatch_uid=f"invalidate_faq_cache_{model.__name__}",
+    )
+    post_delete.connect(
+        invalidate_faq_cache,
+        sender=model,
+        dispatch_uid=f"invalidate_faq_cache_{model.__name__}_delete",
+    )
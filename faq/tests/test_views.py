@@ -0,0 +1,64 @@
+"""
+Clock - Master your timesheets
+Copyright (C) 2023  Johann Wolfgang Goethe-Universität Frankfurt am Main
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU Affero General Public License as published by the Free Software Foundation, either version 3 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
+"""
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+
+from faq.models import Faq, FaqHeading
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def faq_object():
+    heading = FaqHeading.objects.create(
+        de_heading="Allgemein", en_heading="General", prio_level=1
+    )
+    return Faq.objects.create(
+        de_question="Frage",
+        de_answer="Antwort",
+        en_question="Question",
+        en_answer="Answer",
+        faq_heading=heading,
+        prioritization=1,
+    )
+
+
+class TestFaqsCache:
+    @pytest.mark.django_db
+    def test_heading_change_invalidates_cache(self, client, faq_object):
+        response = client.get(reverse("faq:faqs"))
+        assert response.json()[0]["faq_heading"]["en_heading"] == "General"
+
+        faq_object.faq_heading.en_heading = "Changed"
+        faq_object.faq_heading.save()
+
+        response = client.get(reverse("faq:faqs"))
+        assert response.json()[0]["faq_heading"]["en_heading"] == "Changed"
+
+    @pytest.mark.django_db
+    def test_delete_invalidates_cache(self, client, faq_object):
+        response = client.get(reverse("faq:faqs"))
+        assert len(response.json()) == 1
+
+        faq_object.delete()
+
+        assert not client.get(reverse("faq:faqs")).json()
@@ -16,12 +16,14 @@ along with this program.  If not, see <https://github.com/ClockGU/clock-backend/
 from rest_framework.permissions import AllowAny
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
+from api.caching import CachedListMixin
 from faq.models import Faq
 from faq.serializers import FaqSerializer
 
 
-class FaqsViewSet(ReadOnlyModelViewSet):
+class FaqsViewSet(CachedListMixin, ReadOnlyModelViewSet):
     queryset = Faq.objects.all()
     serializer_class = FaqSerializer
     name = "faqs"
+    cache_namespace = "faq"
     permission_classes = [AllowAny]
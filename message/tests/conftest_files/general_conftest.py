@@ -13,11 +13,53 @@ GNU Affero General Public License for more details.
 You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
 """
+from datetime import date
+
 import pytest
+from django.core.cache import cache
+from rest_framework.test import APIClient
 
+from api.models import User
 from message.models import Message
 
 
 @pytest.fixture
 def message_model_class():
     return Message
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """
+    The responses of the message endpoint are cached, start every test with an
+    empty cache.
+    """
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def message_object():
+    return Message.objects.create(
+        type="NO",
+        de_title="Hinweis",
+        de_text="Text",
+        en_title="Notice",
+        en_text="Text",
+        valid_from=date(2023, 1, 1),
+    )
+
+
+@pytest.fixture
+def authenticated_client():
+    user = User.objects.create_user(
+        username="messageuser",
+        email="message@test.com",
+        first_name="Test",
+        last_name="User",
+        password="Test_password",
+    )
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
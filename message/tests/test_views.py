@@ -0,0 +1,83 @@
+"""
+Clock - Master your timesheets
+Copyright (C) 2023  Johann Wolfgang Goethe-Universität Frankfurt am Main
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU Affero General Public License as published by the Free Software Foundation, either version 3 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
+"""
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from freezegun import freeze_time
+
+
+class TestMessageEndpointCache:
+    @pytest.mark.django_db
+    @freeze_time("2023-06-01")
+    def test_list_is_cached(self, authenticated_client, message_object):
+        response = authenticated_client.get(reverse("message:messages-list"))
+        assert response.status_code == 200
+        assert len(response.json()) == 1
+
+        with CaptureQueriesContext(connection) as context:
+            cached_response = authenticated_client.get(reverse("message:messages-list"))
+        assert not context.captured_queries
+        assert cached_response.json() == response.json()
+        assert cached_response["ETag"] == response["ETag"]
+
+    @pytest.mark.django_db
+    @freeze_time("2023-06-01")
+    def test_save_invalidates_cache(self, authenticated_client, message_object):
+        response = authenticated_client.get(reverse("message:messages-list"))
+
+        message_object.en_title = "Changed"
+        message_object.save()
+
+        new_response = authenticated_client.get(reverse("message:messages-list"))
+        assert new_response.json()[0]["en_title"] == "Changed"
+        assert new_response["ETag"] != response["ETag"]
+
+    @pytest.mark.django_db
+    def test_cache_is_keyed_by_date(self, authenticated_client, message_object):
+        message_object.valid_to = message_object.valid_from
+        message_object.save()
+
+        with freeze_time(message_object.valid_from):
+            assert (
+                len(authenticated_client.get(reverse("message:messages-list")).json())
+                == 1
+            )
+        with freeze_time("2023-01-02"):
+            assert not authenticated_client.get(reverse("message:messages-list")).json()
+
+    @pytest.mark.django_db
+    @freeze_time("2023-06-01")
+    def test_revalidation_with_etag(self, authenticated_client, message_object):
+        response = authenticated_client.get(reverse("message:messages-list"))
+
+        not_modified = authenticated_client.get(
+            reverse("message:messages-list"), HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        assert not_modified.status_code == 304
+        assert not not_modified.content
+
+    @pytest.mark.django_db
+    @freeze_time("2023-06-01")
+    def test_no_revalidation_by_date(self, authenticated_client, message_object):
+        response = authenticated_client.get(reverse("message:messages-list"))
+        assert "Last-Modified" not in response
+
+        modified = authenticated_client.get(
+            reverse("message:messages-list"),
+            HTTP_IF_MODIFIED_SINCE="Thu, 01 Jun 2023 00:00:00 GMT",
+        )
+        assert modified.status_code == 200
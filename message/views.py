@@ -18,11 +18,13 @@ from datetime import date
 from django.db.models import Q
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
+from api.caching import CachedListMixin
+
 from .models import Message
 from .serializers import MessageSerializer
 
 
-class MessageEndpoint(ReadOnlyModelViewSet):
+class MessageEndpoint(CachedListMixin, ReadOnlyModelViewSet):
     """
     Provide database table of currently valid messages.
     """
@@ -30,6 +32,11 @@ class MessageEndpoint(ReadOnlyModelViewSet):
     queryset = Message.objects.all()
     serializer_class = MessageSerializer
     name = "message"
+    cache_namespace = "message"
+
+    def get_cache_key_parts(self):
+        # The valid messages change with the date.
+        return super(MessageEndpoint, self).get_cache_key_parts() + [date.today()]
 
     def get_queryset(self):
         qs = super(MessageEndpoint, self).get_queryset()
@@ -19,6 +19,13 @@ import os
 
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import task_postrun, task_prerun, worker_ready
+
+from api.metrics import (
+    celery_task_postrun,
+    celery_task_prerun,
+    start_worker_metrics_server,
+)
 
 app = Celery("clock-backend", broker=os.environ.get("RABBITMQ_URL"))
 
@@ -33,9 +40,21 @@ app.conf.beat_schedule = {
         "task": "project_celery.tasks.deprovision_users_monthly",
         "schedule": crontab(0, 0, day_of_month="1"),
     },
+    "deliver_lock_requests": {
+        "task": "project_celery.tasks.deliver_lock_requests",
+        "schedule": crontab(),
+    },
+    "purge_shift_tombstones_daily": {
+        "task": "project_celery.tasks.purge_shift_tombstones_daily",
+        "schedule": crontab(0, 3),
+    },
 }
 app.autodiscover_tasks()
 
+task_prerun.connect(celery_task_prerun, dispatch_uid="celery_task_prerun_metrics")
+task_postrun.connect(celery_task_postrun, dispatch_uid="celery_task_postrun_metrics")
+worker_ready.connect(start_worker_metrics_server, dispatch_uid="worker_metrics_server")
+
 
 # Needed for celery within tests.
 # This was mentioned in : https://stackoverflow.com/questions/46530784/make-django-test-case-database-visible-to-celery
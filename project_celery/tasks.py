@@ -19,11 +19,16 @@ import random
 import time
 
 from dateutil.relativedelta import relativedelta
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.utils import timezone
 from pytz import datetime
 
+from api.admin_jobs import run_admin_job as run_admin_job_in_chunks
 from api.idm.deprovisioning import Deprovisioner
-from api.models import Report, User
+from api.models import Report, ShiftTombstone, User
+from api.time_vault import deliver_lock_requests as deliver_lock_requests_to_time_vault
+from api.utilities import update_reports
 from project_celery.celery import app
 
 
@@ -52,6 +57,8 @@ def create_reports_monthly(self):
     This is a Periodical Task which creates a Report object for every active users
     currently running contracts on the first of the month.
     An active Contract is the current month is between it's start- and end_date.
+    Shifts saved before the Report existed had no Report to add their time to, so a
+    created Report is computed from the Shifts of its month.
     :param self:
     :return:
     """
@@ -60,7 +67,7 @@ def create_reports_monthly(self):
         for contract in user.contracts.filter(
             start_date__lt=date_now, end_date__gte=date_now
         ):
-            Report.objects.get_or_create(
+            _, created = Report.objects.get_or_create(
                 month_year=date_now,
                 contract=contract,
                 user=user,
@@ -71,6 +78,8 @@ def create_reports_monthly(self):
                     "modified_by": user,
                 },
             )
+            if created:
+                update_reports(contract, date_now)
 
 
 @app.task(bind=True, default_retry_delay=10)
@@ -79,3 +88,36 @@ def deprovision_users_monthly(self):
     This is a Periodical task which runs the deprovision.
     """
     Deprovisioner().deprovision()
+
+
+@app.task(bind=True, default_retry_delay=10)
+def purge_shift_tombstones_daily(self):
+    """
+    This is a Periodical task which deletes the tombstones of deleted Shifts, which are
+    older than the retention period. Clients syncing with an older token get a reset.
+    """
+    ShiftTombstone.objects.filter(
+        deleted_at__lt=timezone.now()
+        - datetime.timedelta(days=settings.SHIFT_TOMBSTONE_RETENTION_DAYS)
+    ).delete()
+
+
+@app.task(bind=True, default_retry_delay=10)
+def deliver_lock_requests(self):
+    """
+    Deliver the pending LockRequests to time-vault. This task is triggered after a
+    month was requested to be locked and periodically to retry failed deliveries.
+    """
+    deliver_lock_requests_to_time_vault()
+
+
+@app.task(bind=True, default_retry_delay=10)
+def run_admin_job(self, job_id):
+    """
+    Run a bulk operation started by an admin action, see api.admin_jobs. A failed job
+    is retried and continues after its last finished chunk.
+    """
+    try:
+        run_admin_job_in_chunks(job_id)
+    except Exception as error:
+        raise self.retry(exc=error, max_retries=3)
@@ -18,6 +18,7 @@ from datetime import datetime, timedelta
 
 import django.db
 import pytest
+from pytz import utc
 
 from api.models import Report
 from project_celery.tasks import create_reports_monthly
@@ -128,3 +129,26 @@ class TestCeleryBeats:
             create_reports_monthly()
         except django.db.IntegrityError:
             raise pytest.fail("DID RAISE IntegrityError")
+
+    @pytest.mark.freeze_time("2019-01-31")
+    @pytest.mark.django_db
+    def test_created_report_contains_earlier_shifts(
+        self, user_object, contract_ending_in_february, create_n_shift_objects, freezer
+    ):
+        """
+        Shifts saved before the Report of their month existed are counted once it is
+        created.
+        """
+        create_n_shift_objects(
+            (1,),
+            user_object,
+            contract_ending_in_february,
+            started=datetime(2019, 2, 1, 10, tzinfo=utc),
+            stopped=datetime(2019, 2, 1, 12, tzinfo=utc),
+        )
+        freezer.move_to("2019-02-01")
+        create_reports_monthly()
+
+        assert Report.objects.get(
+            contract=contract_ending_in_february, month_year__month=2
+        ).worktime == timedelta(hours=2)
@@ -0,0 +1,172 @@
+"""
+Clock - Master your timesheets
+Copyright (C) 2023  Johann Wolfgang Goethe-Universität Frankfurt am Main
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU Affero General Public License as published by the Free Software Foundation, either version 3 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
+"""
+import calendar
+import datetime
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from more_itertools import chunked
+
+from api.caching import SUPERVISOR_REPORTS_NAMESPACE, get_generation
+from api.models import Contract
+from api.time_vault import get_time_vault_client
+
+
+class TimeVaultError(Exception):
+    """
+    time-vault answered the request of a chunk of references with an error.
+    """
+
+    def __init__(self, response):
+        super().__init__(response.status_code)
+        self.response = response
+
+
+class UnmergeableResults(ValueError):
+    """
+    The results of two chunks of references contain different values for the same key,
+    which can not be merged without losing data.
+    """
+
+
+def merge_results(first, second):
+    """
+    Merge the JSON results of two chunks of references: lists are concatenated, dicts
+    are merged recursively. Other values are kept if they are equal in both results,
+    otherwise the results cannot be merged without losing data.
+    :param first:
+    :param second:
+    :return:
+    """
+    if isinstance(first, list) and isinstance(second, list):
+        return first + second
+    if isinstance(first, dict) and isinstance(second, dict):
+        merged = dict(first)
+        for key, value in second.items():
+            merged[key] = merge_results(merged[key], value) if key in merged else value
+        return merged
+    if first != second:
+        raise UnmergeableResults(f"Cannot merge {first!r} and {second!r}.")
+    return first
+
+
+def get_locked_references(references, month, year):
+    """
+    Provide the references for which the month is locked, i.e. the contract active in
+    the month has Shifts in it and all of them are locked. Computed with a single query.
+    :param references:
+    :param month:
+    :param year:
+    :return: Set of references
+    """
+    month_start = datetime.date(year, month, 1)
+    month_end = month_start.replace(day=calendar.monthrange(year, month)[1])
+    in_month = Q(shifts__started__year=year, shifts__started__month=month)
+    contracts = (
+        Contract.objects.filter(
+            reference__in=references,
+            start_date__lte=month_end,
+            end_date__gte=month_start,
+        )
+        .annotate(
+            locked_shifts=Count("shifts", filter=in_month & Q(shifts__locked=True)),
+            unlocked_shifts=Count("shifts", filter=in_month & Q(shifts__locked=False)),
+        )
+        .values_list("reference", "locked_shifts", "unlocked_shifts")
+    )
+    locked, unlocked = set(), set()
+    for reference, locked_shifts, unlocked_shifts in contracts:
+        if locked_shifts and not unlocked_shifts:
+            locked.add(str(reference))
+        else:
+            unlocked.add(str(reference))
+    # A reference may belong to several contracts, all of them have to be locked.
+    return locked - unlocked
+
+
+def get_chunk_cache_key(references, month, year, generation):
+    digest = hashlib.sha1(",".join(references).encode("utf-8")).hexdigest()
+    return f"{SUPERVISOR_REPORTS_NAMESPACE}:{generation}:{year}:{month}:{digest}"
+
+
+def request_chunk(references, month, year):
+    response = get_time_vault_client().retrieve_reports(month, year, references)
+    if response.status_code != 200:
+        raise TimeVaultError(response)
+    return response.json()
+
+
+def retrieve_reports(references, month, year):
+    """
+    Retrieve the reports of the supervised references from time-vault.
+
+    The sorted references are split into chunks of SUPERVISOR_REFERENCES_CHUNK_SIZE.
+    The results of the chunks are taken from the cache or requested in parallel and
+    merged afterwards. Requested results are cached for SUPERVISOR_REPORTS_CACHE_TIMEOUT
+    or, if the month is locked for all references of the chunk and therefore can only
+    change by an unlock, for SUPERVISOR_REPORTS_LOCKED_CACHE_TIMEOUT. The latter
+    requires a shared cache, which the unlock invalidates for all processes.
+    :param references:
+    :param month:
+    :param year:
+    :return: JSON result
+    """
+    generation = get_generation(SUPERVISOR_REPORTS_NAMESPACE)
+    chunks = [
+        tuple(chunk)
+        for chunk in chunked(
+            sorted(str(reference) for reference in references),
+            settings.SUPERVISOR_REFERENCES_CHUNK_SIZE,
+        )
+    ] or [()]
+    keys = {
+        chunk: get_chunk_cache_key(chunk, month, year, generation) for chunk in chunks
+    }
+    cached = cache.get_many(keys.values())
+    missing = [chunk for chunk in chunks if keys[chunk] not in cached]
+
+    if missing:
+        # Only the HTTP requests run in threads, the database is queried here.
+        with ThreadPoolExecutor(
+            max_workers=min(len(missing), settings.SUPERVISOR_REPORTS_MAX_WORKERS)
+        ) as executor:
+            results = executor.map(
+                lambda chunk: request_chunk(list(chunk), month, year), missing
+            )
+            requested = dict(zip(missing, results))
+
+        locked_references = set()
+        if settings.CACHE_IS_SHARED:
+            locked_references = get_locked_references(
+                [reference for chunk in missing for reference in chunk], month, year
+            )
+        for chunk, result in requested.items():
+            timeout = (
+                settings.SUPERVISOR_REPORTS_LOCKED_CACHE_TIMEOUT
+                if chunk and locked_references.issuperset(chunk)
+                else settings.SUPERVISOR_REPORTS_CACHE_TIMEOUT
+            )
+            cache.set(keys[chunk], result, timeout)
+            cached[keys[chunk]] = result
+
+    results = [cached[keys[chunk]] for chunk in chunks]
+    merged = results[0]
+    for result in results[1:]:
+        merged = merge_results(merged, result)
+    return merged
@@ -13,36 +13,31 @@ GNU Affero General Public License for more details.
 You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
 """
-from calendar import monthrange
-from datetime import date
+import pytest
+from django.core.cache import cache
 
-from django import template
+from api.tests.conftest import *  # noqa
 
-register = template.Library()
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
 
-@register.filter
-def cut_year(date_str):
-    return date_str[0 : date_str.rindex(".")] + "."
 
-
-@register.simple_tag
-def get_calendar(year, month):
+@pytest.fixture
+def supervisor_client(client, user_object):
     """
-    Provide an iterable which consists of the days of a month as strings.
-    :param year:
-    :param month:
-    :return:
+    This fixture provides a client authenticated as supervisor of the given references.
+    :return: Function
     """
-    for i in range(1, monthrange(year, month)[1] + 1):
-        yield date(year, month, i).strftime("%d.%m.%Y")
 
+    def create(references):
+        user_object.is_supervisor = True
+        user_object.supervised_references = references
+        user_object.save()
+        client.force_authenticate(user=user_object)
+        return client
 
-@register.simple_tag
-def get_dict_value(dictionary, key):
-    """
-    Mimics the .get() method of a Dictionary.
-    :param key:
-    :return:
-    """
-    return dictionary.get(key)
+    return create
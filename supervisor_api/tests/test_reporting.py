@@ -0,0 +1,147 @@
+"""
+Clock - Master your timesheets
+Copyright (C) 2023  Johann Wolfgang Goethe-Universität Frankfurt am Main
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU Affero General Public License as published by the Free Software Foundation, either version 3 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
+"""
+import uuid
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from django.urls import reverse
+
+from api.models import Shift
+from api.utilities import unlock_shifts
+from supervisor_api.reporting import merge_results
+
+
+def requested_references(time_vault_stub):
+    return [
+        parse_qs(urlparse(path).query).get("references", [])
+        for method, path in time_vault_stub.requests
+    ]
+
+
+def test_merge_results():
+    assert merge_results([1], [2]) == [1, 2]
+    assert merge_results(
+        {"a": [1], "b": {"c": [2]}, "d": 1}, {"a": [3], "b": {"c": [4]}, "e": 2}
+    ) == {"a": [1, 3], "b": {"c": [2, 4]}, "d": 1, "e": 2}
+    assert merge_results({"month": 1}, {"month": 1}) == {"month": 1}
+    with pytest.raises(ValueError):
+        merge_results({"total": 1}, {"total": 2})
+    with pytest.raises(ValueError):
+        merge_results([1], {"a": 1})
+
+
+class TestReportingEndpoint:
+    @pytest.mark.django_db
+    def test_references_are_chunked(self, supervisor_client, time_vault_stub, settings):
+        settings.SUPERVISOR_REFERENCES_CHUNK_SIZE = 2
+        time_vault_stub.responses = [(200, [{"report": 1}], 0)]
+        references = sorted(str(uuid.uuid4()) for _ in range(5))
+
+        response = supervisor_client(references).get(reverse("reports", args=[1, 2019]))
+
+        assert response.status_code == 200
+        assert response.json() == [{"report": 1}] * 3
+        assert sorted(requested_references(time_vault_stub)) == [
+            references[0:2],
+            references[2:4],
+            references[4:],
+        ]
+
+    @pytest.mark.django_db
+    def test_results_are_cached(self, supervisor_client, time_vault_stub):
+        time_vault_stub.responses = [(200, [{"report": 1}], 0)]
+        client = supervisor_client([str(uuid.uuid4())])
+        path = reverse("reports", args=[1, 2019])
+
+        client.get(path)
+        response = client.get(path)
+
+        assert response.json() == [{"report": 1}]
+        assert len(time_vault_stub.requests) == 1
+
+    @pytest.mark.django_db
+    def test_locked_month_is_cached_longer(
+        self,
+        supervisor_client,
+        time_vault_stub,
+        contract_object,
+        shift_object,
+        settings,
+    ):
+        settings.SUPERVISOR_REPORTS_CACHE_TIMEOUT = 0
+        settings.CACHE_IS_SHARED = True
+        Shift.objects.filter(pk=shift_object.pk).update(locked=True)
+        client = supervisor_client([str(contract_object.reference)])
+        path = reverse(
+            "reports",
+            args=[shift_object.started.month, shift_object.started.year],
+        )
+
+        client.get(path)
+        client.get(path)
+        assert len(time_vault_stub.requests) == 1
+
+        unlock_shifts(Shift.objects.filter(pk=shift_object.pk))
+        client.get(path)
+        client.get(path)
+        assert len(time_vault_stub.requests) == 3
+
+    @pytest.mark.django_db
+    def test_locked_month_is_not_cached_longer_in_process_local_cache(
+        self,
+        supervisor_client,
+        time_vault_stub,
+        contract_object,
+        shift_object,
+        settings,
+    ):
+        settings.SUPERVISOR_REPORTS_CACHE_TIMEOUT = 0
+        settings.CACHE_IS_SHARED = False
+        Shift.objects.filter(pk=shift_object.pk).update(locked=True)
+        client = supervisor_client([str(contract_object.reference)])
+        path = reverse(
+            "reports",
+            args=[shift_object.started.month, shift_object.started.year],
+        )
+
+        client.get(path)
+        client.get(path)
+        assert len(time_vault_stub.requests) == 2
+
+    @pytest.mark.django_db
+    def test_time_vault_error_is_passed_on(self, supervisor_client, time_vault_stub):
+        time_vault_stub.responses = [(404, {"detail": "not found"}, 0)]
+
+        response = supervisor_client([str(uuid.uuid4())]).get(
+            reverse("reports", args=[1, 2019])
+        )
+
+        assert response.status_code == 404
+        assert response.json() == {"detail": "not found"}
+
+    @pytest.mark.django_db
+    def test_unmergeable_chunks_are_a_bad_gateway(
+        self, supervisor_client, time_vault_stub, settings
+    ):
+        settings.SUPERVISOR_REFERENCES_CHUNK_SIZE = 1
+        time_vault_stub.responses = [(200, {"total": 1}, 0), (200, {"total": 2}, 0)]
+
+        response = supervisor_client([str(uuid.uuid4()) for _ in range(2)]).get(
+            reverse("reports", args=[1, 2019])
+        )
+
+        assert response.status_code == 502
+        assert "could not be combined" in response.json()["detail"]
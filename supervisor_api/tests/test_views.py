@@ -0,0 +1,62 @@
+"""
+Clock - Master your timesheets
+Copyright (C) 2023  Johann Wolfgang Goethe-Universität Frankfurt am Main
+
+This program is free software: you can redistribute it and/or modify it under the terms of the
+GNU Affero General Public License as published by the Free Software Foundation, either version 3 of
+the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://github.com/ClockGU/clock-backend/blob/master/licenses/>.
+"""
+import datetime
+import uuid
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from freezegun import freeze_time
+
+
+class TestCheckReferencesEndpoint:
+    @pytest.mark.django_db
+    @freeze_time("2019-01-15")
+    def test_only_running_contracts_are_kept(
+        self, supervisor_client, create_n_contract_objects, user_object
+    ):
+        running = create_n_contract_objects((2,), user_object)
+        expired = create_n_contract_objects(
+            (1,),
+            user_object,
+            start_date=datetime.date(2018, 1, 1),
+            end_date=datetime.date(2018, 12, 31),
+        )
+        posted = [
+            str(running[1].reference),
+            str(expired[0].reference),
+            "not-a-uuid",
+            str(uuid.uuid4()),
+            str(running[0].reference).upper(),
+        ]
+        client = supervisor_client([])
+
+        with CaptureQueriesContext(connection) as context:
+            response = client.post(
+                reverse("reference-validity"), data=posted, format="json"
+            )
+
+        assert response.status_code == 200
+        assert response.json() == [posted[0], posted[4]]
+        user_object.refresh_from_db()
+        assert user_object.supervised_references == [posted[0], posted[4]]
+        contract_queries = [
+            query
+            for query in context.captured_queries
+            if 'FROM "api_contract"' in query["sql"]
+        ]
+        assert len(contract_queries) == 1
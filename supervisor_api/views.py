@@ -1,11 +1,11 @@
+import uuid
 from datetime import date
 from json import JSONDecodeError
 
-import requests
 from cryptography.fernet import InvalidToken
 from django.conf import settings
 from rest_framework import generics, serializers, views
-from rest_framework.status import HTTP_401_UNAUTHORIZED
+from rest_framework.status import HTTP_401_UNAUTHORIZED, HTTP_502_BAD_GATEWAY
 from rest_framework.views import Response
 
 from api.models import Contract
@@ -14,6 +14,14 @@ from api.serializers import UserSerializer
 
 from .encryption import decrypt_token
 from .models import AuthKey
+from .reporting import TimeVaultError, UnmergeableResults, retrieve_reports
+
+
+def parse_uuid(value):
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
 
 
 class VerifySerializer(serializers.Serializer):
@@ -66,30 +74,46 @@ class ReportingEndpoint(generics.GenericAPIView):
     permission_classes = (IsSupervisorPermission,)
 
     def get(self, request, month=None, year=None):
-        user_query = (
-            f"references={'&references='.join(request.user.supervised_references)}"
-        )
-        response = requests.get(
-            url=f"{settings.TIME_VAULT_URL}/retrieve/{month}/{year}?{user_query}",
-            headers={"X-API-KEY": settings.TIME_VAULT_API_KEY},
-        )
-        return Response(data=response.json())
+        try:
+            data = retrieve_reports(request.user.supervised_references, month, year)
+        except TimeVaultError as error:
+            try:
+                error_data = error.response.json()
+            except ValueError:
+                error_data = {"detail": error.response.text}
+            return Response(data=error_data, status=error.response.status_code)
+        except UnmergeableResults as error:
+            # The references were requested in chunks and time-vault answered with
+            # results which can not be combined into one.
+            return Response(
+                data={
+                    "detail": "The reports of the supervised references could not be "
+                    "combined: {}".format(error)
+                },
+                status=HTTP_502_BAD_GATEWAY,
+            )
+        return Response(data=data)
 
 
 class CheckReferencesEnpoint(generics.GenericAPIView):
     permission_classes = (IsSupervisorPermission,)
 
     def post(self, request):
-        data = request.data
-        for uuid in data[:]:
-            try:
-                contract = Contract.objects.get(
-                    reference=uuid,
-                    start_date__lte=date.today(),
-                    end_date__gte=date.today(),
-                )
-            except Contract.DoesNotExist:
-                data.remove(uuid)
+        """
+        Keep only the posted references which belong to a currently running Contract,
+        checked with a single query. Invalid UUIDs are dropped, the order is kept.
+        """
+        posted = [(value, parse_uuid(value)) for value in request.data]
+        valid_references = set(
+            Contract.objects.filter(
+                reference__in={
+                    reference for _, reference in posted if reference is not None
+                },
+                start_date__lte=date.today(),
+                end_date__gte=date.today(),
+            ).values_list("reference", flat=True)
+        )
+        data = [value for value, reference in posted if reference in valid_references]
         user = request.user
         user.supervised_references = data
         user.save()